@@ -6,12 +6,9 @@ import pickle
 import random
 import re
 import sys
-import time
 from argparse import ArgumentParser
 from collections import deque
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pybullet as p
 import pybullet_data
@@ -19,13 +16,17 @@ import tensorflow as tf
 from icecream import ic
 
 from utils.env_py import *
+from utils.checkpoint_writer import checkpoint_writer
 from utils.experience_replay import Memory, SumTree
+from utils.pb_trace import PHASE_SETUP, pb_tracer
+from utils.profiler import PHASES_DQN, phase_timer
 # from utils.q_algorithm import dqn
 # from utils.rl_dqn import QAgent
 from utils.rl_icm import ICM
 from utils.scene_constants_pb import scene_constants
 from utils.utils_data import data_pack
-from utils.utils_pb import (controlCamera, drawDebugLines)
+from utils.gui_overlay import gui_overlay
+from utils.episode_recorder import episode_recorder
 from utils.a2c_algorithm import a2c
 from utils.a2c_actor_critic_class import Actor
 from utils.a2c_actor_critic_class import Critic
@@ -128,10 +129,38 @@ def get_options():
                         help='Number of threads for parallel simulation.')
     parser.add_argument('--WEIGHT_FILE', type=str, default=None,
                         help='Relative path to the weight file to load. Only works for KERAS.')
+    parser.add_argument('--WEIGHT_QUERY', type=str, default=None,
+                        help='Pick weight file from the checkpoint catalog of WEIGHT_DIR : latest, best, best:<metric>, gs=<global step>. Append @<run> to restrict to a run')
+    parser.add_argument('--WEIGHT_DIR', type=str, default='./a2c-checkpoints-vehicle',
+                        help='Directory searched by WEIGHT_QUERY, including sub-directories')
     parser.add_argument('--DUMP_OPTIONS', action='store_true', default = False,
                         help='Dump options and scene_const files.')
     parser.add_argument('--DRAW', action='store_true', default = False,
                         help='Visualize the first vehicle')
+    parser.add_argument('--ROUTE_LEN', type=int, default=0,
+                        help='Route mode. Each vehicle drives a chain of ROUTE_LEN segments, streamed around the vehicle. 0 uses a single tee. Requires VEH_COUNT == X_COUNT.')
+    parser.add_argument('--ASYNC_SAVE', action='store_true', default = False,
+                        help='Write checkpoints in a background thread')
+    parser.add_argument('--KEEP_LAST', type=int, default=0,
+                        help='Number of latest checkpoints to keep with ASYNC_SAVE. 0 with KEEP_BEST=0 keeps all')
+    parser.add_argument('--KEEP_BEST', type=int, default=0,
+                        help='Number of checkpoints with highest recent success rate to keep with ASYNC_SAVE')
+    parser.add_argument('--PROFILE', action='store_true', default = False,
+                        help='Time each phase of the global step loop. Summary is saved in ./result_data/profile_data')
+    parser.add_argument('--PROFILE_RATE', type=int, default=1000,
+                        help='Number of global steps between profile prints')
+    parser.add_argument('--PB_TRACE', action='store_true', default = False,
+                        help='Count calls and time of each PyBullet API function per phase. Printed every PROFILE_RATE steps')
+    parser.add_argument('--HEADLESS', action='store_true', default = False,
+                        help='Fast start without matplotlib. No figures, model summaries or plot_model PNGs. Reward and loss data are still saved')
+    parser.add_argument('--GUI_RATE', type=int, default=5,
+                        help='Number of global steps between updates of the GUI debug lines. Only vehicles near the camera are drawn')
+    parser.add_argument('--CAMERA_RATE', type=int, default=10,
+                        help='Number of global steps between keyboard polls of the GUI camera')
+    parser.add_argument('--GUI_SLEEP', type=float, default=0.0,
+                        help='Seconds of sleep per global step with the GUI, to slow down the simulation for viewing')
+    parser.add_argument('--RECORD', action='store_true', default = False,
+                        help='Record pose, action, reward and event of every step in ./result_data/episode_data. Episodes can be replayed with replay_episode.py')
     options = parser.parse_args()
 
     # Check Inputs
@@ -141,6 +170,9 @@ def get_options():
     if options.EPS_ANNEAL_STEPS % options.VEH_COUNT != 0:
         raise ValueError('VEH_COUNT must divide EPS_ANNEAL_STEPS')
 
+    if options.HEADLESS == True and (options.enable_GUI == True or options.DRAW == True):
+        raise ValueError('--HEADLESS cannot be used with --enable_GUI or --DRAW')
+
     # Save options
     if not os.path.exists("./checkpoints-vehicle"):
         os.makedirs("./checkpoints-vehicle")
@@ -236,6 +268,11 @@ if __name__ == "__main__":
     ######################################
     # Start Environment
     sim_env = env_py( options, scene_constants() )
+    # PyBullet API tracer. Installed before the start, so that calls of the scene setup are counted
+    api_tracer = pb_tracer( rate = options.PROFILE_RATE )
+    if options.PB_TRACE == True:
+        api_tracer.install()
+
     sim_env.scene_const.clientID, handle_dict = sim_env.start()
 
     # Initial Camera position
@@ -251,10 +288,10 @@ if __name__ == "__main__":
     # Print Infos
     sim_env.printInfo()
 
-    # Draw initial lines
+    # Debug lines & camera of the GUI
+    gui = None
     if options.enable_GUI == True:
-        sensor_handle       = drawDebugLines( options, sim_env.scene_const, handle_dict, createInit = True )
-        collision_handle    = drawDebugLines( options, sim_env.scene_const, handle_dict, createInit = True )
+        gui = gui_overlay( options, sim_env.scene_const, handle_dict, cam_pos, cam_dist, options.GUI_RATE, options.CAMERA_RATE, options.GUI_SLEEP )
 
     # Print Handles
     if options.VERBOSE == True:
@@ -277,7 +314,12 @@ if __name__ == "__main__":
     ###########################        
     # DATA VARIABLES
     ###########################        
-    data_package = data_pack( START_TIME_STR )    
+    data_package = data_pack( START_TIME_STR, running_avg = options.RUNNING_AVG_STEP )    
+
+    # Background writer for checkpoints
+    ckpt_writer = None
+    if options.ASYNC_SAVE == True and options.TESTING == False and options.NO_SAVE == False:
+        ckpt_writer = checkpoint_writer( './a2c-checkpoints-vehicle', START_TIME_STR, options.KEEP_LAST, options.KEEP_BEST )
 
     ###########################        
     # Initialize Variables
@@ -286,24 +328,35 @@ if __name__ == "__main__":
     last_saved_epi      = 0                                                             # variable used for checking when to save
     case_direction      = np.zeros(options.VEH_COUNT)                                   # store tested direction
 
+    # Timer of each phase of the global step loop
+    step_timer          = phase_timer( PHASES_DQN, rate = options.PROFILE_RATE, enable = options.PROFILE, tracer = api_tracer )
+
     # Initialize Scene
     _, _, _ = sim_env.initScene( list(range(0,options.VEH_COUNT)), RANDOMIZE )
 
     # initilize them with initial data
     sim_env.updateObservation( range(0,sim_env.options.VEH_COUNT) )
 
+    # Episode recorder
+    recorder = None
+    if options.RECORD == True:
+        recorder = episode_recorder( options, sim_env.scene_const, './result_data/episode_data/' + START_TIME_STR, RANDOMIZE )
+        recorder.startEpisodes( sim_env, range(0,options.VEH_COUNT) )
+
 
     # FIXME: Temporary data
 
     # temp_data = pickle.load( open( './20200311_Sample_Data/sample_data', 'rb' ) )
     # temp_idx = 0
 
+    api_tracer.lap( PHASE_SETUP )
+
     # Global Step Loop
     while epi_counter <= options.MAX_EPISODE:
-        # GS_START_TIME_STR   = datetime.datetime.now()
-        if options.enable_GUI == True and options.manual == False:
-            cam_pos, cam_dist = controlCamera( cam_pos, cam_dist )  
-            time.sleep(0.01)
+        step_timer.startStep()
+        if gui is not None and options.manual == False:
+            gui.updateCamera()
+        step_timer.lap('other')
 
         global_step += options.VEH_COUNT
 
@@ -317,6 +370,7 @@ if __name__ == "__main__":
         # Get observation stack (which is used in getting the action) 
         _, _, obs_sensor_stack, obs_goal_stack = sim_env.getObservation(old = False)
         # obs_sensor_stack = addNoise(options, sim_env.scene_const, obs_sensor_stack)
+        step_timer.lap('observation')
 
         if options.TESTING == True and options.VERBOSE == True:
             ic(sim_env.sensor_queue, obs_sensor_stack)
@@ -325,6 +379,8 @@ if __name__ == "__main__":
         # if options.DRAW == True:
         #     sim_env.plotVehicle(save=True, predict = 20, network_model = q_algo.agent_train.model_q_all, temp_data = None, temp_idx = None)
 
+        step_timer.lap('other')
+
         # Get optimal action q_algo
         action_feed = {}
         action_feed.clear()
@@ -332,17 +388,21 @@ if __name__ == "__main__":
         action_feed.update({'observation_state': obs_sensor_stack[:,sim_env.scene_const.sensor_count:,:]})
         action_feed.update({'observation_goal_k': obs_goal_stack})
         targetSteer_k, action_stack_k = a2c_algo.getOptimalAction( action_feed )
+        step_timer.lap('action')
 
         # Apply Action
         sim_env.applyAction( targetSteer_k )
+        step_timer.lap('applyAction')
 
         ####
         # Step
         ####
         sim_env.step()
+        step_timer.lap('step')
 
         # Update Observation
         sim_env.updateObservation( range(0,sim_env.options.VEH_COUNT), add_noise = sim_env.options.ADD_NOISE )
+        step_timer.lap('updateObservation')
 
 
         ####
@@ -355,6 +415,9 @@ if __name__ == "__main__":
         # Handle Events & Get Rewards
         ####
         reward_stack, veh_status, epi_done, epi_sucess = sim_env.getRewards( next_dDistance, next_veh_pos, next_gInfo, next_veh_heading)
+        if recorder is not None:
+            recorder.addStep( next_veh_pos, next_veh_heading, action_stack_k, reward_stack, veh_status )
+        step_timer.lap('rewards')
 
         if sim_env.options.VERBOSE == True and sim_env.options.TESTING == True:
             ic('REWARDS:', reward_stack)
@@ -370,12 +433,9 @@ if __name__ == "__main__":
             ic(reward_stack)
 
         # Draw Debug Lines
-        if options.enable_GUI == True:
-            # Draw Lidar
-            sensor_handle = drawDebugLines(options, sim_env.scene_const, handle_dict, next_dDistance, sensor_handle, createInit = False )
-
-            # Draw Collision Range
-            collision_handle = drawDebugLines(options, sim_env.scene_const, handle_dict, np.ones((options.VEH_COUNT,sim_env.scene_const.sensor_count))*(sim_env.scene_const.collision_distance/sim_env.scene_const.sensor_distance), collision_handle, createInit = False, ray_width = 4, rayHitColor = [0,0,0] )
+        if gui is not None:
+            # Lidar & Collision Range
+            gui.updateLines( next_veh_pos, next_dDistance )
 
 
         #######
@@ -417,6 +477,7 @@ if __name__ == "__main__":
         #     next_veh_pos, next_veh_heading, next_state_sensor, next_state_goal     = sim_env.getObservation( old = True )
         #     gen_traj = q_algo.genTrajectory(next_veh_pos, next_veh_heading, next_state_sensor, next_state_goal, max_horizon)
         #     ic('GENERATED TRAJECTORY', gen_traj)
+        step_timer.lap('other')
 
         ###########
         # START LEARNING
@@ -433,6 +494,7 @@ if __name__ == "__main__":
            
             # Save new memory 
             a2c_algo.replay_memory.store(experience)
+        step_timer.lap('replay')
 
         # Start training
         if global_step >= options.MAX_EXPERIENCE and options.TESTING == False:
@@ -468,8 +530,12 @@ if __name__ == "__main__":
         elif global_step < options.MAX_EXPERIENCE:
             # If just running to get memory, do not increment counter
             epi_counter = 0
+        step_timer.lap('train')
 
         handle_dict, sim_env.scene_const, case_direction = sim_env.initScene( reset_veh_list, RANDOMIZE, a2c_algo.course_eps )
+        if recorder is not None:
+            recorder.startEpisodes( sim_env, reset_veh_list )
+        step_timer.lap('initScene')
 
         ###############
         # Miscellaneous
@@ -489,6 +555,8 @@ if __name__ == "__main__":
             # FIXME: case_direction tells the obstacle position. But scene is updated before printing this.
             # print('\tObs. Position   : ' + str(case_direction[v]) )        
             print('\tLast Loss       : ',data_package.avg_loss[-1])
+            print('\tReward (EMA)    : ' + str(data_package.reward_ema.mean))
+            print('\tSuccess (EMA)   : ' + str(data_package.success_rate_ema.mean))
             print('========')
             print('')
 
@@ -504,7 +572,7 @@ if __name__ == "__main__":
         # save progress
         if options.TESTING == False:
             if options.NO_SAVE == False and epi_counter - last_saved_epi >= options.SAVER_RATE:
-                a2c_algo.saveNetworkKeras(START_TIME_STR, epi_counter, global_step)
+                a2c_algo.saveNetworkKeras(START_TIME_STR, epi_counter, global_step, writer = ckpt_writer, metric = data_package.get_success_rate(options.RUNNING_AVG_STEP))
                 print('-----------------------------------------')
                 print("Saving data...") 
                 print('-----------------------------------------')
@@ -517,12 +585,26 @@ if __name__ == "__main__":
                 last_saved_epi = epi_counter
 
 
-        # GS_END_TIME_STR   = datetime.datetime.now()
-        # print('Time : ' + str(GS_END_TIME_STR - GS_START_TIME_STR))
+        step_timer.lap('logging')
+        step_timer.endStep()
 
     # stop the simulation & close connection
     sim_env.end()
 
+    if recorder is not None:
+        recorder.close()
+
+    # Timing of the whole run
+    step_timer.printStats()
+    step_timer.saveSummary( './result_data/profile_data/profile_' + START_TIME_STR + '.json' )
+    api_tracer.uninstall()
+    api_tracer.printStats( api_tracer.total, api_tracer.step_count )
+    api_tracer.saveSummary( './result_data/profile_data/pb_trace_' + START_TIME_STR + '.json' )
+
+    # Wait for the remaining checkpoints
+    if ckpt_writer is not None:
+        ckpt_writer.close()
+
     ######################################################
     # Post Processing
     ######################################################
@@ -540,8 +622,9 @@ if __name__ == "__main__":
     ##############################3
 
     # Plot Reward
-    data_package.plot_reward( options.RUNNING_AVG_STEP )
-    data_package.plot_loss()
+    if options.HEADLESS == False:
+        data_package.plot_reward( options.RUNNING_AVG_STEP )
+        data_package.plot_loss()
 
 
 # END
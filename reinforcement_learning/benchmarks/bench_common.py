@@ -0,0 +1,96 @@
+#####################################
+# bench_common.py
+#
+# This file contains helpers of the benchmark suite : timing loop, options and seeding.
+# Every benchmark returns a dictionary of { name : result }, where result has ops_per_sec, unit and params.
+#####################################
+import math
+import random
+import time
+
+import numpy as np
+
+
+# Run func repeatedly and measure the throughput
+# Input
+#   func       : function without arguments. One call is `ops` operations
+#   min_time   : seconds of each round
+#   rounds     : number of rounds. Median of rounds is reported
+#   ops        : number of operations of a single call, e.g., VEH_COUNT for env steps
+# Output
+#   dictionary of ops_per_sec (median), best_ops_per_sec and calls
+def timeIt( func, min_time = 1.0, rounds = 3, ops = 1 ):
+    # Warm up, e.g., first call of keras functions builds the graph
+    func()
+
+    rates = []
+    calls = 0
+    for _ in range(0, rounds):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            count += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+
+        rates.append( count*ops/elapsed )
+        calls += count
+
+    return { 'ops_per_sec' : float(np.median( rates )), 'best_ops_per_sec' : float(np.max( rates )), 'calls' : calls }
+
+# Result entry
+# Input
+#   timing : output of timeIt
+#   unit   : what an operation is, e.g., 'call', 'env step'
+#   params : dictionary of parameters of the benchmark
+def makeResult( timing, unit, **params ):
+    result = dict( timing )
+    result['unit']   = unit
+    result['params'] = params
+    return result
+
+# Fixed seeds for numpy, random and tensorflow (if imported)
+def setSeed( seed ):
+    np.random.seed( seed )
+    random.seed( seed )
+
+    import sys
+    if 'tensorflow' in sys.modules:
+        sys.modules['tensorflow'].set_random_seed( seed )
+    return
+
+# Options of dqn_bullet.py with defaults, for a headless run
+# Input
+#   veh_count : VEH_COUNT. X_COUNT is chosen so that VEH_COUNT is a multiple of it
+#   overrides : other options
+def getBenchOptions( veh_count, **overrides ):
+    from dqn_bullet import get_parser
+
+    options = get_parser().parse_args( [] )
+    options.VEH_COUNT  = veh_count
+    options.X_COUNT    = math.gcd( veh_count, 8 )
+    options.enable_GUI = False
+    options.DRAW       = False
+    options.manual     = False
+    options.VERBOSE    = False
+    options.NO_SAVE    = True
+    options.ADD_NOISE  = False
+    options.HEADLESS   = True
+
+    for key, value in overrides.items():
+        setattr( options, key, value )
+
+    return options
+
+# Random observation with the layout of env_py.getObservation
+# Output
+#   veh_pos, veh_heading, sensor (VEH_COUNT x sensor_count*2 x FRAME_COUNT), goal (VEH_COUNT x 2 x FRAME_COUNT)
+def getRandomObservation( options, scene_const, veh_count ):
+    sensor  = np.concatenate( ( np.random.random_sample( (veh_count, scene_const.sensor_count, options.FRAME_COUNT) ),
+                                np.random.randint( 0, 2, (veh_count, scene_const.sensor_count, options.FRAME_COUNT) ) ), axis = 1 )
+    goal    = np.random.random_sample( (veh_count, 2, options.FRAME_COUNT) )
+    veh_pos = np.random.random_sample( (veh_count, 2) )
+
+    return veh_pos, np.random.uniform( -0.5, 0.5, veh_count ), sensor, goal
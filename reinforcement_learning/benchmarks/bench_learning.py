@@ -0,0 +1,95 @@
+#####################################
+# bench_learning.py
+#
+# Benchmarks of the learning hot paths
+#   SumTree.add / get_leaf, Memory.sample, dqn.trainOneStep, predictLidar, genTrajectory
+# Replay memory is filled with random experiences of the same layout as dqn_bullet.py. No simulation is started.
+#####################################
+import numpy as np
+
+from benchmarks.bench_common import (getBenchOptions, getRandomObservation,
+                                     makeResult, setSeed, timeIt)
+
+
+# Random experience. (observation, action, reward, next observation, done), same as dqn_bullet.py
+def getRandomExperience( options, scene_const ):
+    _, _, sensor, goal = getRandomObservation( options, scene_const, 2 )
+    return sensor[0], goal[0], np.random.randint( 0, options.ACTION_DIM ), np.random.random_sample(), sensor[1], goal[1], np.random.randint( 0, 2 )
+
+# Replay memory benchmarks. Pure NumPy
+def benchReplay( seed = 1, min_time = 1.0, capacity = 20000, batch_size = 32 ):
+    from utils.experience_replay import Memory, SumTree
+    from utils.scene_constants_pb import scene_constants
+
+    setSeed( seed )
+    options     = getBenchOptions( 1, SEED = seed )
+    scene_const = scene_constants()
+    experience  = getRandomExperience( options, scene_const )
+    results     = {}
+
+    tree = SumTree( capacity )
+    results['SumTree.add'] = makeResult( timeIt( lambda: tree.add( 1.0, experience ), min_time ), 'call', capacity = capacity )
+
+    values = np.random.uniform( 0, tree.total_priority, 4096 )
+    leaf_counter = [0]
+    def getLeaf():
+        tree.get_leaf( values[ leaf_counter[0] % len(values) ] )
+        leaf_counter[0] += 1
+
+    results['SumTree.get_leaf'] = makeResult( timeIt( getLeaf, min_time ), 'call', capacity = capacity )
+
+    for disable_PER in [ True, False ]:
+        memory = Memory( capacity, disable_PER = disable_PER, absolute_error_upperbound = 2000 )
+        for _ in range(0, capacity):
+            memory.store( getRandomExperience( options, scene_const ) )
+
+        name = 'Memory.sample' + ('' if disable_PER == True else '.PER')
+        results[name] = makeResult( timeIt( lambda: memory.sample( batch_size ), min_time ), 'batch', capacity = capacity, BATCH_SIZE = batch_size )
+
+    return results
+
+# Lidar prediction of genTraj_script. Pure NumPy
+def benchPredictLidar( veh_count = 32, seed = 1, min_time = 1.0 ):
+    from utils.genTraj_script import predictLidar
+    from utils.scene_constants_pb import scene_constants
+
+    setSeed( seed )
+    options     = getBenchOptions( veh_count, SEED = seed )
+    scene_const = scene_constants()
+
+    veh_pos, veh_heading, sensor, _ = getRandomObservation( options, scene_const, veh_count )
+    new_pos     = veh_pos + np.random.uniform( -0.5, 0.5, (veh_count, 2) )
+    new_heading = veh_heading + np.random.uniform( -0.1, 0.1, veh_count )
+
+    timing = timeIt( lambda: predictLidar( options, scene_const, veh_pos, veh_heading, sensor[:,:,-1], new_pos, new_heading ), min_time, ops = veh_count )
+    return { 'predictLidar' : makeResult( timing, 'vehicle', VEH_COUNT = veh_count ) }
+
+# Network benchmarks. Networks are built from the default options, weights are not loaded
+def benchNetwork( veh_count = 6, seed = 1, min_time = 2.0, max_horizon = 5 ):
+    import tensorflow as tf
+
+    from utils.env_py import env_py
+    from utils.genTraj_script import genTrajectory
+    from utils.q_algorithm import dqn
+    from utils.scene_constants_pb import scene_constants
+
+    setSeed( seed )
+    tf.set_random_seed( seed )
+    options = getBenchOptions( veh_count, SEED = seed )
+
+    # env_py is not started, and only provides options and scene_const to dqn
+    learner_env = env_py( options, scene_constants() )
+    q_algo      = dqn( learner_env, options.INIT_EPS, load = False )
+    scene_const = learner_env.scene_const
+    results     = {}
+
+    for _ in range(0, max( 10*options.BATCH_SIZE, 1000 )):
+        q_algo.replay_memory.store( getRandomExperience( options, scene_const ) )
+
+    results['dqn.trainOneStep'] = makeResult( timeIt( q_algo.trainOneStep, min_time ), 'batch', BATCH_SIZE = options.BATCH_SIZE, enable_PER = options.enable_PER )
+
+    veh_pos, veh_heading, sensor, goal = getRandomObservation( options, scene_const, veh_count )
+    timing = timeIt( lambda: genTrajectory( options, scene_const, veh_pos, veh_heading, sensor, goal, q_algo.agent_train.model_q_all, max_horizon ), min_time, ops = veh_count )
+    results['genTrajectory'] = makeResult( timing, 'vehicle', VEH_COUNT = veh_count, max_horizon = max_horizon )
+
+    return results
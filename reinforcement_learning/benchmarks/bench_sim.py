@@ -0,0 +1,94 @@
+#####################################
+# bench_sim.py
+#
+# Benchmarks of the simulation hot paths on a headless env_py (PyBullet DIRECT)
+#   getSensorData, getVehicleState, getObservation, updateObservation, initScene
+# and the end-to-end env steps/sec at several VEH_COUNT values.
+#####################################
+import numpy as np
+
+from benchmarks.bench_common import (getBenchOptions, makeResult, setSeed,
+                                     timeIt)
+
+
+# Start a headless env_py with all test cases initialized
+def startEnv( options ):
+    from utils.env_py import env_py
+    from utils.scene_constants_pb import scene_constants
+
+    sim_env = env_py( options, scene_constants() )
+    sim_env.scene_const.clientID, _ = sim_env.start()
+    sim_env.initScene( list(range(0,options.VEH_COUNT)), True )
+    sim_env.updateObservation( range(0,options.VEH_COUNT), add_noise = False )
+
+    return sim_env
+
+# Micro benchmarks of env_py
+# Input
+#   veh_count : VEH_COUNT of the env
+def benchEnv( veh_count, seed = 1, min_time = 1.0 ):
+    from utils.utils_pb import getSensorData, getVehicleState
+
+    setSeed( seed )
+    options = getBenchOptions( veh_count, SEED = seed )
+    sim_env = startEnv( options )
+    results = {}
+
+    results['getSensorData'] = makeResult(
+        timeIt( lambda: getSensorData( sim_env.scene_const, options, sim_env.handle_dict['vehicle'] ), min_time ),
+        'call', VEH_COUNT = veh_count )
+
+    results['getVehicleState'] = makeResult(
+        timeIt( lambda: getVehicleState( sim_env.scene_const, options, sim_env.handle_dict ), min_time ),
+        'call', VEH_COUNT = veh_count )
+
+    results['env_py.getObservation'] = makeResult(
+        timeIt( lambda: sim_env.getObservation( old = False ), min_time ),
+        'call', VEH_COUNT = veh_count )
+
+    results['env_py.updateObservation'] = makeResult(
+        timeIt( lambda: sim_env.updateObservation( range(0,veh_count), add_noise = False ), min_time ),
+        'call', VEH_COUNT = veh_count )
+
+    # Reset of a single test case, cycling through the vehicles
+    reset_counter = [0]
+    def resetOne():
+        sim_env.initScene( [ reset_counter[0] % veh_count ], True )
+        reset_counter[0] += 1
+
+    results['env_py.initScene'] = makeResult( timeIt( resetOne, min_time ), 'reset', VEH_COUNT = veh_count )
+
+    sim_env.end()
+    return results
+
+# End-to-end throughput. Random actions, same sequence of calls as the global step loop of dqn_bullet.py without learning
+# Input
+#   veh_counts : list of VEH_COUNT
+# Output
+#   one result per VEH_COUNT, in vehicle steps (env steps x VEH_COUNT) per second
+def benchEnvSteps( veh_counts, seed = 1, min_time = 2.0 ):
+    results = {}
+    for veh_count in veh_counts:
+        setSeed( seed )
+        options = getBenchOptions( veh_count, SEED = seed )
+        sim_env = startEnv( options )
+        scene_const = sim_env.scene_const
+
+        def envStep():
+            action_stack = np.random.randint( 0, options.ACTION_DIM, veh_count )
+            sim_env.getObservation( old = False )
+            sim_env.applyAction( scene_const.max_steer - action_stack * abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1) )
+            sim_env.step()
+            sim_env.updateObservation( range(0,veh_count), add_noise = False )
+
+            next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = sim_env.getObservation( frame = -1 )
+            _, veh_status, _, _ = sim_env.getRewards( next_dDistance, next_veh_pos, next_gInfo, next_veh_heading )
+
+            reset_veh_list = [ v for v in range(0,veh_count) if veh_status[v] != scene_const.EVENT_FINE ]
+            sim_env.initScene( reset_veh_list, True )
+            sim_env.resetRewards( veh_status )
+
+        results['env_steps.VEH_COUNT_' + str(veh_count)] = makeResult( timeIt( envStep, min_time, ops = veh_count ), 'vehicle step', VEH_COUNT = veh_count )
+        sim_env.end()
+
+    return results
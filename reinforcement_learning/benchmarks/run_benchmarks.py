@@ -0,0 +1,134 @@
+#####################################
+# run_benchmarks.py
+#
+# Run the benchmark suite and save the results as json, tagged with the git commit.
+# With --COMPARE, results are compared with a previous json, and throughput regressions are reported (exit code 1).
+#
+# Usage (from reinforcement_learning/)
+#   python -m benchmarks.run_benchmarks --OUTPUT bench.json
+#   python -m benchmarks.run_benchmarks --OUTPUT bench_new.json --COMPARE bench.json --TOLERANCE 0.1
+#   python -m benchmarks.run_benchmarks --SUITE replay,lidar --MIN_TIME 0.5
+#####################################
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+from benchmarks.bench_learning import (benchNetwork, benchPredictLidar,
+                                       benchReplay)
+from benchmarks.bench_sim import benchEnv, benchEnvSteps
+
+# Suites. Each is a function of (options of run_benchmarks) returning { name : result }
+SUITES = {
+    'env'       : lambda o: benchEnv( o.VEH_COUNT, o.SEED, o.MIN_TIME ),
+    'env_steps' : lambda o: benchEnvSteps( [ int(v) for v in o.VEH_COUNTS.split(',') ], o.SEED, 2*o.MIN_TIME ),
+    'replay'    : lambda o: benchReplay( o.SEED, o.MIN_TIME ),
+    'lidar'     : lambda o: benchPredictLidar( o.VEH_COUNT, o.SEED, o.MIN_TIME ),
+    'network'   : lambda o: benchNetwork( o.VEH_COUNT, o.SEED, 2*o.MIN_TIME ),
+}
+
+
+def get_bench_options():
+    parser = ArgumentParser(
+        description='Benchmark the simulation and learning hot paths'
+        )
+    parser.add_argument('--OUTPUT', type=str, default=None,
+                        help='Output json file. Default is bench_<commit>.json')
+    parser.add_argument('--COMPARE', type=str, default=None,
+                        help='Json of a previous run to compare with')
+    parser.add_argument('--TOLERANCE', type=float, default=0.1,
+                        help='Relative throughput drop reported as regression')
+    parser.add_argument('--SUITE', type=str, default=','.join(SUITES.keys()),
+                        help='Comma separated suites : ' + ', '.join(SUITES.keys()))
+    parser.add_argument('--VEH_COUNT', type=int, default=6,
+                        help='VEH_COUNT of micro benchmarks')
+    parser.add_argument('--VEH_COUNTS', type=str, default='1,6,24,96',
+                        help='Comma separated VEH_COUNT of the env steps/sec benchmark')
+    parser.add_argument('--MIN_TIME', type=float, default=1.0,
+                        help='Seconds of each timing round')
+    parser.add_argument('--SEED', type=int, default=1,
+                        help='Seed of all benchmarks')
+
+    return parser.parse_args()
+
+def getGitCommit():
+    try:
+        return subprocess.check_output( ['git', 'rev-parse', 'HEAD'], stderr = subprocess.DEVNULL ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+# Compare results with a previous run
+# Output
+#   list of names with throughput drop larger than tolerance
+def compareResults( new_results, old_results, tolerance ):
+    regressions = []
+
+    print('======================================================')
+    print('Comparison with ' + str(old_results.get('commit')))
+    print('\t' + 'benchmark'.ljust(36) + 'old'.rjust(14) + 'new'.rjust(14) + 'ratio'.rjust(8))
+    for name, result in new_results['results'].items():
+        if name not in old_results['results']:
+            continue
+
+        old_rate = old_results['results'][name]['ops_per_sec']
+        ratio    = result['ops_per_sec']/old_rate if old_rate > 0 else np.inf
+        flag     = ''
+        if ratio < 1 - tolerance:
+            regressions.append( name )
+            flag = '  REGRESSION'
+
+        print('\t' + name.ljust(36) + ('%.1f' % old_rate).rjust(14) + ('%.1f' % result['ops_per_sec']).rjust(14) + ('%.2f' % ratio).rjust(8) + flag)
+    print('======================================================')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    bench_options = get_bench_options()
+    commit        = getGitCommit()
+
+    output = {
+        'commit'   : commit,
+        'time'     : str( datetime.datetime.now() ),
+        'python'   : platform.python_version(),
+        'numpy'    : np.__version__,
+        'platform' : platform.platform(),
+        'options'  : vars( bench_options ),
+        'results'  : {},
+        'skipped'  : {},
+    }
+
+    for suite in bench_options.SUITE.split(','):
+        if suite not in SUITES:
+            raise ValueError('Unknown suite : ' + suite)
+
+        print('Running ' + suite + '...')
+        try:
+            results = SUITES[suite]( bench_options )
+        except ImportError as e:
+            # Suite needs a package which is not installed, e.g., pybullet or tensorflow
+            print('\tSkipped : ' + str(e))
+            output['skipped'][suite] = str(e)
+            continue
+
+        for name, result in results.items():
+            print('\t' + name.ljust(36) + ('%.1f' % result['ops_per_sec']).rjust(14) + ' ' + result['unit'] + '/s')
+        output['results'].update( results )
+
+    output_path = bench_options.OUTPUT if bench_options.OUTPUT is not None else 'bench_' + commit[0:10] + '.json'
+    with open( output_path, 'w' ) as out_file:
+        json.dump( output, out_file, indent = 2 )
+    print('Saved ' + output_path)
+
+    if bench_options.COMPARE is not None:
+        with open( bench_options.COMPARE ) as old_file:
+            regressions = compareResults( output, json.load( old_file ), bench_options.TOLERANCE )
+        if len(regressions) > 0:
+            print('Regressions : ' + ', '.join( regressions ))
+            sys.exit(1)
+
+    sys.exit()
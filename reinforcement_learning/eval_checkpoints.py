@@ -0,0 +1,290 @@
+# Evaluate all checkpoints in a directory on a fixed, seeded set of 2LC scenarios
+#
+# Each checkpoint is run greedily (TESTING) on the same scenarios, taken from a scenario bank (utils/scenario_bank.py). Checkpoints are distributed over a pool of processes,
+# and each worker owns a headless env_py and a QAgent.
+# Results are cached by the hash of the checkpoint file, hence rerunning only evaluates new files.
+#
+# Usage
+#   python eval_checkpoints.py --CHECKPOINT_DIR ./model_weights/checkpoints-vehicle-CNN-191107 --EVAL_WORKERS 8 [options of dqn_bullet.py]
+import csv
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import tensorflow as tf
+
+from dqn_bullet import get_parser
+from utils.checkpoint_catalog import checkpoint_catalog, parseFileName
+from utils.env_py import env_py
+from utils.rl_dqn import QAgent
+from utils.scenario_bank import genScenarioBank, loadScenarioBank
+from utils.scene_constants_pb import scene_constants
+
+
+def get_eval_options():
+    parser = ArgumentParser(
+        description='Evaluate checkpoints in parallel. Other options are passed to the parser of dqn_bullet.py'
+        )
+    parser.add_argument('--CHECKPOINT_DIR', type=str, required=True,
+                        help='Directory of checkpoints (.h5) to evaluate')
+    parser.add_argument('--EVAL_WORKERS', type=int, default=max(1, mp.cpu_count()//2),
+                        help='Number of worker processes')
+    parser.add_argument('--EVAL_SCENARIOS', type=int, default=100,
+                        help='Number of scenarios evaluated for each checkpoint')
+    parser.add_argument('--EVAL_COURSE_EPS', type=float, default=0.0,
+                        help='Course hardness of the scenarios. 0 - hard, 1 - easy')
+    parser.add_argument('--EVAL_BANK', type=str, default=None,
+                        help='Scenario bank (.npy) of utils/scenario_bank.py. Default is a bank generated from SEED and EVAL_COURSE_EPS')
+    parser.add_argument('--EVAL_CACHE', type=str, default=None,
+                        help='Cache file of results. Default is CHECKPOINT_DIR/eval_cache.json')
+    parser.add_argument('--EVAL_OUTPUT', type=str, default=None,
+                        help='CSV file of results. Default is CHECKPOINT_DIR/eval_results.csv')
+    eval_options, remaining = parser.parse_known_args()
+
+    # Options of the environment & network. Evaluation is always greedy and headless
+    options = get_parser().parse_args( remaining )
+    options.TESTING    = True
+    options.enable_GUI = False
+    options.DRAW       = False
+    options.manual     = False
+    options.VERBOSE    = False
+    options.HEADLESS   = True
+
+    return eval_options, options
+
+# Key of the cache. Results are only reused when the scenarios and the simulation are the same
+def getConfigKey( eval_options, options ):
+    config = {
+        'scenarios'      : eval_options.EVAL_SCENARIOS,
+        'course_eps'     : eval_options.EVAL_COURSE_EPS,
+        'seed'           : options.SEED,
+        'max_timestep'   : options.MAX_TIMESTEP,
+        'fix_input_step' : options.FIX_INPUT_STEP,
+        'init_spd'       : options.INIT_SPD,
+        'frame_count'    : options.FRAME_COUNT,
+        'action_dim'     : options.ACTION_DIM,
+        'gamma'          : options.GAMMA,
+        'bank'           : hashFile( eval_options.EVAL_BANK ) if eval_options.EVAL_BANK is not None else None,
+    }
+    return json.dumps( config, sort_keys = True )
+
+# SHA1 of the file content
+def hashFile( file_path ):
+    sha1 = hashlib.sha1()
+    with open( file_path, 'rb' ) as check_file:
+        for chunk in iter( lambda: check_file.read(1 << 20), b'' ):
+            sha1.update( chunk )
+
+    return sha1.hexdigest()
+
+
+########################
+# Worker
+########################
+worker_env   = None
+worker_agent = None
+worker_args  = None
+worker_bank  = None
+
+# Scenarios of the evaluation
+def getEvalBank( eval_options, options ):
+    if eval_options.EVAL_BANK is None:
+        return genScenarioBank( scene_constants(), eval_options.EVAL_SCENARIOS, eval_options.EVAL_COURSE_EPS, options.SEED )
+
+    bank = loadScenarioBank( eval_options.EVAL_BANK, mmap = True )
+    if len(bank) < eval_options.EVAL_SCENARIOS:
+        raise ValueError('EVAL_SCENARIOS=' + str(eval_options.EVAL_SCENARIOS) + ' is larger than the scenario bank (' + str(len(bank)) + ')')
+
+    return bank
+
+# Start headless simulation and build network once per worker
+def initWorker( options, eval_options ):
+    global worker_env, worker_agent, worker_args, worker_bank
+
+    tf.keras.backend.set_session( tf.Session( config = tf.ConfigProto( device_count = {'GPU' : 0}, intra_op_parallelism_threads = 1, inter_op_parallelism_threads = 1 ) ) )
+    tf.set_random_seed( options.SEED )
+
+    worker_env = env_py( options, scene_constants() )
+    worker_env.scene_const.clientID, _ = worker_env.start()
+    worker_agent = QAgent( options, worker_env.scene_const, 'Eval' )
+    worker_args  = eval_options
+    worker_bank  = getEvalBank( eval_options, options )
+
+    return
+
+# Reset vehicle v with scenario scenario_idx of the bank. Same scenario_idx always gives the same scenario
+def resetScenario( sim_env, v, scenario_idx, course_eps ):
+    np.random.seed( sim_env.options.SEED + scenario_idx )
+    random.seed( sim_env.options.SEED + scenario_idx )
+    sim_env.initScene( [v], True, course_eps, scenario = np.asarray( worker_bank[scenario_idx:scenario_idx+1] ) )
+    return
+
+# Evaluate single checkpoint
+# Input
+#   file_path : path of the checkpoint
+# Output
+#   (file_path, result) : result is dictionary of success_rate, collision_rate, mean_steps, mean_reward
+def evalCheckpoint( file_path ):
+    sim_env     = worker_env
+    options     = sim_env.options
+    scene_const = sim_env.scene_const
+    scenarios   = worker_args.EVAL_SCENARIOS
+    course_eps  = worker_args.EVAL_COURSE_EPS
+
+    start_time = time.time()
+    worker_agent.model_qa.load_weights( file_path )
+
+    # Scenario index of each vehicle. -1 if vehicle has no scenario to run
+    veh_scenario  = -1*np.ones( options.VEH_COUNT, dtype = int )
+    next_scenario = 0
+    for v in range(0,options.VEH_COUNT):
+        if next_scenario < scenarios:
+            veh_scenario[v] = next_scenario
+            next_scenario  += 1
+        resetScenario( sim_env, v, max(veh_scenario[v], 0), course_eps )
+
+    sim_env.updateObservation( range(0,options.VEH_COUNT), add_noise = False )
+    sim_env.resetRewards( np.ones( options.VEH_COUNT ) )
+
+    status  = np.zeros( scenarios, dtype = int )
+    steps   = np.zeros( scenarios )
+    rewards = np.zeros( scenarios )
+
+    while np.any( veh_scenario >= 0 ):
+        # Greedy action
+        _, _, obs_sensor_stack, obs_goal_stack = sim_env.getObservation( old = False )
+        q_val = worker_agent.model_q_all.predict_on_batch(
+                                            {
+                                                'observation_sensor_k' : obs_sensor_stack[:,0:scene_const.sensor_count,:],
+                                                'observation_state'    : obs_sensor_stack[:,scene_const.sensor_count:,:],
+                                                'observation_goal_k'   : obs_goal_stack
+                                            }
+        )
+        action_stack_k = np.argmax( q_val, axis = 1 )
+        targetSteer_k  = scene_const.max_steer - action_stack_k * abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1)
+
+        sim_env.applyAction( targetSteer_k )
+        sim_env.step()
+        sim_env.updateObservation( range(0,options.VEH_COUNT), add_noise = False )
+
+        next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = sim_env.getObservation( frame = -1 )
+        _, veh_status, _, _ = sim_env.getRewards( next_dDistance, next_veh_pos, next_gInfo, next_veh_heading )
+
+        # Record finished scenarios and start the next ones
+        for v in range(0,options.VEH_COUNT):
+            if veh_status[v] == scene_const.EVENT_FINE:
+                continue
+
+            if veh_scenario[v] >= 0:
+                status[veh_scenario[v]]  = veh_status[v]
+                steps[veh_scenario[v]]   = sim_env.epi_step_stack[v]
+                rewards[veh_scenario[v]] = sim_env.epi_reward_stack[v]
+
+                if next_scenario < scenarios:
+                    veh_scenario[v] = next_scenario
+                    next_scenario  += 1
+                else:
+                    veh_scenario[v] = -1
+
+            resetScenario( sim_env, v, max(veh_scenario[v], 0), course_eps )
+
+        sim_env.resetRewards( veh_status )
+
+    result = {
+        'success_rate'   : float( np.mean( status == scene_const.EVENT_GOAL ) ),
+        'collision_rate' : float( np.mean( status == scene_const.EVENT_COLLISION ) ),
+        'mean_steps'     : float( np.mean( steps ) ),
+        'mean_reward'    : float( np.mean( rewards ) ),
+        'eval_time'      : time.time() - start_time,
+    }
+    return file_path, result
+
+
+########################
+# MAIN
+########################
+if __name__ == "__main__":
+    eval_options, options = get_eval_options()
+
+    cache_path  = eval_options.EVAL_CACHE  if eval_options.EVAL_CACHE  is not None else os.path.join( eval_options.CHECKPOINT_DIR, 'eval_cache.json' )
+    output_path = eval_options.EVAL_OUTPUT if eval_options.EVAL_OUTPUT is not None else os.path.join( eval_options.CHECKPOINT_DIR, 'eval_results.csv' )
+    config_key  = getConfigKey( eval_options, options )
+
+    # Check the scenario bank before starting workers
+    getEvalBank( eval_options, options )
+
+    # Cache : { config_key : { sha1 : result } }
+    cache = {}
+    if os.path.isfile( cache_path ):
+        with open( cache_path ) as cache_file:
+            cache = json.load( cache_file )
+    config_cache = cache.setdefault( config_key, {} )
+
+    # Checkpoints sorted by run and global step
+    file_names = [ f for f in os.listdir( eval_options.CHECKPOINT_DIR ) if f.endswith('.h5') and not f.endswith('_actor.h5') and not f.endswith('_critic.h5') ]
+    parsed     = { f : parseFileName(f) for f in file_names }
+    file_names = sorted( file_names, key = lambda f: (parsed[f][0], parsed[f][2]) if parsed[f] is not None else (f, 0) )
+    file_paths = [ os.path.join( eval_options.CHECKPOINT_DIR, f ) for f in file_names ]
+    file_hash  = { path : hashFile( path ) for path in file_paths }
+
+    pending = [ path for path in file_paths if file_hash[path] not in config_cache ]
+
+    print('======================================================')
+    print('Checkpoints       : ' + str(len(file_paths)))
+    print('Cached            : ' + str(len(file_paths) - len(pending)))
+    print('To evaluate       : ' + str(len(pending)))
+    print('Scenarios         : ' + str(eval_options.EVAL_SCENARIOS))
+    print('Workers           : ' + str(eval_options.EVAL_WORKERS))
+    print('Scenario bank     : ' + (eval_options.EVAL_BANK if eval_options.EVAL_BANK is not None else 'generated, seed ' + str(options.SEED)))
+    print('======================================================')
+
+    if len(pending) > 0:
+        # TF must not be forked, hence use spawn
+        ctx  = mp.get_context('spawn')
+        pool = ctx.Pool( min(eval_options.EVAL_WORKERS, len(pending)), initializer = initWorker, initargs = (options, eval_options) )
+
+        for counter, (path, result) in enumerate( pool.imap_unordered( evalCheckpoint, pending ) ):
+            print('[' + str(counter+1) + '/' + str(len(pending)) + '] ' + path + ' : ' + str(result))
+
+            # Save cache after every checkpoint, so that interrupted run can be resumed
+            config_cache[file_hash[path]] = result
+            with open( cache_path + '.tmp', 'w' ) as cache_file:
+                json.dump( cache, cache_file, indent = 1 )
+            os.replace( cache_path + '.tmp', cache_path )
+
+        pool.close()
+        pool.join()
+
+    # Results table
+    header = ['file', 'run', 'episode', 'global_step', 'success_rate', 'collision_rate', 'mean_steps', 'mean_reward']
+    rows   = []
+    for f, path in zip( file_names, file_paths ):
+        result = config_cache[file_hash[path]]
+        run, episode, global_step, _ = parsed[f] if parsed[f] is not None else ('', '', '', '')
+        rows.append( [f, run, episode, global_step, result['success_rate'], result['collision_rate'], result['mean_steps'], result['mean_reward']] )
+
+    with open( output_path, 'w', newline = '' ) as out_file:
+        writer = csv.writer( out_file )
+        writer.writerow( header )
+        writer.writerows( rows )
+
+    # Store success rate in the checkpoint catalog, e.g., for --WEIGHT_QUERY best:success_rate
+    catalog = checkpoint_catalog( os.path.join( eval_options.CHECKPOINT_DIR, 'checkpoint_catalog.db' ) )
+    catalog.scan( eval_options.CHECKPOINT_DIR )
+    for path in file_paths:
+        catalog.setMetric( path, 'success_rate', config_cache[file_hash[path]]['success_rate'], commit = False )
+    catalog.db.commit()
+    catalog.close()
+
+    print('{:<50} {:>8} {:>10} {:>8} {:>8} {:>8} {:>10}'.format( 'file', 'episode', 'gs', 'success', 'collide', 'steps', 'reward' ))
+    for row in rows:
+        print('{:<50} {:>8} {:>10} {:>8.3f} {:>8.3f} {:>8.1f} {:>10.3f}'.format( row[0], row[2], row[3], row[4], row[5], row[6], row[7] ))
+    print('Results written to ' + output_path)
+
+    sys.exit()
@@ -0,0 +1,202 @@
+# Trajectory prediction server
+#
+# Loads options, scene_const and the network once (genTrajectoryInit), and serves genTrajectory over a unix socket.
+# Requests from concurrent clients are collected for up to LATENCY_MS (or MAX_BATCH vehicles) and predicted together,
+# i.e., a single network call per horizon step for the whole batch.
+# Use utils/genTraj_client.py to send requests.
+#
+# Usage
+#   python genTraj_server.py --WEIGHT_FILE ./model_weights/checkpoints-vehicle-CNN-state-191108/2019-11-07_19_55_36.380100_e5000_gs369576.h5 \
+#                            --OPTION_FILE ./model_weights/checkpoints-vehicle-CNN-state-191108/genTraj_options_file
+import os
+import queue
+import socketserver
+import threading
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from utils.genTraj_client import DEFAULT_SOCKET, recvMessage, sendMessage
+from utils.genTraj_script import genTrajectory, genTrajectoryInit
+
+
+def get_options():
+    parser = ArgumentParser(
+        description='Trajectory prediction server'
+        )
+    parser.add_argument('--WEIGHT_FILE', type=str, required=True,
+                        help='Keras model (.h5) used for prediction')
+    parser.add_argument('--OPTION_FILE', type=str, default='genTraj_options_file',
+                        help='Options & scene_const file generated by dqn_bullet.py --DUMP_OPTIONS')
+    parser.add_argument('--SOCKET', type=str, default=DEFAULT_SOCKET,
+                        help='Path of the unix socket')
+    parser.add_argument('--LATENCY_MS', type=float, default=5.0,
+                        help='Maximum time to wait for other requests before predicting a batch')
+    parser.add_argument('--MAX_BATCH', type=int, default=512,
+                        help='Maximum number of vehicles predicted together')
+    return parser.parse_args()
+
+
+# Pending request. Filled by the batcher, and waited by the connection thread
+class request_slot:
+    def __init__(self, request):
+        self.request = request
+        self.reply   = None
+        self.done    = threading.Event()
+
+
+# Check a prediction request before it is batched with requests of other clients
+# Arrays are concatenated along the vehicle axis, hence all dimensions except the first must match the server
+# Input
+#   request     : request received from genTraj_client
+#   options     : options of the server
+#   scene_const : scene_const of the server
+# Output
+#   error message, or None if the request is valid
+def validateRequest( request, options, scene_const ):
+    if not isinstance( request, dict ):
+        return 'Request must be a dictionary'
+
+    for key in [ 'veh_pos', 'veh_heading', 'state_sensor', 'state_goal', 'max_horizon' ]:
+        if key not in request:
+            return 'Missing key : ' + key
+
+    if not isinstance( request['max_horizon'], (int, np.integer) ) or request['max_horizon'] <= 0:
+        return 'max_horizon must be a positive integer'
+
+    # Expected shape of each array after the number of vehicles
+    trailing_shape = {
+        'veh_pos'      : (2,),
+        'veh_heading'  : (),
+        'state_sensor' : (scene_const.sensor_count*2, options.FRAME_COUNT),
+        'state_goal'   : (2, options.FRAME_COUNT)
+    }
+
+    counts = []
+    for key, shape in trailing_shape.items():
+        if not isinstance( request[key], np.ndarray ) or not np.issubdtype( request[key].dtype, np.number ):
+            return key + ' must be a numeric numpy array'
+        if request[key].ndim != len(shape) + 1 or request[key].shape[1:] != shape:
+            return key + ' must have shape ' + str( ('N',) + shape ) + ', got ' + str(request[key].shape)
+        counts.append( request[key].shape[0] )
+
+    if len( set(counts) ) != 1:
+        return 'Number of vehicles does not match : ' + str(counts)
+
+    return None
+
+
+# One thread per connection. Requests are forwarded to the batcher
+class request_handler( socketserver.BaseRequestHandler ):
+    def handle(self):
+        while True:
+            try:
+                request = recvMessage( self.request )
+            except (ConnectionError, EOFError):
+                return
+
+            if isinstance( request, dict ) and 'config' in request:
+                sendMessage( self.request, {'options' : self.server.sample_options, 'scene_const' : self.server.sample_scene_const} )
+                continue
+
+            # Reply the error to this client only. Invalid request would otherwise break the batching loop
+            error = validateRequest( request, self.server.sample_options, self.server.sample_scene_const )
+            if error is not None:
+                sendMessage( self.request, {'error' : error} )
+                continue
+
+            slot = request_slot( request )
+            self.server.request_queue.put( slot )
+            slot.done.wait()
+            sendMessage( self.request, slot.reply )
+
+
+class genTraj_server( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+
+
+# Predict all requests in a single call of genTrajectory. Requests are predicted up to the longest horizon and sliced.
+def runBatch( options, scene_const, network_model, slots ):
+    try:
+        max_horizon = max( slot.request['max_horizon'] for slot in slots )
+        counts      = [ slot.request['veh_pos'].shape[0] for slot in slots ]
+
+        result = genTrajectory(
+                    options,
+                    scene_const,
+                    np.concatenate( [ slot.request['veh_pos'] for slot in slots ] ),
+                    np.concatenate( [ slot.request['veh_heading'] for slot in slots ] ),
+                    np.concatenate( [ slot.request['state_sensor'] for slot in slots ] ),
+                    np.concatenate( [ slot.request['state_goal'] for slot in slots ] ),
+                    network_model,
+                    max_horizon
+                )
+
+        offset = 0
+        for slot, count in zip( slots, counts ):
+            horizon = slot.request['max_horizon']
+            position, state, heading, sensor_x, sensor_y = [ r[offset:offset+count,:,0:horizon] for r in result ]
+            slot.reply = {'position' : position, 'state' : state, 'heading' : heading, 'sensor_x' : sensor_x, 'sensor_y' : sensor_y}
+            offset = offset + count
+    except Exception as e:
+        for slot in slots:
+            slot.reply = {'error' : str(e)}
+
+    for slot in slots:
+        slot.done.set()
+
+    return
+
+
+########################
+# MAIN
+########################
+if __name__ == "__main__":
+    server_options = get_options()
+
+    # Load once
+    sample_options, sample_scene_const, network_model = genTrajectoryInit( server_options.WEIGHT_FILE, server_options.OPTION_FILE )
+
+    if os.path.exists( server_options.SOCKET ):
+        os.remove( server_options.SOCKET )
+
+    server = genTraj_server( server_options.SOCKET, request_handler )
+    server.request_queue      = queue.Queue()
+    server.sample_options     = sample_options
+    server.sample_scene_const = sample_scene_const
+
+    # Connections are handled in background threads. Network is only used by this (main) thread
+    server_thread = threading.Thread( target = server.serve_forever, daemon = True )
+    server_thread.start()
+
+    print('======================================================')
+    print('Listening on ' + server_options.SOCKET)
+    print('======================================================')
+
+    latency = server_options.LATENCY_MS/1000
+    try:
+        while True:
+            slots       = [ server.request_queue.get() ]
+            veh_count   = slots[0].request['veh_pos'].shape[0]
+            deadline    = time.time() + latency
+
+            # Collect requests until latency budget or batch size is reached
+            while veh_count < server_options.MAX_BATCH:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    slot = server.request_queue.get( timeout = remaining )
+                except queue.Empty:
+                    break
+                slots.append( slot )
+                veh_count += slot.request['veh_pos'].shape[0]
+
+            runBatch( sample_options, sample_scene_const, network_model, slots )
+    except KeyboardInterrupt:
+        pass
+
+    server.shutdown()
+    server.server_close()
+    os.remove( server_options.SOCKET )
@@ -0,0 +1,218 @@
+# Replay episodes recorded with --RECORD (utils/episode_recorder.py)
+#
+# Without --EPISODE, recorded episodes are listed, e.g., to find collisions with --EVENT 1.
+# With --EPISODE, the episode is reconstructed
+#   playback : from the recorded poses. No physics, PyBullet is not needed
+#   resim    : by applying the recorded actions to a fresh single vehicle simulation of the same scenario and SEED.
+#              Poses are compared with the record. env_np is used if the run used --SURROGATE
+# The path is plotted over the walls of the test case and saved as PNG.
+#
+# Re-simulation is exact for the surrogate, and for PyBullet runs with VEH_COUNT = 1 (initScene_2LC fully resets the vehicle,
+# hence every episode starts as in a fresh world). With VEH_COUNT > 1, the vehicle is re-simulated alone, while PyBullet
+# solved it together with the other vehicles. Poses drift (tens of cm up to a few metres) and the final event may differ,
+# hence use playback as the reference for those runs. Sensor noise (ADD_NOISE) only changes observations, not the poses.
+#
+# Usage
+#   python replay_episode.py ./result_data/episode_data/<time> --EVENT 1
+#   python replay_episode.py ./result_data/episode_data/<time> --EPISODE 42 --MODE resim [--GUI]
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+
+from utils.episode_recorder import loadEpisodes, loadEpisodeSteps, loadMeta
+from utils.scene_constants_pb import scene_constants
+from utils.scene_geometry_2LC import getGoalPos, getObstacleBox, getTeeBoxes
+
+EVENT_NAMES = { 0 : 'unfinished', 1 : 'collision', 2 : 'goal', 3 : 'max step' }
+
+
+def get_replay_options():
+    parser = ArgumentParser(
+        description='List or replay episodes recorded with --RECORD'
+        )
+    parser.add_argument('RECORD_DIR', type=str,
+                        help='Directory of the record, e.g., ./result_data/episode_data/<time>')
+    parser.add_argument('--EPISODE', type=int, default=None,
+                        help='Episode to replay. Default lists the episodes')
+    parser.add_argument('--EVENT', type=int, default=None,
+                        help='Only list episodes ending with this event. 0/1/2/3 : unfinished/collision/goal/max step')
+    parser.add_argument('--MODE', type=str, default='playback', choices=['playback', 'resim'],
+                        help='playback : recorded poses. resim : re-simulate the recorded actions')
+    parser.add_argument('--GUI', action='store_true', default=False,
+                        help='Show the re-simulation in the PyBullet GUI')
+    parser.add_argument('--OUTPUT', type=str, default=None,
+                        help='PNG of the path. Default is RECORD_DIR/episode_<EPISODE>_<MODE>.png')
+    parser.add_argument('--PRINT_RATE', type=int, default=10,
+                        help='Number of steps between printed rows')
+
+    return parser.parse_args()
+
+def printEpisodes( episodes ):
+    print('{:>8} {:>8} {:>8} {:>12} {:>10}  {:>6} {:>4} {:>4} {:>7} {:>7} {:>7}'.format( 'episode', 'vehicle', 'steps', 'event', 'reward', 'lane', 'dir', 'obs', 'start_x', 'start_y', 'goal_x' ))
+    for e in episodes:
+        s = e['scenario']
+        print('{:>8} {:>8} {:>8} {:>12} {:>10.3f}  {:>6.2f} {:>4} {:>4} {:>7.2f} {:>7.2f} {:>7.2f}'.format(
+            e['episode'], e['vehicle'], e['length'] - 1, EVENT_NAMES.get( int(e['event']), str(e['event']) ), e['reward'],
+            s['lane_width'], s['valid_dir'], s['obs_slot'], s['start_x'], s['start_y'], s['goal_x'] ))
+    return
+
+def printSteps( steps, print_rate, resim = None ):
+    header = '{:>6} {:>7} {:>8} {:>8} {:>8} {:>10} {:>6}'.format( 'step', 'action', 'x', 'y', 'yaw', 'reward', 'event' )
+    if resim is not None:
+        header += ' {:>10}'.format( 'pos_error' )
+    print(header)
+
+    for k in range(0,len(steps['x'])):
+        if k % print_rate != 0 and k != len(steps['x']) - 1:
+            continue
+        row = '{:>6} {:>7} {:>8.3f} {:>8.3f} {:>8.3f} {:>10.3f} {:>6}'.format( k, steps['action'][k], steps['x'][k], steps['y'][k], steps['yaw'][k], steps['reward'][k], steps['event'][k] )
+        if resim is not None and k < len(resim['x']):
+            row += ' {:>10.4f}'.format( np.hypot( resim['x'][k] - steps['x'][k], resim['y'][k] - steps['y'][k] ) )
+        print(row)
+    return
+
+# Options of the recorded run, for a single vehicle at the origin
+def getResimOptions( meta, replay_options ):
+    options = Namespace( **meta['options'] )
+    options.VEH_COUNT   = 1
+    options.X_COUNT     = 1
+    options.THREAD      = 1
+    options.enable_GUI  = replay_options.GUI
+    options.DRAW        = False
+    options.manual      = False
+    options.VERBOSE     = False
+    options.HEADLESS    = True
+
+    if getattr( options, 'ROUTE_LEN', 0 ) > 0:
+        raise ValueError('Re-simulation is not supported in route mode (ROUTE_LEN > 0)')
+    if meta['randomize'] == False:
+        raise ValueError('Re-simulation needs a run with randomized scenarios')
+    if getattr( options, 'SURROGATE', False ) == False and meta['options'].get('VEH_COUNT', 1) > 1:
+        print('Warning : run used VEH_COUNT = ' + str(meta['options']['VEH_COUNT']) + '. PyBullet re-simulation of a single vehicle is approximate')
+
+    return options
+
+# Apply the recorded actions to a fresh simulation of the scenario
+# Output
+#   dictionary of { field : array } with the same fields as loadEpisodeSteps. Shorter than steps if an event happened earlier
+def resimEpisode( meta, episode, steps, replay_options ):
+    options     = getResimOptions( meta, replay_options )
+    scene_const = scene_constants()
+
+    # Same seeding as eval_checkpoints.resetScenario
+    np.random.seed( meta['seed'] + int(episode['episode']) )
+    random.seed( meta['seed'] + int(episode['episode']) )
+
+    if getattr( options, 'SURROGATE', False ) == True:
+        from utils.env_surrogate import env_np
+        sim_env = env_np( options, scene_const )
+    else:
+        from utils.env_py import env_py
+        sim_env = env_py( options, scene_const )
+
+    sim_env.scene_const.clientID, _ = sim_env.start()
+    sim_env.initScene( [0], True, float(episode['scenario']['course_eps']), scenario = np.asarray( episode['scenario'] ).reshape(1) )
+    sim_env.updateObservation( [0], add_noise = False )
+    sim_env.resetRewards( np.ones( 1 ) )
+
+    veh_pos, veh_heading, _, _ = sim_env.getObservation( frame = -1 )
+    resim = { 'x' : [veh_pos[0,0]], 'y' : [veh_pos[0,1]], 'yaw' : [veh_heading[0,2]], 'action' : [-1], 'reward' : [0.0], 'event' : [scene_const.EVENT_FINE] }
+
+    for k in range(1,len(steps['action'])):
+        action = int( steps['action'][k] )
+        sim_env.applyAction( np.array([ scene_const.max_steer - action*abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1) ]) )
+        sim_env.step()
+        sim_env.updateObservation( [0], add_noise = False )
+
+        next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = sim_env.getObservation( frame = -1 )
+        reward_stack, veh_status, _, _ = sim_env.getRewards( next_dDistance, next_veh_pos, next_gInfo, next_veh_heading )
+
+        for field, value in zip( ['x', 'y', 'yaw', 'action', 'reward', 'event'], [next_veh_pos[0,0], next_veh_pos[0,1], next_veh_heading[0,2], action, reward_stack[0], veh_status[0]] ):
+            resim[field].append( value )
+
+        if veh_status[0] != scene_const.EVENT_FINE:
+            break
+
+    sim_env.end()
+
+    return { field : np.asarray( value, dtype = steps[field].dtype ) for field, value in resim.items() }
+
+# Plot the path over the walls of the test case
+# Input
+#   paths : { label : steps }
+def plotEpisode( file_path, episode, paths ):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+
+    scene_const = scene_constants()
+    scenario    = episode['scenario']
+    boxes       = np.vstack( (getTeeBoxes( scene_const, 0, 0, scenario['lane_width'], scenario['valid_dir'] ), getObstacleBox( scene_const, 0, 0, scenario['lane_width'], scenario['obs_slot'] )) )
+    goal_pos    = getGoalPos( scene_const, 0, 0, scenario['lane_width'], scenario['goal_x'] )
+
+    fig, ax = plt.subplots( figsize = (6,10) )
+    for box in boxes:
+        ax.add_patch( Rectangle( (box[0] - box[2], box[1] - box[3]), 2*box[2], 2*box[3], color = 'gray' ) )
+    ax.plot( goal_pos[0], goal_pos[1], color = 'orange', marker = '*', markersize = 12, lw = 0, label = 'Goal Point' )
+    for label, steps in paths.items():
+        ax.plot( steps['x'], steps['y'], marker = 'o', markersize = 2, label = label )
+
+    ax.set_aspect('equal')
+    ax.set_title( 'Episode ' + str(episode['episode']) + ' : ' + EVENT_NAMES.get( int(episode['event']), str(episode['event']) ) )
+    ax.legend( loc = 'lower right' )
+    fig.savefig( file_path, bbox_inches = 'tight' )
+    plt.close( fig )
+
+    print('Plot saved        : ' + file_path)
+    return
+
+
+########################
+# MAIN
+########################
+if __name__ == "__main__":
+    replay_options = get_replay_options()
+    meta           = loadMeta( replay_options.RECORD_DIR )
+    episodes       = loadEpisodes( replay_options.RECORD_DIR )
+
+    if replay_options.EPISODE is None:
+        if replay_options.EVENT is not None:
+            episodes = episodes[ episodes['event'] == replay_options.EVENT ]
+        printEpisodes( episodes )
+        print('Episodes          : ' + str(len(episodes)))
+        sys.exit()
+
+    if replay_options.EPISODE < 0 or replay_options.EPISODE >= len(episodes):
+        raise ValueError('Episode ' + str(replay_options.EPISODE) + ' is not in the record (' + str(len(episodes)) + ' episodes)')
+
+    episode = episodes[ replay_options.EPISODE ]
+    steps   = loadEpisodeSteps( replay_options.RECORD_DIR, episode )
+    printEpisodes( episode.reshape(1) )
+
+    paths = { 'Recorded' : steps }
+    resim = None
+    if replay_options.MODE == 'resim':
+        resim = resimEpisode( meta, episode, steps, replay_options )
+        paths['Re-simulated'] = resim
+
+    printSteps( steps, max( replay_options.PRINT_RATE, 1 ), resim )
+
+    if resim is not None:
+        count     = min( len(resim['x']), len(steps['x']) )
+        pos_error = np.hypot( resim['x'][0:count] - steps['x'][0:count], resim['y'][0:count] - steps['y'][0:count] )
+        yaw_error = np.abs( np.angle( np.exp( 1j*(resim['yaw'][0:count] - steps['yaw'][0:count]) ) ) )
+
+        print('======================================================')
+        print('Recorded steps    : ' + str(len(steps['x']) - 1) + ', event : ' + EVENT_NAMES.get( int(steps['event'][-1]), '' ))
+        print('Re-simulated      : ' + str(len(resim['x']) - 1) + ', event : ' + EVENT_NAMES.get( int(resim['event'][-1]), '' ))
+        print('Max pos error     : ' + '%.4f' % pos_error.max())
+        print('Max yaw error     : ' + '%.4f' % yaw_error.max())
+        print('======================================================')
+
+    output_path = replay_options.OUTPUT if replay_options.OUTPUT is not None else replay_options.RECORD_DIR + '/episode_' + str(replay_options.EPISODE) + '_' + replay_options.MODE + '.png'
+    plotEpisode( output_path, episode, paths )
+
+    sys.exit()
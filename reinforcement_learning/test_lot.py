@@ -453,7 +453,7 @@ if __name__ == "__main__":
     ###########################        
     # DATA VARIABLES
     ###########################        
-    data_package = data_pack( START_TIME_STR )    
+    data_package = data_pack( START_TIME_STR, running_avg = options.RUNNING_AVG_STEP )    
 
     reward_data         = np.empty(0)
     avg_loss_value_data = np.empty(1)
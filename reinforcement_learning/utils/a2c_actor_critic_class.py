@@ -101,17 +101,18 @@ class Actor:
         self.model_pa.compile( optimizer= keras_opt,
                             loss = 'categorical_crossentropy' 
         )
-        ic('Actor p_all Summary')
-        self.model_p_all.summary()
-        ic('Actor pa Summary')
-        self.model_pa.summary()
-
         # effectively computing twice to get value and maximum
         # self.model_q_all = tf.keras.Model(inputs = [self.obs_goal_k, self.obs_sensor_k, self.obs_state], outputs = self.model_qa.get_layer('out_large').output)
 
-        # Figures
-        tf.keras.utils.plot_model( self.model_p_all, to_file='actor_p_all.png')
-        tf.keras.utils.plot_model( self.model_pa, to_file='actor_pa.png')
+        # Summary & Figures. Skipped in headless mode (plot_model needs graphviz)
+        if getattr( options, 'HEADLESS', False ) == False:
+            ic('Actor p_all Summary')
+            self.model_p_all.summary()
+            ic('Actor pa Summary')
+            self.model_pa.summary()
+
+            tf.keras.utils.plot_model( self.model_p_all, to_file='actor_p_all.png')
+            tf.keras.utils.plot_model( self.model_pa, to_file='actor_pa.png')
         # tf.keras.utils.plot_model( self.model_q_all, to_file='model_q_all.png')
 
         return
@@ -233,14 +234,15 @@ class Critic:
         self.model_val.compile( optimizer= keras_opt,
                             loss = 'mean_squared_error' 
         )
-        ic('Critic Summary')
-        self.model_val.summary()
-
         # effectively computing twice to get value and maximum
         # self.model_q_all = tf.keras.Model(inputs = [self.obs_goal_k, self.obs_sensor_k, self.obs_state], outputs = self.model_qa.get_layer('out_large').output)
 
-        # Figures
-        tf.keras.utils.plot_model( self.model_val, to_file='model_critic.png')
+        # Summary & Figures. Skipped in headless mode (plot_model needs graphviz)
+        if getattr( options, 'HEADLESS', False ) == False:
+            ic('Critic Summary')
+            self.model_val.summary()
+
+            tf.keras.utils.plot_model( self.model_val, to_file='model_critic.png')
         # tf.keras.utils.plot_model( self.model_q_all, to_file='model_q_all.png')
 
         return
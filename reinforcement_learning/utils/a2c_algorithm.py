@@ -10,6 +10,9 @@ from icecream import ic
 
 import numpy as np
 
+from utils.checkpoint_catalog import KIND_ACTOR
+from utils.checkpoint_catalog import findCheckpoint
+from utils.checkpoint_writer import snapshotModel
 from utils.experience_replay import Memory
 # from utils.a2c_actor_critic_class import QAgent
 from utils.a2c_actor_critic_class import Actor
@@ -131,24 +134,17 @@ class a2c:
         actions_mb_hot = np.zeros((self.options.BATCH_SIZE,self.options.ACTION_DIM))
         actions_mb_hot[np.arange(self.options.BATCH_SIZE),np.asarray(actions_mb, dtype=int)] = 1
 
-        # Calculate current & next value
-        curr_value = self.agent_critic.model_val.predict(
+        # Calculate current & next value. Current and next states are stacked and evaluated by the critic in a single call
+        # stacked_value : 2*BATCH_SIZE x 1, first half is current value and second half is next value
+        stacked_value = self.agent_critic.model_val.predict_on_batch(
                                             {
-                                                'observation_sensor_k' : states_sensor_mb[:,0:self.scene_const.sensor_count,:],
-                                                'observation_state'    : states_sensor_mb[:,self.scene_const.sensor_count:,:],
-                                                'observation_goal_k'   : states_goal_mb
-                                            },
-                                            batch_size = self.options.VEH_COUNT
-        )
-
-        next_value = self.agent_critic.model_val.predict(
-                                            {
-                                                'observation_sensor_k' : next_states_sensor_mb[:,0:self.scene_const.sensor_count,:],
-                                                'observation_state'    : next_states_sensor_mb[:,self.scene_const.sensor_count:,:],
-                                                'observation_goal_k'   : next_states_goal_mb
-                                            },
-                                            batch_size = self.options.VEH_COUNT
+                                                'observation_sensor_k' : np.concatenate((states_sensor_mb[:,0:self.scene_const.sensor_count,:], next_states_sensor_mb[:,0:self.scene_const.sensor_count,:])),
+                                                'observation_state'    : np.concatenate((states_sensor_mb[:,self.scene_const.sensor_count:,:], next_states_sensor_mb[:,self.scene_const.sensor_count:,:])),
+                                                'observation_goal_k'   : np.concatenate((states_goal_mb, next_states_goal_mb))
+                                            }
         )
+        curr_value = stacked_value[0:self.options.BATCH_SIZE]
+        next_value = stacked_value[self.options.BATCH_SIZE:]
 
         # Find Value Target
         value_target = np.reshape(rewards_mb, (self.options.BATCH_SIZE,1)) + self.options.GAMMA * next_value
@@ -215,13 +211,18 @@ class a2c:
 
     # Load network wegiths
     def loadNetwork( self ):
-        weight_path = None
+        weight_path_actor  = None
+        weight_path_critic = None
 
         # If file is provided. From checkpoint.txt, read the last line, i.e., the latest weight file.
         # For a2c, weight files does NOT include extension, and indicator for agent and critic
         if self.options.WEIGHT_FILE != None:
             weight_path_actor = self.options.WEIGHT_FILE + '_actor.h5'
             weight_path_critic = self.options.WEIGHT_FILE + '_critic.h5'
+        elif self.options.WEIGHT_QUERY != None:
+            weight_path_actor = findCheckpoint( self.options.WEIGHT_DIR, self.options.WEIGHT_QUERY, KIND_ACTOR )
+            if weight_path_actor != None:
+                weight_path_critic = weight_path_actor[:-len('_actor.h5')] + '_critic.h5'
         else:
             if os.path.isfile('./a2c-checkpoints-vehicle/checkpoint_actor.txt'):
                 with open('./a2c-checkpoints-vehicle/checkpoint_actor.txt') as check_file:
@@ -268,10 +269,23 @@ class a2c:
     #   START_TIME_STR : string of starting time
     #   epi_counter    : current episode number
     #   global_step    : current global step
-    def saveNetworkKeras(self, START_TIME_STR, epi_counter, global_step):
+    #   writer         : checkpoint_writer. If provided, weights are copied and written in background
+    #   metric         : metric of the checkpoint used by the writer for keeping best checkpoints, e.g., recent success rate
+    def saveNetworkKeras(self, START_TIME_STR, epi_counter, global_step, writer = None, metric = None):
         print('-----------------------------------------')
         print("Saving network...")
         print('-----------------------------------------')
+        if writer is not None:
+            file_name = START_TIME_STR + "_e" + str(epi_counter) + "_gs" + str(global_step)
+            writer.saveCheckpoint(
+                [ 
+                    (file_name + '_actor.h5', snapshotModel(self.agent_actor.model_pa), 'checkpoint_actor.txt'),
+                    (file_name + '_critic.h5', snapshotModel(self.agent_critic.model_val), 'checkpoint_critic.txt')
+                ],
+                { 'run' : START_TIME_STR, 'episode' : epi_counter, 'global_step' : global_step, 'eps' : self.eps, 'course_eps' : self.course_eps, 'metric' : metric }
+            )
+            return
+
         if not os.path.exists('./a2c-checkpoints-vehicle'):
             os.makedirs('./a2c-checkpoints-vehicle')
         # self.agent_train.model.save_weights('./checkpoints-vehicle/' + START_TIME_STR + "_e" + str(epi_counter) + "_gs" + str(global_step) + '.h5', overwrite=True)
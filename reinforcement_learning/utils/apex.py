@@ -0,0 +1,300 @@
+#####################################
+# apex.py
+#
+# This file contains the distributed actor/learner training (Ape-X style) for dqn_bullet.
+# Several actor processes, each with its own env_py and a local copy of QAgent, generate experiences at different eps.
+# A single learner process holds the prioritized replay memory and trains with dqn.trainOneStep, updating the priorities of sampled experiences.
+# Everything runs on a single host. Experiences and weights are exchanged with multiprocessing queues.
+#####################################
+import copy
+import multiprocessing as mp
+import queue
+import random
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from utils.checkpoint_writer import checkpoint_writer
+from utils.env_py import env_py
+from utils.q_algorithm import dqn
+from utils.rl_dqn import QAgent
+from utils.scene_constants_pb import scene_constants
+from utils.utils_data import data_pack
+
+
+# Get eps of each actor. eps_i = APEX_EPS^(1 + i/(N-1)*APEX_ALPHA) as in the Ape-X paper
+# Input
+#   options
+#   actor_id : 0 ~ APEX_ACTORS-1
+# Output
+#   eps of the actor
+def getActorEps( options, actor_id ):
+    if options.APEX_ACTORS == 1:
+        return options.APEX_EPS
+
+    return options.APEX_EPS ** (1 + actor_id/(options.APEX_ACTORS - 1)*options.APEX_ALPHA)
+
+# Put item into the queue while checking whether training has stopped
+# Output
+#   True/False : True if item was put into the queue
+def putUntilStop( target_queue, item, stop_event ):
+    while not stop_event.is_set():
+        try:
+            target_queue.put( item, timeout = 1.0 )
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+# Replace the content of weight queue with the newest weights
+# Input
+#   weight_queues : list of queue, one for each actor
+#   weights       : weights of the training network
+#   course_eps    : current course eps of the learner
+def broadcastWeights( weight_queues, weights, course_eps ):
+    for weight_queue in weight_queues:
+        # Remove stale weights which are not used by the actor yet
+        try:
+            weight_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            weight_queue.put_nowait( (weights, course_eps) )
+        except queue.Full:
+            pass
+
+    return
+
+# Actor process
+# Input
+#   actor_id     : index of the actor
+#   options      : options from the parser
+#   actor_eps    : probability of random action for this actor
+#   exp_queue    : queue to send (actor_id, experiences, abs_errors, episodes) to the learner
+#   weight_queue : queue to receive (weights, course_eps) from the learner
+#   stop_event   : set by the learner when training is over
+def apexActor( actor_id, options, actor_eps, exp_queue, weight_queue, stop_event ):
+    # Actors only use CPU
+    tf.keras.backend.set_session( tf.Session( config = tf.ConfigProto( device_count = {'GPU' : 0} ) ) )
+
+    # Different seed for each actor
+    np.random.seed( options.SEED + actor_id + 1 )
+    random.seed( options.SEED + actor_id + 1 )
+    tf.set_random_seed( options.SEED + actor_id + 1 )
+
+    # Actors never draw. Skip figures and model summaries
+    options.HEADLESS = True
+
+    # Start Environment
+    sim_env = env_py( options, scene_constants() )
+    sim_env.scene_const.clientID, _ = sim_env.start()
+    scene_const = sim_env.scene_const
+
+    # Local network
+    agent = QAgent( options, scene_const, 'Actor_' + str(actor_id) )
+    course_eps = options.INIT_EPS
+
+    # Initialize Scene
+    sim_env.initScene( list(range(0,options.VEH_COUNT)), True )
+    sim_env.updateObservation( range(0,options.VEH_COUNT) )
+
+    while not stop_event.is_set():
+        # Use newest weights if available
+        try:
+            weights, course_eps = weight_queue.get_nowait()
+            agent.model_qa.set_weights( weights )
+        except queue.Empty:
+            pass
+
+        ####
+        # Find & Apply Action
+        ####
+        _, _, obs_sensor_stack, obs_goal_stack = sim_env.getObservation( old = False )
+
+        # Q-values of current state. Used for both action & priority
+        q_curr = agent.model_q_all.predict_on_batch(
+                                            {
+                                                'observation_sensor_k' : obs_sensor_stack[:,0:scene_const.sensor_count,:],
+                                                'observation_state'    : obs_sensor_stack[:,scene_const.sensor_count:,:],
+                                                'observation_goal_k'   : obs_goal_stack
+                                            }
+        )
+
+        # eps-greedy for each vehicle
+        action_stack_k  = np.argmax( q_curr, axis = 1 )
+        random_mask     = np.random.random( options.VEH_COUNT ) <= actor_eps
+        action_stack_k[random_mask] = np.random.randint( options.ACTION_DIM, size = np.count_nonzero(random_mask) )
+
+        # Same mapping as dqn.getOptimalAction
+        targetSteer_k = scene_const.max_steer - action_stack_k * abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1)
+
+        sim_env.applyAction( targetSteer_k )
+
+        ####
+        # Step
+        ####
+        sim_env.step()
+        sim_env.updateObservation( range(0,options.VEH_COUNT), add_noise = options.ADD_NOISE )
+
+        ####
+        # Get Next State & Rewards
+        ####
+        next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = sim_env.getObservation( frame = -1 )
+        reward_stack, veh_status, epi_done, epi_sucess = sim_env.getRewards( next_dDistance, next_veh_pos, next_gInfo, next_veh_heading )
+
+        _, _, observation_sensor, observation_goal            = sim_env.getObservation( old = True )
+        _, _, next_observation_sensor, next_observation_goal  = sim_env.getObservation( old = False )
+
+        # Initial priority computed with local network
+        q_next = agent.model_q_all.predict_on_batch(
+                                            {
+                                                'observation_sensor_k' : next_observation_sensor[:,0:scene_const.sensor_count,:],
+                                                'observation_state'    : next_observation_sensor[:,scene_const.sensor_count:,:],
+                                                'observation_goal_k'   : next_observation_goal
+                                            }
+        )
+        q_target   = reward_stack + options.GAMMA * np.max( q_next, axis = 1 ) * (1 - epi_done)
+        abs_errors = np.abs( q_target - q_curr[np.arange(options.VEH_COUNT), action_stack_k] )
+
+        experiences = [ (observation_sensor[v], observation_goal[v], action_stack_k[v], reward_stack[v], next_observation_sensor[v], next_observation_goal[v], epi_done[v]) for v in range(0,options.VEH_COUNT) ]
+
+        # Finished episodes : (reward, success, step)
+        reset_veh_list = [ v for v in range(0,options.VEH_COUNT) if veh_status[v] != scene_const.EVENT_FINE ]
+        episodes = [ (sim_env.epi_reward_stack[v], epi_sucess[v], int(sim_env.epi_step_stack[v])) for v in reset_veh_list ]
+
+        if putUntilStop( exp_queue, (actor_id, experiences, abs_errors, episodes), stop_event ) == False:
+            break
+
+        # Reset finished vehicles
+        sim_env.initScene( reset_veh_list, True, course_eps )
+        sim_env.resetRewards( veh_status )
+
+    sim_env.end()
+    return
+
+# Learner. Starts the actors, and train the network with experiences from actors
+# Input
+#   options
+#   START_TIME_STR : string of starting time
+# Output
+#   data_package : data_pack of the training
+def runApex( options, START_TIME_STR ):
+    # Learner uses prioritized replay
+    options.enable_PER = True
+
+    # Actors never draw
+    actor_options = copy.copy( options )
+    actor_options.enable_GUI = False
+    actor_options.DRAW       = False
+
+    # Learner. env_py is not started, and only provides options and scene_const to dqn
+    learner_env   = env_py( options, scene_constants() )
+    q_algo        = dqn( learner_env, options.INIT_EPS, load = True )
+    data_package  = data_pack( START_TIME_STR, running_avg = options.RUNNING_AVG_STEP )
+
+    # Background writer for checkpoints
+    ckpt_writer = None
+    if options.ASYNC_SAVE == True and options.NO_SAVE == False:
+        ckpt_writer = checkpoint_writer( './checkpoints-vehicle', START_TIME_STR, options.KEEP_LAST, options.KEEP_BEST )
+
+    # Queues. TF must not be forked, hence use spawn
+    ctx           = mp.get_context('spawn')
+    stop_event    = ctx.Event()
+    exp_queue     = ctx.Queue( maxsize = options.APEX_QUEUE )
+    weight_queues = [ ctx.Queue( maxsize = 1 ) for _ in range(0,options.APEX_ACTORS) ]
+    actor_eps     = [ getActorEps( options, i ) for i in range(0,options.APEX_ACTORS) ]
+
+    print('======================================================')
+    print('Starting ' + str(options.APEX_ACTORS) + ' actors with eps : ' + str(actor_eps))
+    print('======================================================')
+
+    broadcastWeights( weight_queues, q_algo.agent_train.model_qa.get_weights(), q_algo.course_eps )
+
+    actors = []
+    for i in range(0,options.APEX_ACTORS):
+        actor = ctx.Process( target = apexActor, args = (i, actor_options, actor_eps[i], exp_queue, weight_queues[i], stop_event), daemon = True )
+        actor.start()
+        actors.append( actor )
+
+    # Learner loop
+    global_step     = 0
+    train_step      = 0
+    epi_counter     = 0
+    last_saved_epi  = 0
+    while epi_counter <= options.MAX_EPISODE:
+        try:
+            actor_id, experiences, abs_errors, episodes = exp_queue.get( timeout = 1.0 )
+        except queue.Empty:
+            if not any( actor.is_alive() for actor in actors ):
+                raise RuntimeError('All actors have stopped')
+            continue
+
+        # Save new memory with priority from the actor
+        for experience, abs_error in zip( experiences, abs_errors ):
+            q_algo.replay_memory.store( experience, abs_error = abs_error )
+
+        global_step += len(experiences)
+
+        if global_step >= options.MAX_EXPERIENCE:
+            epi_counter += len(episodes)
+
+            # Train
+            for _ in range(0,options.APEX_TRAIN_STEP):
+                loss_k, _, _, _, _, _ = q_algo.trainOneStep( update_priority = True )
+                data_package.add_loss( loss_k )
+                train_step += 1
+
+                # Send new weights to actors
+                if train_step % options.APEX_SYNC_STEP == 0:
+                    broadcastWeights( weight_queues, q_algo.agent_train.model_qa.get_weights(), q_algo.course_eps )
+
+        q_algo.updateMiscellaneous( global_step )
+
+        # Update data
+        for epi_reward, epi_sucess, epi_step in episodes:
+            print('========')
+            print('Actor #:', actor_id)
+            print('\tGlobal Step     : ' + str(global_step))
+            print('\tActor EPS       : ' + str(actor_eps[actor_id]))
+            print('\tCourse EPS      : ' + str(q_algo.course_eps))
+            print('\tEpisode #       : ' + str(epi_counter) + ' / ' + str(options.MAX_EPISODE) )
+            print('\tStep            : ' + str(epi_step) )
+            print('\tEpisode Reward  : ' + str(epi_reward))
+            print('\tLast Loss       : ',data_package.avg_loss[-1])
+            print('\tReward (EMA)    : ' + str(data_package.reward_ema.mean))
+            print('\tSuccess (EMA)   : ' + str(data_package.success_rate_ema.mean))
+            print('========')
+            print('')
+
+            data_package.add_reward( epi_reward )
+            data_package.add_eps( actor_eps[actor_id] )
+            data_package.add_success_rate( epi_sucess )
+
+        # save progress
+        if options.NO_SAVE == False and epi_counter - last_saved_epi >= options.SAVER_RATE:
+            q_algo.saveNetworkKeras(START_TIME_STR, epi_counter, global_step, writer = ckpt_writer, metric = data_package.get_success_rate(options.RUNNING_AVG_STEP))
+            data_package.save_reward()
+            data_package.save_loss()
+            last_saved_epi = epi_counter
+
+    # Stop actors. Drain the queue so that no actor is blocked on put
+    stop_event.set()
+    deadline = time.time() + 30
+    while any( actor.is_alive() for actor in actors ) and time.time() < deadline:
+        try:
+            exp_queue.get( timeout = 0.1 )
+        except queue.Empty:
+            pass
+
+    for actor in actors:
+        if actor.is_alive():
+            actor.terminate()
+        actor.join()
+
+    if ckpt_writer is not None:
+        ckpt_writer.close()
+
+    return data_package
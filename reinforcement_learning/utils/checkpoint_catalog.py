@@ -0,0 +1,259 @@
+#####################################
+# checkpoint_catalog.py
+#
+# This file contains the class for the catalog of checkpoint files.
+# Run, episode and global step of each weight file are parsed from its name, e.g., 2019-11-06_10_27_54.965185_e5000_gs216612.h5,
+# and metrics are taken from checkpoint_index.json written by checkpoint_writer.
+# Everything is stored in a small SQLite DB so that picking a checkpoint does not require a directory crawl.
+# The DB is updated incrementally : directories whose mtime did not change are skipped without being listed.
+# The journal is kept in memory so that updating the DB, usually stored in the scanned directory, does not change its mtime.
+#
+# Usage
+#   python -m utils.checkpoint_catalog ./model_weights                 : list all checkpoints
+#   python -m utils.checkpoint_catalog ./model_weights best            : checkpoint with best metric
+#   python -m utils.checkpoint_catalog ./model_weights gs=200000       : checkpoint nearest to global step 200000
+#####################################
+import json
+import os
+import re
+import sqlite3
+import sys
+
+# run, episode, global step and a2c network kind
+FILE_PATTERN = re.compile( r'^(.+)_e(\d+)_gs(\d+)(_actor|_critic)?\.h5$' )
+
+# Kind of checkpoint file
+KIND_DQN    = 'dqn'
+KIND_ACTOR  = 'actor'
+KIND_CRITIC = 'critic'
+
+
+# Parse file name of a checkpoint
+# Output
+#   (run, episode, global_step, kind), or None if file is not a checkpoint
+def parseFileName( file_name ):
+    match = FILE_PATTERN.match( file_name )
+    if match is None:
+        return None
+
+    kind = KIND_DQN if match.group(4) is None else match.group(4)[1:]
+    return match.group(1), int(match.group(2)), int(match.group(3)), kind
+
+
+class checkpoint_catalog:
+    # Input
+    #   db_path : path of the SQLite DB. Created if it does not exist
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db      = sqlite3.connect( db_path )
+        self.db.row_factory = sqlite3.Row
+
+        # Rollback journal file would be created and removed next to the DB on every commit, changing mtime of the scanned directory.
+        # The catalog can always be rebuilt from the checkpoint files, hence no need for a durable journal
+        self.db.execute( 'PRAGMA journal_mode = MEMORY' )
+
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                path        TEXT PRIMARY KEY,
+                dir         TEXT NOT NULL,
+                run         TEXT NOT NULL,
+                episode     INTEGER NOT NULL,
+                global_step INTEGER NOT NULL,
+                kind        TEXT NOT NULL,
+                mtime       REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS metrics (
+                path        TEXT NOT NULL,
+                name        TEXT NOT NULL,
+                value       REAL,
+                PRIMARY KEY (path, name)
+            );
+            CREATE TABLE IF NOT EXISTS scanned_dirs (
+                dir         TEXT PRIMARY KEY,
+                mtime       REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sub_dirs (
+                parent      TEXT NOT NULL,
+                dir         TEXT NOT NULL,
+                PRIMARY KEY (parent, dir)
+            );
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_gs ON checkpoints (kind, global_step);
+        ''')
+
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    # Update the catalog with checkpoints under root_dir
+    # Input
+    #   root_dir : directory to scan. Sub-directories are also scanned
+    #   force    : if True, scan directories even if their mtime did not change
+    # Output
+    #   number of directories scanned
+    def scan(self, root_dir, force = False):
+        scanned = 0
+        pending = [ os.path.abspath(root_dir) ]
+        while len(pending) > 0:
+            dir_path = pending.pop()
+            dir_mtime = os.stat( dir_path ).st_mtime
+
+            # Unchanged mtime means no entry was added, removed or renamed, hence sub-directories are taken from the DB
+            row = self.db.execute( 'SELECT mtime FROM scanned_dirs WHERE dir = ?', (dir_path,) ).fetchone()
+            if force == False and row is not None and row['mtime'] == dir_mtime:
+                pending += [ sub['dir'] for sub in self.db.execute( 'SELECT dir FROM sub_dirs WHERE parent = ?', (dir_path,) ) ]
+                continue
+
+            entries  = list( os.scandir( dir_path ) )
+            sub_dirs = [ entry.path for entry in entries if entry.is_dir() ]
+            pending += sub_dirs
+
+            self.__scanDir( dir_path, entries )
+            self.db.execute( 'DELETE FROM sub_dirs WHERE parent = ?', (dir_path,) )
+            self.db.executemany( 'INSERT INTO sub_dirs (parent, dir) VALUES (?, ?)', [ (dir_path, sub_dir) for sub_dir in sub_dirs ] )
+            self.db.execute( 'INSERT OR REPLACE INTO scanned_dirs (dir, mtime) VALUES (?, ?)', (dir_path, dir_mtime) )
+            scanned += 1
+
+        self.db.commit()
+        return scanned
+
+    def __scanDir(self, dir_path, entries):
+        known = set( row['path'] for row in self.db.execute( 'SELECT path FROM checkpoints WHERE dir = ?', (dir_path,) ) )
+        found = set()
+
+        rows = []
+        for entry in entries:
+            if not entry.is_file():
+                continue
+
+            parsed = parseFileName( entry.name )
+            if parsed is None:
+                continue
+
+            found.add( entry.path )
+            if entry.path not in known:
+                run, episode, global_step, kind = parsed
+                rows.append( (entry.path, dir_path, run, episode, global_step, kind, entry.stat().st_mtime) )
+
+        self.db.executemany( 'INSERT INTO checkpoints (path, dir, run, episode, global_step, kind, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)', rows )
+
+        # Removed files, e.g., by retention of checkpoint_writer
+        removed = [ (path,) for path in known - found ]
+        self.db.executemany( 'DELETE FROM checkpoints WHERE path = ?', removed )
+        self.db.executemany( 'DELETE FROM metrics WHERE path = ?', removed )
+
+        # Metrics from checkpoint_writer
+        index_path = os.path.join( dir_path, 'checkpoint_index.json' )
+        if os.path.isfile( index_path ):
+            with open( index_path ) as index_file:
+                index = json.load( index_file )
+
+            for meta in index:
+                for file_name in meta['files']:
+                    self.setMetric( os.path.join( dir_path, file_name ), 'metric', meta.get('metric'), commit = False )
+
+        return
+
+    # Set metric of a checkpoint, e.g., success rate from evaluation
+    def setMetric(self, path, name, value, commit = True):
+        self.db.execute( 'INSERT OR REPLACE INTO metrics (path, name, value) VALUES (?, ?, ?)', (os.path.abspath(path), name, value) )
+        if commit == True:
+            self.db.commit()
+        return
+
+    # Build WHERE clause
+    def __where(self, kind, run, dir_path):
+        clause = 'c.kind = ?'
+        args   = [ kind ]
+        if run is not None:
+            clause += ' AND c.run = ?'
+            args.append( run )
+        if dir_path is not None:
+            clause += ' AND c.dir = ?'
+            args.append( os.path.abspath(dir_path) )
+
+        return clause, args
+
+    # Latest checkpoint of the latest run. Run names are START_TIME_STR, hence sorted by time
+    # Output
+    #   row of the checkpoint, or None
+    def latest(self, kind = KIND_DQN, run = None, dir_path = None):
+        clause, args = self.__where( kind, run, dir_path )
+        return self.db.execute( 'SELECT c.* FROM checkpoints c WHERE ' + clause + ' ORDER BY c.run DESC, c.global_step DESC LIMIT 1', args ).fetchone()
+
+    # Checkpoint with the highest metric
+    def best(self, metric = 'metric', kind = KIND_DQN, run = None, dir_path = None):
+        clause, args = self.__where( kind, run, dir_path )
+        return self.db.execute( 'SELECT c.*, m.value AS value FROM checkpoints c JOIN metrics m ON m.path = c.path WHERE m.name = ? AND m.value IS NOT NULL AND ' + clause + ' ORDER BY m.value DESC, c.global_step DESC LIMIT 1', [ metric ] + args ).fetchone()
+
+    # Checkpoint with global step nearest to global_step
+    def nearest(self, global_step, kind = KIND_DQN, run = None, dir_path = None):
+        clause, args = self.__where( kind, run, dir_path )
+        return self.db.execute( 'SELECT c.* FROM checkpoints c WHERE ' + clause + ' ORDER BY ABS(c.global_step - ?), c.run DESC LIMIT 1', args + [ global_step ] ).fetchone()
+
+    # All checkpoints ordered by run and global step
+    def listAll(self, kind = None):
+        if kind is None:
+            return self.db.execute( 'SELECT * FROM checkpoints ORDER BY run, global_step, kind' ).fetchall()
+        return self.db.execute( 'SELECT * FROM checkpoints WHERE kind = ? ORDER BY run, global_step', (kind,) ).fetchall()
+
+    # Resolve query string
+    # Input
+    #   query : 'latest', 'best', 'best:<metric name>', 'gs=<global step>'. Add '@<run>' to restrict to a run, e.g., 'best@2019-11-06_10_27_54.965185'
+    # Output
+    #   row of the checkpoint, or None
+    def query(self, query, kind = KIND_DQN):
+        run = None
+        if '@' in query:
+            query, run = query.split('@', 1)
+
+        if query == 'latest':
+            return self.latest( kind = kind, run = run )
+        elif query == 'best':
+            return self.best( kind = kind, run = run )
+        elif query.startswith('best:'):
+            return self.best( metric = query[len('best:'):], kind = kind, run = run )
+        elif query.startswith('gs='):
+            return self.nearest( int(query[len('gs='):]), kind = kind, run = run )
+
+        raise ValueError('Unknown checkpoint query : ' + query)
+
+
+# Find path of a checkpoint with the query. The catalog is stored in root_dir and updated before the query
+# Input
+#   root_dir : directory of checkpoints
+#   query    : see checkpoint_catalog.query
+#   kind     : KIND_DQN, KIND_ACTOR or KIND_CRITIC
+# Output
+#   path of the checkpoint, or None
+def findCheckpoint( root_dir, query, kind = KIND_DQN ):
+    if not os.path.isdir( root_dir ):
+        return None
+
+    catalog = checkpoint_catalog( os.path.join( root_dir, 'checkpoint_catalog.db' ) )
+    catalog.scan( root_dir )
+    row = catalog.query( query, kind )
+    catalog.close()
+
+    return None if row is None else row['path']
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage : python -m utils.checkpoint_catalog <checkpoint dir> [query]')
+        sys.exit(1)
+
+    root_dir = sys.argv[1]
+    catalog  = checkpoint_catalog( os.path.join( root_dir, 'checkpoint_catalog.db' ) )
+    print('Scanned ' + str(catalog.scan( root_dir )) + ' directories')
+
+    if len(sys.argv) < 3:
+        rows = catalog.listAll()
+    else:
+        rows = [ row for row in [ catalog.query( sys.argv[2] ) ] if row is not None ]
+
+    for row in rows:
+        print('{:>8} {:>10} {:>7}  {}'.format( row['episode'], row['global_step'], row['kind'], row['path'] ))
+
+    catalog.close()
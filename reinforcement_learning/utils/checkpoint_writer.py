@@ -0,0 +1,211 @@
+#####################################
+# checkpoint_writer.py
+#
+# This file contains the class for writing checkpoints in a background thread.
+# Weights are copied into memory on the training thread, and written to the disk by the writer thread.
+# Each file is first written to a temporary file and renamed, so that partially written checkpoint is never visible.
+# Metadata of retained checkpoints is stored in checkpoint_index.json. Retention only applies to checkpoints of the current run
+#####################################
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import h5py
+import tensorflow as tf
+
+
+# Copy the weights of keras model into memory
+# Weights of all layers are read with a single session call
+# Output
+#   snapshot : list of (layer name, list of weight names, list of numpy arrays) for each layer
+def snapshotModel( model ):
+    layer_weights = []
+    for layer in model.layers:
+        layer_weights += layer.weights
+
+    values = tf.keras.backend.batch_get_value( layer_weights )
+
+    snapshot = []
+    counter  = 0
+    for layer in model.layers:
+        weight_count = len(layer.weights)
+        snapshot.append( (layer.name, [w.name for w in layer.weights], values[counter:counter + weight_count]) )
+        counter = counter + weight_count
+
+    return snapshot
+
+# Write snapshot into hdf5 file with the same layout as keras save_weights. Can be loaded with model.load_weights
+# Input
+#   file_path : path of the hdf5 file
+#   snapshot  : output of snapshotModel
+def writeSnapshot( file_path, snapshot ):
+    with h5py.File( file_path, 'w' ) as f:
+        f.attrs['layer_names']   = [ name.encode('utf8') for name, _, _ in snapshot ]
+        f.attrs['backend']       = tf.keras.backend.backend().encode('utf8')
+        f.attrs['keras_version'] = str(tf.keras.__version__).encode('utf8')
+
+        for layer_name, weight_names, weight_values in snapshot:
+            group = f.create_group( layer_name )
+            group.attrs['weight_names'] = [ name.encode('utf8') for name in weight_names ]
+            for name, value in zip( weight_names, weight_values ):
+                dataset = group.create_dataset( name, value.shape, dtype = value.dtype )
+                if not value.shape:
+                    dataset[()] = value
+                else:
+                    dataset[:] = value
+
+    return
+
+
+class checkpoint_writer:
+    # Input
+    #   save_dir   : directory of checkpoints
+    #   run        : name of the current run, i.e., START_TIME_STR. Checkpoints of other runs are never removed
+    #   keep_last  : number of latest checkpoints to keep. 0 means keep all
+    #   keep_best  : number of checkpoints with highest metric to keep
+    def __init__(self, save_dir, run, keep_last = 0, keep_best = 0):
+        self.save_dir   = save_dir
+        self.run        = run
+        self.keep_last  = keep_last
+        self.keep_best  = keep_best
+        self.index_path = os.path.join( save_dir, 'checkpoint_index.json' )
+
+        if not os.path.exists( save_dir ):
+            os.makedirs( save_dir )
+
+        # Entries of retained checkpoints, including other runs. Oldest first
+        self.entries = []
+        if os.path.isfile( self.index_path ):
+            with open( self.index_path ) as index_file:
+                self.entries = json.load( index_file )
+
+        # Writer thread
+        self.job_queue = queue.Queue()
+        self.thread    = threading.Thread( target = self.__run, daemon = True )
+        self.thread.start()
+
+        return
+
+    # Save checkpoint in background
+    # Input
+    #   files : list of (file name, snapshot, checkpoint list file name). File names are relative to save_dir
+    #   meta  : dictionary of metadata, e.g., episode, global_step, eps, course_eps and metric
+    def saveCheckpoint(self, files, meta):
+        self.job_queue.put( (self.__writeCheckpoint, (files, meta)) )
+        return
+
+    # Wait until all submitted jobs are written
+    def flush(self):
+        self.job_queue.join()
+        return
+
+    # Write remaining jobs and stop the thread
+    def close(self):
+        self.job_queue.put( None )
+        self.thread.join()
+        return
+
+    def __run(self):
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                self.job_queue.task_done()
+                return
+
+            func, args = job
+            try:
+                func( *args )
+            except Exception as e:
+                print('-----------------------------------------')
+                print('Checkpoint writer failed : ' + str(e))
+                print('-----------------------------------------')
+            self.job_queue.task_done()
+
+    # Write to temporary file and rename
+    def __atomicWrite(self, file_path, write_func):
+        tmp_path = file_path + '.tmp'
+        write_func( tmp_path )
+        os.replace( tmp_path, file_path )
+        return
+
+    def __writeCheckpoint(self, files, meta):
+        start_time = time.time()
+
+        # Weights
+        for file_name, snapshot, _ in files:
+            self.__atomicWrite( os.path.join( self.save_dir, file_name ), lambda tmp_path: writeSnapshot( tmp_path, snapshot ) )
+
+        # Update retained checkpoints
+        entry = dict( meta )
+        entry['files']      = [ file_name for file_name, _, _ in files ]
+        entry['lists']      = [ list_name for _, _, list_name in files ]
+        entry['save_time']  = time.time()
+        self.entries.append( entry )
+
+        removed = self.__applyRetention()
+        for removed_entry in removed:
+            for file_name in removed_entry['files']:
+                file_path = os.path.join( self.save_dir, file_name )
+                if os.path.isfile( file_path ):
+                    os.remove( file_path )
+
+        # Index file
+        def write_index( tmp_path ):
+            with open( tmp_path, 'w' ) as index_file:
+                json.dump( self.entries, index_file, indent = 1 )
+
+        self.__atomicWrite( self.index_path, write_index )
+
+        # Checkpoint list read by loadNetwork. Newest file on the last line
+        removed_files = set( file_name for removed_entry in removed for file_name in removed_entry['files'] )
+        for file_name, _, list_name in files:
+            self.__updateList( list_name, file_name, removed_files )
+
+        print('Checkpoint written in ' + str(round(time.time() - start_time,3)) + 's : ' + str(entry['files']))
+        return
+
+    # Remove old entries of the current run from self.entries
+    # Output
+    #   removed : list of removed entries
+    def __applyRetention(self):
+        if self.keep_last == 0 and self.keep_best == 0:
+            return []
+
+        # Indices of entries of the current run. Oldest first
+        run_idx = [ i for i, entry in enumerate(self.entries) if entry.get('run') == self.run ]
+
+        keep = set( i for i in range(len(self.entries)) if i not in run_idx )
+        if self.keep_last > 0:
+            keep.update( run_idx[ max(0, len(run_idx) - self.keep_last): ] )
+        if self.keep_best > 0:
+            # Missing or nan metric, e.g., success rate of empty window, is ranked last
+            metric = {}
+            for i in run_idx:
+                value = self.entries[i].get('metric')
+                metric[i] = float('-inf') if value is None or math.isnan(value) else value
+            ranked = sorted( run_idx, key = lambda i: metric[i], reverse = True )
+            keep.update( ranked[0:self.keep_best] )
+
+        removed      = [ entry for i, entry in enumerate(self.entries) if i not in keep ]
+        self.entries = [ entry for i, entry in enumerate(self.entries) if i in keep ]
+        return removed
+
+    def __updateList(self, list_name, new_file, removed_files):
+        list_path = os.path.join( self.save_dir, list_name )
+        lines = []
+        if os.path.isfile( list_path ):
+            with open( list_path ) as check_file:
+                lines = [ line.rstrip() for line in check_file.readlines() ]
+
+        lines = [ line for line in lines if line != '' and line not in removed_files ]
+        lines.append( new_file )
+
+        def write_func( tmp_path ):
+            with open( tmp_path, 'w' ) as check_file:
+                check_file.write( '\n'.join(lines) + '\n' )
+
+        self.__atomicWrite( list_path, write_func )
+        return
@@ -4,13 +4,7 @@
 import os
 import sys
 import math
-import matplotlib
-import matplotlib.pyplot as plt
 import time
-from matplotlib.lines import Line2D
-
-from matplotlib.patches import Polygon
-from matplotlib.collections import PatchCollection
 from collections import deque
 
 import numpy as np
@@ -20,9 +14,14 @@ from icecream import ic
 
 from utils.utils_pb import (controlCamera, detectCollision, detectReachedGoal,
                             getObs, getVehicleState, initQueue, resetQueue)
-from utils.utils_pb_scene_2LC import (genScene, initScene_2LC, printRewards,
-                                      printSpdInfo, removeScene)
+from utils.utils_pb_scene_2LC import genScene, initScene_2LC, removeScene
 from utils.genTraj_script import genTrajectory
+from utils.kinematics_np import printRewards, printSpdInfo
+from utils.renderer import plot_renderer
+from utils.route_2LC import route_manager
+from utils.scenario_bank import SCENARIO_DTYPE, fillScenario
+from utils.scene_geometry_2LC import getWorldBounds
+from utils.spatial_grid import wall_grid
 
 # Add noise to the detection state
 # Input
@@ -102,6 +101,15 @@ class env_py:
         self.clientID        = []
         self.handle_dict     = []
 
+        # Spatial index of all walls, for python side geometry queries, e.g., wall_grid.getLidar
+        self.wall_grid       = wall_grid( getWorldBounds( scene_const, options ), options.VEH_COUNT*scene_const.wall_cnt )
+
+        # Route mode (ROUTE_LEN > 0). Created at start
+        self.route           = None
+
+        # Scenario of each test case (lane width, obstacle, start & goal offset). scene_const is never modified by resets
+        self.scenario        = np.zeros( options.VEH_COUNT, dtype = SCENARIO_DTYPE )
+
         # Momory for data frames
         # List of deque to store data
         self.sensor_queue       = []
@@ -132,10 +140,7 @@ class env_py:
         self.goal_pos            = np.empty((self.options.VEH_COUNT,2), dtype=float)                              # Goal position of each vehicle
 
         # Plotting related variables
-        self.fig = None
-        self.ax  = None
-        self.plot_counter = 0
-        self.ax_array = None
+        self.renderer = None
         self.veh_pos_x_plot = []
         self.veh_pos_y_plot = []
         return
@@ -194,23 +199,25 @@ class env_py:
             # 'obstacle'  : obs_handle
         }
 
+        fillScenario( self.scenario, self.scene_const, range(0,self.options.VEH_COUNT), False )
+
         # Load plane
         p.loadURDF(os.path.join(pybullet_data.getDataPath(), "plane100.urdf"), globalScaling=10)
 
         # Generate Scene and get handles
-        self.handle_dict, _ = genScene( self.scene_const, self.options, handle_dict, range(0,self.options.VEH_COUNT) )
+        self.handle_dict, _ = genScene( self.scene_const, self.options, handle_dict, range(0,self.options.VEH_COUNT), wall_grid = self.wall_grid, scenario = self.scenario )
 
+        # Route mode. Tees are replaced by streamed routes. wall_grid is not used
+        if self.options.ROUTE_LEN > 0:
+            removeScene( self.scene_const, self.options, range(0,self.options.VEH_COUNT), self.handle_dict )
+            self.route = route_manager( self.scene_const, self.options, self.options.ROUTE_LEN )
+            for v in range(0,self.options.VEH_COUNT):
+                self.route.resetRoute( v, self.handle_dict, self.scenario['lane_width'][v] )
 
-        # Figure for plotting
+
+        # Renderer process for plotting. matplotlib is only imported by the renderer, so that headless runs start fast
         if self.options.DRAW == True:
-            plt.ion()
-            plt.show()
-        # self.fig = plt.figure(num=0, figsize=(6,6))
-        self.fig, self.ax_array = plt.subplots(1,2, figsize=(8,12))
-        # self.ax  = self.ax_array[0]
-        # self.ax2  = self.fig.add_subplot(1,3,2)
-        # self.ax3  = self.fig.add_subplot(1,3,3)
-        # self.ax_array = [self.ax,self.ax2,self.ax3]
+            self.renderer = plot_renderer( ( [-0.5*self.scene_const.turn_len,0.5*self.scene_const.turn_len], [0,32] ) )
 
 
         print("Finished starting simulations.")
@@ -221,29 +228,48 @@ class env_py:
         for id in self.clientID:
             p.disconnect(id)
 
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
     # Initilize scene. Remove the scene, and regenerate again
     # Input
     # course_eps : course hardness. 0 - hard, 1- easy, determine where the vehicle starts and how far is the goal point
-    def initScene( self, veh_reset_list, randomize_input, course_eps = 0 ):
-        # Remove
-        removeScene( self.scene_const, self.options, veh_reset_list, self.handle_dict)
+    # scenario   : rows of scenario_bank.SCENARIO_DTYPE, one for each vehicle of veh_reset_list. None to sample randomly
+    def initScene( self, veh_reset_list, randomize_input, course_eps = 0, scenario = None ):
+        if scenario is not None:
+            if self.route is not None:
+                raise ValueError('Scenario bank is not supported in route mode')
+            randomize_input = True
 
-        # Randomize the lane width of each scene
-        if randomize_input == True:
-            self.scene_const.lane_width = np.random.random_sample()*(self.scene_const.MAX_LANE_WIDTH - self.scene_const.MIN_LANE_WIDTH) + self.scene_const.MIN_LANE_WIDTH
+        # Scenario of each test case. Randomized independently
+        fillScenario( self.scenario, self.scene_const, veh_reset_list, randomize_input, course_eps, scenario )
 
-        # Generate Scene
-        self.handle_dict, valid_dir = genScene( self.scene_const, self.options, self.handle_dict, veh_reset_list, genVehicle = False )
+        if self.route is None:
+            # Remove
+            removeScene( self.scene_const, self.options, veh_reset_list, self.handle_dict)
 
-        # Initilize position
-        direction, goal_pos_temp = initScene_2LC( self.scene_const, self.options, veh_reset_list, self.handle_dict, valid_dir, course_eps, randomize = randomize_input)               # initialize
+            # Generate Scene
+            self.handle_dict, valid_dir = genScene( self.scene_const, self.options, self.handle_dict, veh_reset_list, genVehicle = False, wall_grid = self.wall_grid, scenario = self.scenario )
+
+            # Initilize position
+            direction, goal_pos_temp = initScene_2LC( self.scene_const, self.options, veh_reset_list, self.handle_dict, valid_dir, course_eps, randomize = randomize_input, wall_grid = self.wall_grid, scenario = self.scenario )               # initialize
+        else:
+            # New route, and vehicle at the start of the route
+            for v in veh_reset_list:
+                self.route.resetRoute( v, self.handle_dict, self.scenario['lane_width'][v] )
+            direction, goal_pos_temp = initScene_2LC( self.scene_const, self.options, veh_reset_list, self.handle_dict, None, course_eps, randomize = False, scenario = self.scenario )
+            self.goal_pos[list(veh_reset_list)] = [ self.route.getGoalPos(v) for v in veh_reset_list ]
 
         # goal_pos_temp is zero if not updated, and nonzero if updated. Hence only change the goal_pos with new values
         if goal_pos_temp is not None: 
             # if none, then no update
             self.goal_pos[np.nonzero(goal_pos_temp)] = goal_pos_temp[np.nonzero(goal_pos_temp)]
 
-        # Reset the data queues
+        return self.__resetQueue( veh_reset_list, direction )
+
+    # Reset the data queues of the reset vehicles with their initial state
+    def __resetQueue( self, veh_reset_list, direction ):
         veh_pos_init, veh_heading_init, dDistance, gInfo = getVehicleState( self.scene_const, self.options, self.handle_dict )
         for v in range(0,self.options.VEH_COUNT):
             if v in veh_reset_list:
@@ -337,6 +363,11 @@ class env_py:
     # Output
     #   None
     def updateObservation( self, reset_veh_list, add_noise = True ):
+        # Stream route segments and move goal points before reading the state
+        if self.route is not None:
+            self.route.update( self.handle_dict )
+            self.goal_pos = np.array( [ self.route.getGoalPos(v) for v in range(0,self.options.VEH_COUNT) ] )
+
         next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = getVehicleState( self.scene_const, self.options, self.handle_dict)
 
         if add_noise == True:
@@ -467,17 +498,18 @@ class env_py:
         return
 
     # Plot visualization
-    # Given the handle to figures, it plots the position, heading and LIDAR information w.r.t. ground 
+    # Sends a snapshot of the position, heading and LIDAR information w.r.t. ground to the renderer process (renderer.py)
+    # If the renderer is behind, the frame is dropped before the prediction is computed
     # Inputs
     #   veh_idx : index of the vehicle
-    #   frame   : number of frames to plot. 0 means options.FRAME_COUNT
+    #   frame   : not used. Trajectory since the last reset is plotted
     #   save    : T/F, True means save figure
     #   predict : integer, number of prediction into the future. 0 means dont plot prediction
     # Outputs
     #   None
     def plotVehicle(self, veh_idx = 0, frame = 0, save = False, predict = 0, network_model = None, temp_data = None, temp_idx = None):
-        if frame == 0:
-            frame = self.options.FRAME_COUNT
+        if self.renderer is None:
+            raise ValueError('plotVehicle requires --DRAW')
 
         if predict < 0:
             ic(predict)
@@ -486,33 +518,10 @@ class env_py:
             if network_model == None:
                 raise ValueError('Must provide network to use prediction')
 
-        for axis in self.ax_array:
-            # Clear figure
-            axis.clear()
-
-            # Set limi
-            axis.set_xlim([-0.5*self.scene_const.turn_len,0.5*self.scene_const.turn_len])
-            axis.set_ylim([0,32])
-
-            # Set equl ratio
-            # axis.axis('equal')
-
-
-        #------------------------
-        # Plot Goal Position
-        #------------------------
-        for axis in self.ax_array:
-            axis.scatter(self.goal_pos[veh_idx][0], self.goal_pos[veh_idx][1], color='orange', marker='*', label='Goal Point')
-
         #------------------------
-        # Plot Vehicle. Stronger color means more recent position
+        # Vehicle Trajectory. Updated even if the frame is dropped
         #------------------------
 
-        # Color parameters
-        color_start = 0.2
-        color_end   = 1.0
-        color_delta = (color_end - color_start)/frame
-
         # Reset data
         if len(self.veh_pos_y_plot) > 0 and abs(self.veh_pos_y_plot[-1] - self.veh_pos_queue[veh_idx][-1][1]) > 1:
             self.veh_pos_x_plot = []
@@ -522,63 +531,36 @@ class env_py:
         self.veh_pos_x_plot.append( self.veh_pos_queue[veh_idx][-1][0])
         self.veh_pos_y_plot.append( self.veh_pos_queue[veh_idx][-1][1])
 
-        for axis in self.ax_array:
-            # Plot position and heading of last few frames
-            for i in range(0,frame):
-                # Saturate color
-                # veh_color = (1,0,0,color_start + i*color_delta)
-                veh_color = (0,0,0)
-
-                # Plot Position
-                # Add 1 to counter since we are saving 1 more data points (#0, #1, #2, #3, #4) when Frame is 5, with #4 being the latest data
-                axis.plot( self.veh_pos_x_plot, self.veh_pos_y_plot, color=veh_color, markersize = 2, marker='o' )
-
-                # Plot Heading of past data
-                veh_heading = self.veh_heading_queue[veh_idx][i+1][2]
-                # axis.quiver( self.veh_pos_queue[veh_idx][i+1][0], self.veh_pos_queue[veh_idx][i+1][1], np.sin(veh_heading), np.cos(veh_heading), color = veh_color)
+        if self.renderer.ready() == False:
+            self.renderer.drop()
+            return
 
         #------------------------
-        # Plot LIDAR Information 
+        # LIDAR Information
         #------------------------
-
-        # Some variables
-        radar_x = []
-        radar_y = []
         veh_x   = self.veh_pos_queue[veh_idx][-1][0]
         veh_y   = self.veh_pos_queue[veh_idx][-1][1]
         veh_heading = self.veh_heading_queue[veh_idx][-1][2]
         curr_state = self.sensor_queue[veh_idx][-1][0:self.scene_const.sensor_count]
         curr_detect = self.sensor_queue[veh_idx][-1][self.scene_const.sensor_count:]
 
-        # FIXME: radar x,y position not used
         radar_x, radar_y = getLidarXY( self.scene_const, curr_state, veh_heading)
 
-        # Place marker at LIDAR x,y  at figure 0
-        for i in range(0,self.scene_const.sensor_count):
-            if curr_detect[i] == 1:
-                marker_color = 'green'
-            else:
-                marker_color = 'red'
-
-            self.ax_array[0].scatter(radar_x[i] + veh_x,radar_y[i] + veh_y, marker='o', color=marker_color)
-
-        # Lines connecting detected points to each other
-        # self.ax.plot(radar_x,radar_y, color='red')
-
-        # Lines connecting point to vehicle  at figure 0
-        for i in range(0,self.scene_const.sensor_count):
-            if curr_detect[i] == 1:
-                line_color = (0,1,0,0.2)
-            else:
-                line_color = (1,0,0,0.2)
-            self.ax_array[0].plot([veh_x, veh_x + radar_x[i]],[veh_y, veh_y + radar_y[i]], color=line_color )
+        snapshot = {
+            'save'          : save,
+            'goal'          : np.array( self.goal_pos[veh_idx] ),
+            'traj'          : np.column_stack( (self.veh_pos_x_plot, self.veh_pos_y_plot) ),
+            'veh'           : np.array( [veh_x, veh_y] ),
+            'lidar'         : np.column_stack( (radar_x, radar_y) ),
+            'detect'        : np.array( curr_detect ),
+            'predict_pos'   : None,
+            'predict_lidar' : None,
+        }
 
         #----------------------------------
-        # Plot Prediction
+        # Prediction
         #----------------------------------
         if predict > 0:
-            # Obtain Prediction
-
             # put data into right format. Only get latest frames
             predict_state = np.array(self.sensor_queue)[veh_idx].T
             predict_state = np.expand_dims(predict_state[:,1:], 0)
@@ -604,126 +586,19 @@ class env_py:
                         debug = False
                     )
 
-            # FIXME: Temporary data
-            # traj_est, lidar_est, heading_est, lidar_x, lidar_y = genTrajectory(
-            #             self.options,           # option
-            #             self.scene_const,       # scene_const
-            #             np.array([[0,0]]),      # veh position, single vehicle, at origin
-            #             np.expand_dims(veh_heading,0), 
-            #             temp_data['sample_state_sensor'][temp_idx], 
-            #             temp_data['sample_state_goal'][temp_idx], 
-            #             network_model, 
-            #             predict,
-            #             debug = True
-            #         )
-
-
             if self.options.VERBOSE == True:
                 ic(traj_est, lidar_est, heading_est)
                 ic(traj_est.shape, lidar_est.shape, heading_est.shape)
                 print('--------------------------------------------------------')
 
-            predict_veh_x = traj_est[0,0,:]
-            predict_veh_y = traj_est[0,1,:]
-
-            # Color parameters
-            color_start = 1.0
-            color_end   = 0.2
-            color_delta = (color_start - color_end)/predict
-
-
-            # Plot position of estimation
-            for axis in [self.ax_array[1]]:
-                for i in range(0,predict):
-                    # Saturate color
-                    veh_color = (0,0,1,color_start - i*color_delta)
-
-                    # Plot estimated Position
-                    axis.scatter( veh_x + predict_veh_x[i], veh_y + predict_veh_y[i], color=veh_color )
-
-                    # Plot estimated Heading
-                    # self.ax.quiver( veh_x + predict_veh_x[i], veh_y + predict_veh_y[i], np.sin(heading_est[veh_idx,0,i]), np.cos(heading_est[veh_idx,0,i]), color = veh_color)
-
-            # Plot Predicted LIDAR Information
-            # lidar_est : VEH_COUNT x SENSOR_COUNT*2 X PREDICTION_STEP
-
-            # Color parameters
-            color_start = 1.0
-            color_end   = 0.2
-            color_delta = (color_start - color_end)/(predict-1)
-
-            # For each prediction, plot predicted lidar position
-            for i in range(0,predict,2):
-                # Get LIDAR x,y.
-                # FIXME: Why need -1 at heading 
-                radar_x, radar_y = getLidarXY(self.scene_const, lidar_est[veh_idx,0:self.scene_const.sensor_count,i], heading_est[veh_idx,0,i])
-
-                for j in range(0,self.scene_const.sensor_count):
-                    if lidar_est[veh_idx][self.scene_const.sensor_count + j][i] == 1:
-                        # Saturate color cian open
-                        marker_color = (0,1,1,color_start - i*color_delta)
-                    else:
-                        # Saturate color pink close
-                        marker_color = (1,0,1,color_start - i*color_delta)
-
-                    # self.ax_array[2].scatter(lidar_x[0,j,i] + veh_x + predict_veh_x[i], lidar_y[0,j,i] + veh_y + predict_veh_y[i], marker='x', color=marker_color)
-                    # self.ax.scatter(0 + veh_x + predict_veh_x[i], 0 + veh_y + predict_veh_y[i], marker='x', color=marker_color)
-
-            # Lines connecting predicted lidar x,y to predicted vehicle position
-            for p in range(0,predict,2):
-                for s in range(0,self.scene_const.sensor_count):
-                    if lidar_est[veh_idx,self.scene_const.sensor_count + s,p] == 1:
-                        # Open
-                        line_color = (0,1,0,0.2)
-                    else:
-                        # Close
-                        line_color = (1,0,0,0.2)
-
-                    # self.ax_array[2]([veh_x + predict_veh_x[p], veh_x + lidar_x[0,s,p]],[veh_y + predict_veh_y[p], veh_y + lidar_y[0,s,p]], color=line_color )
-
-            # Lines connecting lidar x,y to each other
-            for p in range(0,predict,2):
-                for s in range(0,self.scene_const.sensor_count+1):
-                    if s == 0:
-                        self.ax_array[1].plot([veh_x + predict_veh_x[p], veh_x + predict_veh_x[p] + lidar_x[0,s,p]],[veh_y + predict_veh_y[p], veh_y + predict_veh_y[p] + lidar_y[0,s,p]], color=line_color )
-                        pass
-                    elif s == self.scene_const.sensor_count:
-                        # First sensor or Last sensor, connect to vehicle position
-                        self.ax_array[1].plot([veh_x + predict_veh_x[p], veh_x + predict_veh_x[p] + lidar_x[0,s-1,p]],[veh_y + predict_veh_y[p], veh_y + predict_veh_y[p] + lidar_y[0,s-1,p]], color=line_color )
-                        pass
-                    else:
-                        # sensors in the middle connect to next one
-                        self.ax_array[1].plot([veh_x + predict_veh_x[p] + lidar_x[0,s-1,p], veh_x + predict_veh_x[p] + lidar_x[0,s,p]],[veh_y + predict_veh_y[p] + lidar_y[0,s-1,p], veh_y + predict_veh_y[p] + lidar_y[0,s,p]], color=line_color )
-                        pass
-
-
-            # Lidar as Polygon and using Fill
-            poly_color = (0,0,0,0.05)
-            for p in range(0,predict,2):
-                self.ax_array[1].fill(veh_x + predict_veh_x[p] + lidar_x[0,:,p], veh_y + predict_veh_y[p] + lidar_y[0,:,p], color = poly_color)
-
-        # Legends
-        legend_elements_1 = [
-            Line2D([0],[0], color='black', marker='o', markerfacecolor='black', markersize=5, lw=2, label='Vehicle Trajectory'),
-            Line2D([0],[0], color='orange', marker='*', markerfacecolor='orange', markersize=5, lw=0, label='Goal Point'),
-        ]
-        legend_elements_2 = [
-            Line2D([0],[0], color='red', lw=2, label='LIDAR Estimation'),
-            Line2D([0],[0], color='blue', marker='o', markerfacecolor='blue', markersize=5, lw=0, label='Prediction'),
-        ]
-        self.ax_array[0].legend(handles = legend_elements_1, loc='lower right')
-        self.ax_array[1].legend(handles = legend_elements_2, loc='lower left')
-
-        #----------------------------------
-        # Save the figure if enabled
-        #----------------------------------
-        if save == True:
-            self.fig.savefig('./image_dir/plot_' + str(self.plot_counter).zfill(4) + '.png', bbox_inches='tight')
-            self.plot_counter = self.plot_counter + 1
+            # Predicted positions, and predicted LIDAR of every other step
+            predict_pos = np.column_stack( (veh_x + traj_est[0,0,0:predict], veh_y + traj_est[0,1,0:predict]) )
+            snapshot['predict_pos']   = predict_pos
+            snapshot['predict_lidar'] = np.stack( [ predict_pos[p] + np.column_stack( (lidar_x[0,:,p], lidar_y[0,:,p]) ) for p in range(0,predict,2) ] )
 
+        self.renderer.submit( snapshot )
         return
 
-
     # # Get estimated position and heading of vehicle
     # def getVehicleEstimation(self, oldPosition, oldHeading, targetSteer_k):
     #     vLength = 2.1
@@ -0,0 +1,304 @@
+#####################################
+# env_surrogate.py
+#
+# This file contains a kinematic surrogate of env_py, which does not import PyBullet or TensorFlow.
+# Vehicles follow the bicycle model of kinematics_np.getVehicleEstimation, and the lidar is computed analytically
+# against the wall boxes of scene_geometry_2LC (lidar_np).
+# Observations have the same layout as env_py, hence it can be used to pre-train and fill the replay memory
+# with many more steps per second, before fine tuning in PyBullet.
+#
+# Differences to env_py
+#   - No vehicle dynamics. Steering is applied immediately and speed is constant.
+#   - Walls do not stop the vehicle. Episode ends by the lidar based collision detection as in env_py.
+#   - Events are only printed if VERBOSE.
+#   - plotVehicle & GUI are not supported.
+#####################################
+import numpy as np
+from icecream import ic
+
+from utils.kinematics_np import (getGoalEstimation, getVehicleEstimation,
+                                 printRewards, printSpdInfo)
+from utils.lidar_np import getLidar
+from utils.scenario_bank import SCENARIO_DTYPE, fillScenario
+from utils.scene_geometry_2LC import (OBS_RIGHT, TEE_WALL_COUNT, getGoalPos,
+                                      getObstacleBox, getTeeBoxes)
+
+# Velocity (m/s) per INIT_SPD. Same as printRewards
+VEL_SCALE       = 0.1
+
+# Approximate distance from the base of the vehicle to the lidar (link 8 of racecar.urdf) at veh_scale = 2, in metres
+LIDAR_OFFSET    = 0.5
+
+
+class env_np:
+    # Initializer
+    def __init__(self, options, scene_const):
+        # Basic vars
+        self.options         = options
+        self.scene_const     = scene_const
+        self.clientID        = []
+        self.handle_dict     = {}
+
+        veh_count   = self.options.VEH_COUNT
+        frame_count = self.options.FRAME_COUNT + 1
+
+        # Memory for data frames. [:,0] : oldest info, [:,-1] : latest info
+        self.sensor_queue       = np.zeros( (veh_count, frame_count, self.scene_const.sensor_count*2) )
+        self.goal_queue         = np.zeros( (veh_count, frame_count, 2) )
+        self.veh_pos_queue      = np.zeros( (veh_count, frame_count, 2) )
+        self.veh_heading_queue  = np.zeros( (veh_count, frame_count, 3) )
+
+        # State of vehicles. Heading : north = 0 rad, east = pi/2 rad. Steer : radians, +ve is right (same as getVehicleEstimation)
+        self.veh_pos            = np.zeros( (veh_count, 2) )
+        self.veh_heading        = np.zeros( veh_count )
+        self.veh_steer          = np.zeros( veh_count )
+
+        # Test case of each vehicle. Walls are [cx, cy, hx, hy], obstacle is the last wall
+        self.scenario           = np.zeros( veh_count, dtype = SCENARIO_DTYPE )
+        self.wall_box           = np.zeros( (veh_count, self.scene_const.wall_cnt, 4) )
+
+        # Memory related to rewards
+        self.epi_reward_stack    = np.zeros(self.options.VEH_COUNT)                              # Holds reward of current episode
+        self.epi_step_stack      = np.zeros(self.options.VEH_COUNT, dtype=int)                   # Count number of step for each vehicle in each episode
+
+        # Goal position for each testcase (VEH_COUNT x 2) [x1,y1;x2,y2]
+        self.goal_pos            = np.zeros((self.options.VEH_COUNT,2), dtype=float)
+        return
+
+    # Generate the scene
+    # Returns
+    #   clientid - empty list
+    #   handle_dict - empty dict. There is no PyBullet body
+    def start(self):
+        print('======================================================')
+        print("Starting Surrogate Simulation...")
+
+        if self.options.VEH_COUNT % self.options.X_COUNT != 0:
+            raise ValueError('VEH_COUNT=' + str(self.options.VEH_COUNT) + ' must be multiple of options.X_COUNT=' + str(self.options.X_COUNT))
+
+        veh_list = range(0,self.options.VEH_COUNT)
+        fillScenario( self.scenario, self.scene_const, veh_list, False )
+        self.__genScene( veh_list )
+        self.__initVehicle( veh_list, False )
+        self.__resetQueue( veh_list )
+
+        print("Finished starting simulations.")
+        print("=============================================")
+        return self.clientID, self.handle_dict
+
+    def end(self):
+        return
+
+    # Origin of the test case of each vehicle
+    def __getCaseOrigin(self, veh_index):
+        x_index = veh_index % self.options.X_COUNT
+        y_index = int(veh_index / self.options.X_COUNT)
+
+        return x_index * self.scene_const.case_x, y_index * self.scene_const.case_y
+
+    # Same as genScene. Walls follow the scenario of each vehicle, and the obstacle is placed on the right
+    def __genScene(self, veh_reset_list):
+        for v in veh_reset_list:
+            x_pos, y_pos = self.__getCaseOrigin(v)
+            lane_width   = self.scenario['lane_width'][v]
+
+            self.wall_box[v,0:TEE_WALL_COUNT]   = getTeeBoxes( self.scene_const, x_pos, y_pos, lane_width, self.scenario['valid_dir'][v] )
+            self.wall_box[v,TEE_WALL_COUNT]     = getObstacleBox( self.scene_const, x_pos, y_pos, lane_width, OBS_RIGHT )
+            self.goal_pos[v]                    = getGoalPos( self.scene_const, x_pos, y_pos, lane_width )
+
+        return
+
+    # Same as initScene_2LC. Reset position of vehicles, and place obstacle and goal point of the scenario if randomize is True
+    # Output
+    #   direction : 0/1/2: left/straight/right position of obstacle. -1 if not randomized
+    def __initVehicle(self, veh_reset_list, randomize):
+        direction = -1*np.ones(self.options.VEH_COUNT)
+
+        for v in veh_reset_list:
+            case_x, case_y = self.__getCaseOrigin(v)
+            scenario       = self.scenario[v]
+
+            if randomize == False:
+                self.veh_pos[v] = [ case_x, case_y + self.scene_const.veh_init_y ]
+            else:
+                self.veh_pos[v] = [ case_x + scenario['start_x'], case_y + self.scene_const.veh_init_y + scenario['start_y'] ]
+
+            self.veh_heading[v] = 0
+            self.veh_steer[v]   = 0
+
+            if randomize == True:
+                # Obstacle
+                direction[v] = scenario['obs_slot']
+                self.wall_box[v,TEE_WALL_COUNT] = getObstacleBox( self.scene_const, case_x, case_y, scenario['lane_width'], direction[v] )
+
+                # Goal point. Based on curriculum
+                self.goal_pos[v] = getGoalPos( self.scene_const, case_x, case_y, scenario['lane_width'], scenario['goal_x'] )
+
+        return direction
+
+    # Fill the data queues of the vehicles with the current state
+    def __resetQueue(self, veh_reset_list):
+        veh_reset_list = np.asarray( list(veh_reset_list), dtype = int )
+        veh_pos, veh_heading, dDistance, gInfo = self.getVehicleState()
+
+        self.sensor_queue[veh_reset_list]       = dDistance[veh_reset_list,np.newaxis]
+        self.goal_queue[veh_reset_list]         = gInfo[veh_reset_list,np.newaxis]
+        self.veh_pos_queue[veh_reset_list]      = veh_pos[veh_reset_list,np.newaxis]
+        self.veh_heading_queue[veh_reset_list]  = veh_heading[veh_reset_list,np.newaxis]
+        return
+
+    # Initilize scene. Same as env_py.initScene
+    # Input
+    # course_eps : course hardness. 0 - hard, 1- easy, determine where the vehicle starts and how far is the goal point
+    # scenario   : rows of scenario_bank.SCENARIO_DTYPE, one for each vehicle of veh_reset_list. None to sample randomly
+    def initScene( self, veh_reset_list, randomize_input, course_eps = 0, scenario = None ):
+        if len(veh_reset_list) == 0:
+            return self.handle_dict, self.scene_const, None
+
+        # Scenario of each test case. Randomized independently
+        if scenario is not None:
+            randomize_input = True
+        fillScenario( self.scenario, self.scene_const, veh_reset_list, randomize_input, course_eps, scenario )
+
+        self.__genScene( veh_reset_list )
+        direction = self.__initVehicle( veh_reset_list, randomize_input )
+        self.__resetQueue( veh_reset_list )
+
+        return self.handle_dict, self.scene_const, direction
+
+    # Lidar measurement. Rays are tested against the walls of the test case of each vehicle, see lidar_np
+    # Output
+    #   VEH_COUNT x sensor_count*2. Hit fraction (1 if no hit) and detection state (1 : open, 0 : hit)
+    def getSensorData(self):
+        ray_pos = self.veh_pos + LIDAR_OFFSET*np.stack( (np.sin(self.veh_heading), np.cos(self.veh_heading)), axis = -1 )
+
+        return getLidar( self.scene_const, self.wall_box, ray_pos, self.veh_heading )
+
+    # Same as utils_pb.getVehicleState
+    # Output
+    #   veh_pos : VEH_COUNT x 2, (x,y)
+    #   veh_heading : VEH_COUNT x 3, last column is heading. north = 0 rad, east = pi/2 rad
+    #   sensorData : VEH_COUNT x scene_const.sensor_count*2
+    #   gInfo : VEH_COUNT x 2, [goal_angle, goal_distance]
+    def getVehicleState(self):
+        veh_heading = np.zeros( (self.options.VEH_COUNT, 3) )
+        veh_heading[:,0:2] = np.pi*0.5
+        veh_heading[:,2]   = self.veh_heading
+
+        # getGoalEstimation takes the heading of the simulator, i.e., north is pi/2
+        gInfo = getGoalEstimation( self.options, self.scene_const, self.veh_pos, np.pi*0.5 - self.veh_heading, self.goal_pos )
+
+        return self.veh_pos.copy(), veh_heading, self.getSensorData(), gInfo
+
+    # Get Observation. Same as env_py.getObservation
+    # Output
+    #   sensor_out : [sensor_count , frame_count]
+    #   goal_out   : [2, frame_count] , first row is angle, second row is distance
+    def getObservation(self, old = False, verbosity = 0, frame = None):
+        if frame == None:
+            if old == True:
+                frame_slice = slice(0, self.options.FRAME_COUNT)
+            else:
+                frame_slice = slice(1, None)
+
+            sensor_out  = np.swapaxes( self.sensor_queue[:,frame_slice,:], 1, 2)
+            goal_out    = np.swapaxes( self.goal_queue[:,frame_slice,:], 1, 2)
+            pos_out     = np.swapaxes( self.veh_pos_queue[:,frame_slice,:], 1, 2)
+            head_out    = np.swapaxes( self.veh_heading_queue[:,frame_slice,:], 1, 2)
+        else:
+            sensor_out  = self.sensor_queue[:,frame,:]
+            goal_out    = self.goal_queue[:,frame,:]
+            pos_out     = self.veh_pos_queue[:,frame,:]
+            head_out    = self.veh_heading_queue[:,frame,:]
+
+        return pos_out.copy(), head_out.copy(), sensor_out.copy(), goal_out.copy()
+
+    # Update the observation queue
+    # Input
+    #   add_noise = T/F. If true, add noise
+    def updateObservation( self, reset_veh_list, add_noise = True ):
+        next_veh_pos, next_veh_heading, next_dDistance, next_gInfo = self.getVehicleState()
+
+        if add_noise == True:
+            # env_py imports pybullet, hence only imported when noise is used
+            from utils.env_py import addNoise
+            next_dDistance = addNoise( self.options, self.scene_const, next_dDistance )
+
+        # Shift queue
+        veh_list = np.asarray( list(reset_veh_list), dtype = int )
+        for queue, data in zip( (self.sensor_queue, self.goal_queue, self.veh_pos_queue, self.veh_heading_queue), (next_dDistance, next_gInfo, next_veh_pos, next_veh_heading) ):
+            queue[veh_list,0:-1] = queue[veh_list,1:]
+            queue[veh_list,-1]   = data[veh_list]
+
+        return
+
+    # Apply Action
+    # Inputs
+    # targetSteer : target angle in degrees, +ve is left
+    def applyAction(self, targetSteer):
+        self.veh_steer = -1*np.radians( np.asarray( targetSteer, dtype = float ) )
+        return
+
+    # Step through simulation. FIX_INPUT_STEP steps of 1/60s
+    def step(self):
+        self.veh_pos, self.veh_heading = getVehicleEstimation( self.options, self.veh_pos, self.veh_heading, self.veh_steer, vel = self.options.INIT_SPD*VEL_SCALE )
+
+        if self.options.manual == True:
+            input('Press Enter')
+
+        return
+
+    # Some info related the scenario
+    def printInfo(self):
+        printRewards(self.scene_const, self.options)
+        printSpdInfo(self.options)
+
+        return
+
+    # Given the observation, find rewards. Same as env_py.getRewards, computed for all vehicles at once
+    def getRewards(self, next_dDistance, next_veh_pos, next_gInfo, next_veh_heading ):
+        sensor_count = self.scene_const.sensor_count
+
+        # Collision if distance is short and sensor is closed
+        collided = np.any( (next_dDistance[:,0:sensor_count]*self.scene_const.sensor_distance < self.scene_const.collision_distance) & (next_dDistance[:,sensor_count:] == 0), axis = 1 )
+        reached  = ~collided & (np.abs(next_gInfo[:,1]*self.scene_const.goal_distance) < self.scene_const.detect_range)
+        over     = ~collided & ~reached & (self.epi_step_stack > self.options.MAX_TIMESTEP)
+
+        veh_status = np.full( self.options.VEH_COUNT, float(self.scene_const.EVENT_FINE) )
+        veh_status[collided] = self.scene_const.EVENT_COLLISION
+        veh_status[reached]  = self.scene_const.EVENT_GOAL
+        veh_status[over]     = self.scene_const.EVENT_OVER_MAX_STEP
+
+        reward_stack = -(self.options.DIST_MUL)*next_gInfo[:,1]**2
+        reward_stack[collided] = self.options.FAIL_REW
+        reward_stack[reached]  = self.options.GOAL_REW
+        reward_stack[over]     = 0
+
+        epi_done   = (collided | reached | over).astype(float)
+        epi_sucess = reached.astype(float)
+
+        # Update cumulative rewards
+        self.epi_step_stack   = self.epi_step_stack + 1
+        self.epi_reward_stack = self.epi_reward_stack + reward_stack*(self.options.GAMMA**self.epi_step_stack)
+
+        if self.options.VERBOSE == True:
+            for v in np.nonzero(collided)[0]:
+                print('Vehicle #' + str(v) + ' collided!')
+            for v in np.nonzero(reached)[0]:
+                print('Vehicle #' + str(v) + ' reached goal point')
+            for v in np.nonzero(over)[0]:
+                print('Vehicle #' + str(v) + ' over max step')
+            ic(reward_stack)
+
+        return reward_stack, veh_status, epi_done, epi_sucess
+
+    # Reset the epi_step_stack and epi_reward_stack
+    def resetRewards(self, veh_status):
+        done = np.asarray(veh_status) != self.scene_const.EVENT_FINE
+        self.epi_reward_stack[done] = 0
+        self.epi_step_stack[done]   = 0
+
+        return
+
+    def plotVehicle(self, *args, **kwargs):
+        raise ValueError('plotVehicle is not supported by the surrogate environment')
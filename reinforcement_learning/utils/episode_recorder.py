@@ -0,0 +1,241 @@
+#####################################
+# episode_recorder.py
+#
+# This file contains the recorder of training episodes, for inspecting failures after the run.
+# Each step of each vehicle is stored as one row of compact columns : pose relative to the origin of the test case,
+# action index, reward and event code. Rows of a vehicle are buffered until its episode ends, then written contiguously,
+# hence an episode is a slice [start, start+length) of every column.
+# Each finished episode adds one row of EPISODE_DTYPE, which includes the scenario row (scenario_bank.SCENARIO_DTYPE)
+# the test case was built with. Columns are append-only chunked streams of metrics_log.
+#
+# Files
+#   <record_dir>/meta.json            : format version, options of the run and SEED
+#   <record_dir>/episode_*.npy        : one row of EPISODE_DTYPE per episode
+#   <record_dir>/step_<field>_*.npy   : one entry per step, for field of STEP_FIELDS
+#
+# Row 0 of an episode is the pose after the reset, with action -1. Row k is the state after the k-th action.
+# Episodes which did not finish before the end of the run are written by close() with event EVENT_FINE.
+#
+# Usage
+#   recorder = episode_recorder( options, sim_env.scene_const, './result_data/episode_data/' + START_TIME_STR )
+#   sim_env.initScene( ... )
+#   recorder.startEpisodes( sim_env, range(0,options.VEH_COUNT) )
+#   while ...:
+#       ...
+#       reward_stack, veh_status, _, _ = sim_env.getRewards( ... )
+#       recorder.addStep( next_veh_pos, next_veh_heading, action_stack_k, reward_stack, veh_status )
+#       sim_env.initScene( reset_veh_list, ... )
+#       recorder.startEpisodes( sim_env, reset_veh_list )
+#   recorder.close()
+#####################################
+import json
+import os
+
+import numpy as np
+
+from utils.metrics_log import loadMetric, loadMetricRange, metric_stream
+from utils.scenario_bank import SCENARIO_DTYPE
+
+# Increase when the layout of the files changes
+RECORD_VERSION = 1
+
+# Columns of the steps
+STEP_FIELDS = {
+    'x'      : np.float32,      # position relative to the origin of the test case
+    'y'      : np.float32,
+    'yaw'    : np.float32,      # heading, last column of getObservation heading
+    'action' : np.int8,         # action index. -1 at the reset
+    'reward' : np.float32,
+    'event'  : np.int8,         # EVENT_FINE/COLLISION/GOAL/OVER_MAX_STEP of scene_const
+}
+
+# One row per episode
+EPISODE_DTYPE = np.dtype([
+    ('episode',     np.int64),
+    ('vehicle',     np.int32),
+    ('start',       np.int64),      # first row in the step columns
+    ('length',      np.int32),      # number of rows, including the reset row
+    ('event',       np.int8),       # event of the last row
+    ('reward',      np.float32),    # sum of the step rewards
+    ('origin_x',    np.float64),    # origin of the test case
+    ('origin_y',    np.float64),
+    ('scenario',    SCENARIO_DTYPE),
+])
+
+# Chunk size of the step columns. Rows are small, hence larger chunks than metrics_log
+STEP_CHUNK_SIZE = 1 << 18
+
+
+# Paths of the streams of a record
+def getStepPrefix( record_dir, field ):
+    return os.path.join( record_dir, 'step_' + field )
+
+def getEpisodePrefix( record_dir ):
+    return os.path.join( record_dir, 'episode' )
+
+def getMetaPath( record_dir ):
+    return os.path.join( record_dir, 'meta.json' )
+
+
+class episode_recorder:
+    # Input
+    #   options     : options of the run. Saved in meta.json for re-simulation
+    #   record_dir  : directory of the record
+    #   randomize   : RANDOMIZE of initScene. Saved in meta.json
+    def __init__(self, options, scene_const, record_dir, randomize = True):
+        self.options     = options
+        self.scene_const = scene_const
+        self.record_dir  = record_dir
+
+        if not os.path.exists( record_dir ):
+            os.makedirs( record_dir )
+
+        meta = {
+            'version'   : RECORD_VERSION,
+            'seed'      : options.SEED,
+            'randomize' : randomize,
+            'options'   : { name : value for name, value in vars(options).items() if isinstance( value, (bool, int, float, str, type(None)) ) },
+        }
+        with open( getMetaPath( record_dir ) + '.tmp', 'w' ) as meta_file:
+            json.dump( meta, meta_file, indent = 2 )
+        os.replace( getMetaPath( record_dir ) + '.tmp', getMetaPath( record_dir ) )
+
+        self.step_stream    = { field : metric_stream( getStepPrefix( record_dir, field ), dtype, STEP_CHUNK_SIZE ) for field, dtype in STEP_FIELDS.items() }
+        self.episode_stream = metric_stream( getEpisodePrefix( record_dir ), EPISODE_DTYPE )
+
+        # Rows of the running episode of each vehicle. Grown when full
+        veh_count        = options.VEH_COUNT
+        self.capacity    = options.MAX_TIMESTEP + 2
+        self.buffer      = { field : np.zeros( (veh_count, self.capacity), dtype = dtype ) for field, dtype in STEP_FIELDS.items() }
+        self.fill        = np.zeros( veh_count, dtype = int )
+
+        # Origin of the test case and scenario of the running episode
+        self.origin      = np.array([ [ (v % options.X_COUNT)*scene_const.case_x, (v // options.X_COUNT)*scene_const.case_y ] for v in range(0,veh_count) ], dtype = float ).reshape(veh_count,2)
+        self.scenario    = np.zeros( veh_count, dtype = SCENARIO_DTYPE )
+        self.running     = np.zeros( veh_count, dtype = bool )
+
+        self.episode_count = len( self.episode_stream )
+        return
+
+    # Start episodes of the reset vehicles. Call after initScene
+    # Input
+    #   sim_env  : env_py or env_np. Scenario and reset pose are taken from it
+    #   veh_list : reset vehicles
+    def startEpisodes(self, sim_env, veh_list):
+        veh_list = np.asarray( list(veh_list), dtype = int )
+        if len(veh_list) == 0:
+            return
+
+        veh_pos, veh_heading, _, _ = sim_env.getObservation( frame = -1 )
+
+        self.scenario[veh_list] = sim_env.scenario[veh_list]
+        self.running[veh_list]  = True
+        self.fill[veh_list]     = 0
+        self.__addRows( veh_list, veh_pos[veh_list], veh_heading[veh_list], -1, 0, self.scene_const.EVENT_FINE )
+        return
+
+    # Add a step of all vehicles. Episodes of vehicles with an event are written
+    # Input
+    #   veh_pos, veh_heading : next_veh_pos & next_veh_heading of getObservation( frame = -1 )
+    #   action_stack         : VEH_COUNT action indices
+    #   reward_stack         : VEH_COUNT rewards of getRewards
+    #   veh_status           : VEH_COUNT events of getRewards
+    def addStep(self, veh_pos, veh_heading, action_stack, reward_stack, veh_status):
+        veh_list = np.flatnonzero( self.running )
+        if len(veh_list) == 0:
+            return
+
+        veh_status = np.asarray( veh_status )
+        self.__addRows( veh_list, np.asarray( veh_pos )[veh_list], np.asarray( veh_heading )[veh_list], np.asarray( action_stack )[veh_list], np.asarray( reward_stack )[veh_list], veh_status[veh_list] )
+
+        for v in veh_list[ veh_status[veh_list] != self.scene_const.EVENT_FINE ]:
+            self.__writeEpisode( v )
+        return
+
+    # Write the running episodes and the partial chunks
+    def close(self):
+        for v in np.flatnonzero( self.running ):
+            self.__writeEpisode( v )
+
+        for stream in self.step_stream.values():
+            stream.flush()
+        self.episode_stream.flush()
+
+        print('Episodes recorded : ' + str(self.episode_count) + ' in ' + self.record_dir)
+        return
+
+    def __addRows(self, veh_list, veh_pos, veh_heading, action, reward, event):
+        if self.fill[veh_list].max() == self.capacity:
+            self.__grow()
+
+        rows = self.fill[veh_list]
+        self.buffer['x'][veh_list,rows]      = veh_pos[:,0] - self.origin[veh_list,0]
+        self.buffer['y'][veh_list,rows]      = veh_pos[:,1] - self.origin[veh_list,1]
+        self.buffer['yaw'][veh_list,rows]    = veh_heading[:,2]
+        self.buffer['action'][veh_list,rows] = action
+        self.buffer['reward'][veh_list,rows] = reward
+        self.buffer['event'][veh_list,rows]  = event
+        self.fill[veh_list] += 1
+        return
+
+    # Double the rows of the buffers, e.g., for episodes longer than MAX_TIMESTEP
+    def __grow(self):
+        for field, column in self.buffer.items():
+            self.buffer[field] = np.concatenate( (column, np.zeros_like( column )), axis = 1 )
+        self.capacity *= 2
+        return
+
+    def __writeEpisode(self, v):
+        length = self.fill[v]
+        start  = len( self.step_stream['x'] )
+        for field, stream in self.step_stream.items():
+            stream.extend( self.buffer[field][v,0:length] )
+
+        episode = np.zeros( 1, dtype = EPISODE_DTYPE )
+        episode['episode']  = self.episode_count
+        episode['vehicle']  = v
+        episode['start']    = start
+        episode['length']   = length
+        episode['event']    = self.buffer['event'][v,length-1]
+        episode['reward']   = self.buffer['reward'][v,1:length].sum()
+        episode['origin_x'] = self.origin[v,0]
+        episode['origin_y'] = self.origin[v,1]
+        episode['scenario'] = self.scenario[v]
+        self.episode_stream.append( episode[0] )
+
+        self.episode_count += 1
+        self.running[v]     = False
+        self.fill[v]        = 0
+        return
+
+
+########################
+# Reader
+########################
+
+def loadMeta( record_dir ):
+    with open( getMetaPath( record_dir ) ) as meta_file:
+        meta = json.load( meta_file )
+
+    if meta['version'] != RECORD_VERSION:
+        raise ValueError('Unsupported record version ' + str(meta['version']) + ' : ' + record_dir)
+    return meta
+
+# Output
+#   rows of EPISODE_DTYPE
+def loadEpisodes( record_dir ):
+    episodes = loadMetric( getEpisodePrefix( record_dir ) )
+    if len(episodes) == 0:
+        return np.zeros( 0, dtype = EPISODE_DTYPE )
+    return episodes
+
+# Steps of a single episode. Only the chunks of the episode are read
+# Input
+#   episode : row of EPISODE_DTYPE
+# Output
+#   dictionary of { field : array of length episode['length'] }, for field of STEP_FIELDS
+def loadEpisodeSteps( record_dir, episode ):
+    start = int( episode['start'] )
+    stop  = start + int( episode['length'] )
+
+    return { field : loadMetricRange( getStepPrefix( record_dir, field ), start, stop ) for field in STEP_FIELDS }
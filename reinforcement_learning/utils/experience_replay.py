@@ -166,7 +166,16 @@ class Memory(object):  # stored as ( s, a, r, s_ ) in SumTree
     Store a new experience in our tree
     Each new experience have a score of max_prority (it will be then improved when we use this exp to train our DDQN)
     """
-    def store(self, experience):
+    def store(self, experience, abs_error = None):
+        if self.PER_disabled == True:        
+            self.tree.add(1, experience)   # set the priority of each sample to 1 if PER is disabled
+            return
+
+        # If priority is computed by the caller (e.g., by an actor), use it directly
+        if abs_error is not None:
+            self.tree.add(self.getPriority(abs_error), experience)
+            return
+
         # Find the max priority
         max_priority = np.max(self.tree.tree[-self.tree.capacity:])
         
@@ -175,10 +184,14 @@ class Memory(object):  # stored as ( s, a, r, s_ ) in SumTree
         if max_priority == 0:
             max_priority = self.absolute_error_upper
 
-        if self.PER_disabled == True:        
-            self.tree.add(1, experience)   # set the priority of each sample to 1 if PER is disabled
-        else:
-            self.tree.add(max_priority, experience)   # set the max p for new p
+        self.tree.add(max_priority, experience)   # set the max p for new p
+
+    """
+    Convert absolute TD error into priority score
+    """
+    def getPriority(self, abs_errors):
+        clipped_errors = np.minimum(abs_errors + self.PER_e, self.absolute_error_upper)   # avoid 0 and clip
+        return np.power(clipped_errors, self.PER_a)
 
         
     """
@@ -262,9 +275,7 @@ class Memory(object):  # stored as ( s, a, r, s_ ) in SumTree
         if self.PER_disabled == True:
             return
 
-        abs_errors += self.PER_e  # convert to abs and avoid 0
-        clipped_errors = np.minimum(abs_errors, self.absolute_error_upper)
-        ps = np.power(clipped_errors, self.PER_a)
+        ps = self.getPriority(abs_errors)
 
         for ti, p in zip(tree_idx, ps):
             self.tree.update(ti, p)
@@ -0,0 +1,82 @@
+#####################################
+# genTraj_client.py
+#
+# This file contains the client for genTraj_server.py, and the message format shared by both.
+# Messages are pickled objects prefixed with their length (8 bytes, network byte order).
+# This file does not import tensorflow, hence loading the client is cheap.
+#####################################
+import pickle
+import socket
+import struct
+
+import numpy as np
+
+HEADER = struct.Struct('!Q')
+
+DEFAULT_SOCKET = '/tmp/genTraj.sock'
+
+
+# Send a single message
+def sendMessage( sock, obj ):
+    data = pickle.dumps( obj, protocol = pickle.HIGHEST_PROTOCOL )
+    sock.sendall( HEADER.pack(len(data)) + data )
+    return
+
+def recvExact( sock, size ):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv( size - len(buf) )
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        buf += chunk
+
+    return bytes(buf)
+
+# Receive a single message
+def recvMessage( sock ):
+    size, = HEADER.unpack( recvExact( sock, HEADER.size ) )
+    return pickle.loads( recvExact( sock, size ) )
+
+
+class genTraj_client:
+    # Input
+    #   socket_path : path of the unix socket of genTraj_server
+    def __init__(self, socket_path = DEFAULT_SOCKET):
+        self.sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        self.sock.connect( socket_path )
+        return
+
+    # Same inputs & outputs as genTraj_script.genTrajectory, except options, scene_const and network_model which are owned by the server
+    # Output
+    #   newPositionStack, newStateStack, newHeadingStack, newSensorXStack, newSensorYStack
+    def genTrajectory(self, next_veh_pos, next_veh_heading, next_state_sensor, next_state_goal, max_horizon):
+        sendMessage( self.sock,
+                    {
+                        'veh_pos'      : np.asarray( next_veh_pos, dtype = float ),
+                        'veh_heading'  : np.asarray( next_veh_heading, dtype = float ),
+                        'state_sensor' : np.asarray( next_state_sensor, dtype = float ),
+                        'state_goal'   : np.asarray( next_state_goal, dtype = float ),
+                        'max_horizon'  : int(max_horizon)
+                    }
+        )
+        reply = recvMessage( self.sock )
+        if 'error' in reply:
+            raise RuntimeError( 'genTraj_server : ' + reply['error'] )
+
+        return reply['position'], reply['state'], reply['heading'], reply['sensor_x'], reply['sensor_y']
+
+    # Options and scene_const used by the server
+    def getConfig(self):
+        sendMessage( self.sock, {'config' : True} )
+        reply = recvMessage( self.sock )
+        return reply['options'], reply['scene_const']
+
+    def close(self):
+        self.sock.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
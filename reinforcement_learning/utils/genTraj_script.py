@@ -3,10 +3,9 @@ import math
 import pickle
 import sys
 from utils.scene_constants_pb import scene_constants
+from utils.kinematics_np import getGoalEstimation, getVehicleEstimation
 from icecream import ic
 import tensorflow as tf
-import matplotlib
-import matplotlib.pyplot as plt
 
 # from utils.scene_constants_pb import scene_constants
 # import scene_constants_pb
@@ -20,7 +19,7 @@ import matplotlib.pyplot as plt
 # Inputs
 #   options           : given
 #   scene_const       : given
-#   next_veh_pos      : VEH_COUNT x 2
+#   next_veh_pos      : VEH_COUNT x 2. Number of rows may differ from options.VEH_COUNT, and VEH_COUNT can be any leading dimensions
 #               UNITS :     meter
 #           STRUCTURE :     [x1, y1; x2, y2; x3, y3...]
 #   next_veh_heading  : VEH_COUNT x 1
@@ -49,13 +48,27 @@ def genTrajectory(options, scene_const, next_veh_pos, next_veh_heading, next_sta
     oldSensor   = oldSensor0[:, :, options.FRAME_COUNT - 1]
     oldGoal     = next_state_goal
 
+    # Arbitrary leading dimensions, e.g., VEH_COUNT x candidates. Flatten, predict and restore
+    lead_shape  = np.shape(next_veh_pos)[:-1]
+    if len(lead_shape) != 1:
+        result = genTrajectory( options, scene_const,
+                                np.reshape( next_veh_pos, (-1,2) ),
+                                np.reshape( next_veh_heading, (-1,) ),
+                                np.reshape( next_state_sensor, (-1,) + np.shape(next_state_sensor)[-2:] ),
+                                np.reshape( next_state_goal, (-1,) + np.shape(next_state_goal)[-2:] ),
+                                network_model, max_horizon, debug )
+        return tuple( r.reshape( lead_shape + r.shape[1:] ) for r in result )
+
+    # Any number of vehicles can be given, e.g., requests batched by genTraj_server
+    veh_count   = next_veh_pos.shape[0]
+
     # Define variable for estimations of new sensor info
-    newStateStack    = np.zeros([options.VEH_COUNT, scene_const.sensor_count*2, max_horizon])
-    newGoalStack     = np.zeros([options.VEH_COUNT, 2, max_horizon])
-    newPositionStack = np.zeros([options.VEH_COUNT, 2, max_horizon])
-    newHeadingStack  = np.zeros([options.VEH_COUNT, 1, max_horizon])
-    newSensorXStack = np.zeros([options.VEH_COUNT, scene_const.sensor_count, max_horizon])
-    newSensorYStack = np.zeros([options.VEH_COUNT, scene_const.sensor_count, max_horizon])
+    newStateStack    = np.zeros([veh_count, scene_const.sensor_count*2, max_horizon])
+    newGoalStack     = np.zeros([veh_count, 2, max_horizon])
+    newPositionStack = np.zeros([veh_count, 2, max_horizon])
+    newHeadingStack  = np.zeros([veh_count, 1, max_horizon])
+    newSensorXStack = np.zeros([veh_count, scene_const.sensor_count, max_horizon])
+    newSensorYStack = np.zeros([veh_count, scene_const.sensor_count, max_horizon])
 
     if debug == True:
         ic('Main Loop for Computing Prediction...')
@@ -75,18 +88,18 @@ def genTrajectory(options, scene_const, next_veh_pos, next_veh_heading, next_sta
         action_feed.update({'observation_goal_k': oldGoal})
 
         # Dummy input for action (this is not used)
-        action_feed.update({'action_k': np.zeros((options.VEH_COUNT,options.ACTION_DIM))})
+        action_feed.update({'action_k': np.zeros((veh_count,options.ACTION_DIM))})
 
         # targetSteer_k, action_stack_k = getOptimalAction( action_feed ) # FIXME
 
         # Get Optimal Action
-        act_values = network_model.predict(action_feed, batch_size=options.VEH_COUNT)
+        act_values = network_model.predict(action_feed, batch_size=veh_count)
 
         # Get maximum for each vehicle
         action_stack_k = np.argmax(act_values, axis=1)
 
         # Apply the Steering Action & Keep Velocity. For some reason, +ve means left, -ve means right
-        targetSteer_k = math.radians( scene_const.min_steer + action_stack_k * abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1) )
+        targetSteer_k = np.radians( scene_const.min_steer + action_stack_k * abs(scene_const.max_steer - scene_const.min_steer)/(options.ACTION_DIM-1) )
 
         if debug == True:
             ic(act_values)
@@ -103,7 +116,7 @@ def genTrajectory(options, scene_const, next_veh_pos, next_veh_heading, next_sta
         newSensorCombined = np.concatenate((newSensor,newSensorState), axis=1)
 
         # Add new data to oldSensor0
-        temp = np.zeros((options.VEH_COUNT,scene_const.sensor_count*2,options.FRAME_COUNT))
+        temp = np.zeros((veh_count,scene_const.sensor_count*2,options.FRAME_COUNT))
         temp[:,:,0:options.FRAME_COUNT-1]     = oldSensor0[:,:,1:]
         temp[:,:,options.FRAME_COUNT-1]       = newSensorCombined
         oldSensor0 = temp
@@ -119,7 +132,7 @@ def genTrajectory(options, scene_const, next_veh_pos, next_veh_heading, next_sta
         newGoalStack[:,:,t]         = newGoal 
         newStateStack[:, :, t]      = newSensorCombined
         newPositionStack[:, :, t]   = newPosition
-        newHeadingStack[:, :, t]    = newHeading
+        newHeadingStack[:, 0, t]    = newHeading
         newSensorXStack[:, :, t] = newSensorXY[:,:,0]
         newSensorYStack[:, :, t] = newSensorXY[:,:,1,]
 
@@ -132,155 +145,222 @@ def genTrajectory(options, scene_const, next_veh_pos, next_veh_heading, next_sta
     # Return the vehicle trajectory
     return newPositionStack, newStateStack, newHeadingStack, newSensorXStack, newSensorYStack
 
-# Get estimated position and heading of vehicle
-# Input
-#   options         : given
-#   oldPosition     : VEH_COUNT x 2
-#   oldHeading      : VEH_COUNT x 1 (angle)
-#   targetSteer_k   : VEH_COUNT x 1 (each value mean steering angle)
-# Output
-#   newPosition     : VEH_COUNT x 2
-#   newHeading      : VEH_COUNT x 1
-def getVehicleEstimation(options, oldPosition, oldHeading, targetSteer_k):
-    # FIXME: velocity scaling
-    vLength = 0.8
-    vel     = options.INIT_SPD*0.05
-    delT    = (1/60)*options.FIX_INPUT_STEP
-
-    newPosition = np.zeros([options.VEH_COUNT,2])
-    newHeading  = np.zeros([options.VEH_COUNT])
-
-    newPosition[:,0] = oldPosition[:,0] + vel * np.sin(oldHeading)*delT
-    newPosition[:,1] = oldPosition[:,1] + vel * np.cos(oldHeading)*delT
-    newHeading       = oldHeading + vel/vLength*np.tan(targetSteer_k)*delT
-
-    # for v in range(0,options.VEH_COUNT):
-        # newPosition[v,0]=oldPosition[v,0]+vel*np.cos(oldHeading[v])*delT
-        # newPosition[v,1]=oldPosition[v,1]+vel*np.sin(oldHeading[v])*delT
-        # newHeading[v]=oldHeading[v]+vel/vLength*math.tan(targetSteer_k[v])*delT
-
-    return newPosition, newHeading
-
-# Get estimated goal length and heading
-# Input
+# Search over action sequences using the prediction model
+# Each vehicle is expanded into candidate action sequences of length depth. All candidates are predicted together with
+# getVehicleEstimation, predictLidar and getGoalEstimation, i.e., one batch per horizon step.
+# Candidates are scored with
+#   sum_t GAMMA^t * r_t + GAMMA^depth * max_a Q(final state, a)
+# where r_t follows env_py.getRewards : FAIL_REW on predicted collision, GOAL_REW on reaching the goal, and -DIST_MUL*goal_distance^2 otherwise.
+# Candidates which collided or reached the goal stop collecting rewards and are not bootstrapped.
+#
+# Prediction is done in the frame of each vehicle, i.e., vehicle at origin facing north, and re-centered after every step.
+# Goal point is recovered from the latest goal observation.
+#
+# Inputs
 #   options
 #   scene_const
-#   veh_pos : VEH_COUNT x 2
-#   veh_heading : VEH_COUNT
-#   g_pos : VEH_COUNT x 2 (x,y) position of goal point 
-def getGoalEstimation(options, scene_const, veh_pos, veh_heading, g_pos):
-    gInfo           = np.zeros([options.VEH_COUNT,2])
-    # goal_handle     = handle_dict['dummy']     # FIXME
+#   state_sensor    : VEH_COUNT x SENSOR_COUNT*2 x FRAME_COUNT, same as observation
+#   state_goal      : VEH_COUNT x 2 x FRAME_COUNT, same as observation
+#   network_model   : keras network with all Q-values as output, i.e., model_q_all
+#   depth           : length of action sequences
+#   beam_width      : 0 for exhaustive search over ACTION_DIM^depth sequences.
+#                     Otherwise, keep beam_width best sequences per vehicle after every step, scored with GAMMA^(t+1)*max Q as the remaining value
+#   debug           : T/F
+# Outputs
+#   best_action     : VEH_COUNT, first action of the best sequence
+#   action_score    : VEH_COUNT x ACTION_DIM, best score among the sequences starting with each action. -inf if pruned
+#   best_sequence   : VEH_COUNT x depth
+def genTrajectorySearch(options, scene_const, state_sensor, state_goal, network_model, depth, beam_width = 0, debug = False):
+    sensor_count    = scene_const.sensor_count
+    veh_count       = state_sensor.shape[0]
+    action_dim      = options.ACTION_DIM
+    steer_k         = np.radians( scene_const.min_steer + np.arange(action_dim) * abs(scene_const.max_steer - scene_const.min_steer)/(action_dim-1) )
+
+    # Candidates are stored as (veh_count*cand_count) flat arrays, candidates of each vehicle are contiguous
+    cand_count      = 1
+    sensor_frames   = np.array( state_sensor, dtype = float )
+    goal_frames     = np.array( state_goal, dtype = float )
+    score           = np.zeros( veh_count )
+    alive           = np.ones( veh_count, dtype = bool )
+    sequence        = np.zeros( (veh_count,0), dtype = int )
+
+    # Goal point w.r.t. vehicle. Angle is (bearing - heading) / (pi/2), positive to the right
+    goal_angle      = goal_frames[:,0,-1]*(math.pi/2)
+    goal_dist       = goal_frames[:,1,-1]*scene_const.goal_distance
+    goal_xy         = np.stack( (goal_dist*np.sin(goal_angle), goal_dist*np.cos(goal_angle)), axis = 1 )
+
+    # Vehicle at origin facing north. getGoalEstimation takes the heading of the simulator, i.e., north is pi/2
+    def estimateGoal( goal_xy ):
+        count = goal_xy.shape[0]
+        return getGoalEstimation( options, scene_const, np.zeros((count,2)), np.full(count, math.pi/2), goal_xy )
+
+    def maxQ( sensor_frames, goal_frames ):
+        q_val = network_model.predict_on_batch(
+                                            {
+                                                'observation_sensor_k' : sensor_frames[:,0:sensor_count,:],
+                                                'observation_state'    : sensor_frames[:,sensor_count:,:],
+                                                'observation_goal_k'   : goal_frames
+                                            }
+        )
+        return np.max( q_val, axis = 1 )
+
+    for t in range(0,depth):
+        # Expand every candidate with all actions
+        sensor_frames   = np.repeat( sensor_frames, action_dim, axis = 0 )
+        goal_frames     = np.repeat( goal_frames, action_dim, axis = 0 )
+        goal_xy         = np.repeat( goal_xy, action_dim, axis = 0 )
+        score           = np.repeat( score, action_dim )
+        alive           = np.repeat( alive, action_dim )
+        sequence        = np.repeat( sequence, action_dim, axis = 0 )
+        action          = np.tile( np.arange(action_dim), veh_count*cand_count )
+        sequence        = np.concatenate( (sequence, action[:,np.newaxis]), axis = 1 )
+        cand_count      = cand_count*action_dim
+        count           = sensor_frames.shape[0]
+
+        # Motion w.r.t. the current vehicle frame
+        zeroPosition    = np.zeros( (count,2) )
+        zeroHeading     = np.zeros( count )
+        newPosition, newHeading = getVehicleEstimation( options, zeroPosition, zeroHeading, steer_k[action] )
+        newSensor, newSensorState, _ = predictLidar( options, scene_const, zeroPosition, zeroHeading, sensor_frames[:,:,-1], newPosition, newHeading )
+
+        # Move goal point into the new vehicle frame
+        cosH, sinH      = np.cos(newHeading), np.sin(newHeading)
+        delta           = goal_xy - newPosition
+        goal_xy         = np.stack( (delta[:,0]*cosH - delta[:,1]*sinH, delta[:,1]*cosH + delta[:,0]*sinH), axis = 1 )
+        newGoal         = estimateGoal( goal_xy )
+
+        # Rewards, same as env_py.getRewards
+        collision       = np.any( (newSensor*scene_const.sensor_distance < scene_const.collision_distance) & (newSensorState == 0), axis = 1 )
+        reached         = ~collision & (np.abs(newGoal[:,1]*scene_const.goal_distance) < scene_const.detect_range)
+        reward          = np.where( collision, options.FAIL_REW, np.where( reached, options.GOAL_REW, -options.DIST_MUL*newGoal[:,1]**2 ) )
+        score           = score + alive*(options.GAMMA**t)*reward
+        alive           = alive & ~collision & ~reached
+
+        # Shift frames
+        sensor_frames   = np.concatenate( (sensor_frames[:,:,1:], np.concatenate((newSensor,newSensorState), axis = 1)[:,:,np.newaxis]), axis = 2 )
+        goal_frames     = np.concatenate( (goal_frames[:,:,1:], newGoal[:,:,np.newaxis]), axis = 2 )
+
+        if debug == True:
+            ic(t, count, np.count_nonzero(alive))
+
+        # Keep best beam_width candidates of each vehicle
+        if beam_width > 0 and cand_count > beam_width and t < depth - 1:
+            heuristic   = score + alive*(options.GAMMA**(t+1))*maxQ( sensor_frames, goal_frames )
+            keep        = np.argsort( -heuristic.reshape(veh_count,cand_count), axis = 1 )[:,0:beam_width]
+            keep        = (keep + cand_count*np.arange(veh_count)[:,np.newaxis]).reshape(-1)
 
-    for k in range(0,options.VEH_COUNT):
-        # To compute gInfo, get goal position
-        # g_pos, _ = p.getBasePositionAndOrientation( goal_handle[k] )
+            sensor_frames, goal_frames, goal_xy  = sensor_frames[keep], goal_frames[keep], goal_xy[keep]
+            score, alive, sequence               = score[keep], alive[keep], sequence[keep]
+            cand_count  = beam_width
 
-        # Calculate the distance
-        # ic(g_pos[0:2],veh_pos[k])
-        delta_distance  = np.array(g_pos[k]) - np.array(veh_pos[k])  # delta x, delta y
-        gInfo[k][1]     = np.linalg.norm(delta_distance) / scene_const.goal_distance
+    # Value of the remaining horizon
+    score           = score + alive*(options.GAMMA**depth)*maxQ( sensor_frames, goal_frames )
 
-        # calculate angle. 90deg + angle (assuming heading north) - veh_heading
-        gInfo[k][0] = math.atan(abs(delta_distance[0]) / abs(delta_distance[1]))  # delta x / delta y, and scale by pi 1(left) to -1 (right)
-        if delta_distance[0] < 0:
-            # Goal is left of the vehicle, then -1
-            gInfo[k][0] = gInfo[k][0] * -1
+    score           = score.reshape( veh_count, cand_count )
+    sequence        = sequence.reshape( veh_count, cand_count, depth )
+    best_cand       = np.argmax( score, axis = 1 )
+    best_sequence   = sequence[np.arange(veh_count),best_cand]
 
-        # Scale with heading
-        gInfo[k][0] = -1 * (math.pi * 0.5 - gInfo[k][0] - veh_heading[k]) / (math.pi / 2)
+    action_score    = np.full( (veh_count, action_dim), -np.inf )
+    for a in range(0,action_dim):
+        masked          = np.where( sequence[:,:,0] == a, score, -np.inf )
+        action_score[:,a] = np.max( masked, axis = 1 )
 
-    return gInfo
+    return best_sequence[:,0], action_score, best_sequence
 
 # Predict next LIDAR state
+# Old lidar points are moved into the frame of the new position and heading, and connected into a polyline.
+# Each new lidar ray is intersected with all segments of the polyline at once, and the nearest hit is used.
 # Input
 #   options
 #   scene_const
-#   oldPosition : VEH_COUNT x 2
+#   oldPosition : VEH_COUNT x 2 (not used)
 #   oldHeading  : VEH_COUNT
-#   oldSensor   : VEH_COUNT x SENSOR_COUNT*2 x FRAME_COUNT
+#   oldSensor   : VEH_COUNT x SENSOR_COUNT*2, latest frame
 #   newPosition : VEH_COUNT x 2
 #   newHeading  : VEH_COUNT
+#   VEH_COUNT can be replaced by any leading dimensions, e.g., VEH_COUNT x candidates
 # Output
 #   newSensor   : VEH_COUNT x SENSOR_COUNT
 #   newSensorState : VEH_COUNT x SENSOR_COUNT
 #   newSensorXY : VEH_COUNT X SENSOR_COUNT X 2
 def predictLidar(options, scene_const, oldPosition, oldHeading, oldSensor, newPosition, newHeading):
-    oldSensorState  = oldSensor[:,scene_const.sensor_count:]
-    # oldSensor=oldSensor[:,0:scene_const.sensor_count-1]
-    oldSensor       = oldSensor[:,0:scene_const.sensor_count]
-
-    seqAngle        = np.array([(scene_const.sensor_count-1-i)*np.pi/(scene_const.sensor_count-1) for i in range(scene_const.sensor_count)])
-    newSensor       = np.zeros((options.VEH_COUNT,scene_const.sensor_count))
-    newSensorState  = np.zeros((options.VEH_COUNT,scene_const.sensor_count)) # 0:closed & 1:open
-    newSensorXY      = np.zeros((options.VEH_COUNT,scene_const.sensor_count,2))
-
-    for v in range(0,options.VEH_COUNT):
-        # oldC,oldS   = np.cos(oldHeading[v]-np.pi/2),np.sin(oldHeading[v]-np.pi/2)
-        oldC,oldS   = np.cos(-oldHeading[v]),np.sin(-oldHeading[v])
-        oldRot      = np.array([[oldC,-oldS],[oldS,oldC]])
-        # newC,newS   = np.cos(newHeading[v]-np.pi/2),np.sin(newHeading[v]-np.pi/2)
-        newC,newS   = np.cos(-newHeading[v]+oldHeading[v]),np.sin(-newHeading[v]+oldHeading[v])
-        newRot      = np.array([[newC,-newS],[newS,newC]])
-
-        # Transformation oldSensor w.r.t vehicle's next position and heading.
-        temp1   = scene_const.sensor_distance*np.transpose([oldSensor[v],oldSensor[v]])
-        temp2   = np.transpose([np.cos(seqAngle), np.sin(seqAngle)])
-        oldLidarXY = np.multiply(temp1,temp2)
-        #oldLidarXY = np.tile(oldPosition[v, :], [scene_const.sensor_count, 1]) \
-        #            + np.matmul(oldLidarXY, oldRot)
-        oldTransXY = oldLidarXY-np.tile(newPosition[v,:], [scene_const.sensor_count,1])
-        oldTransXY = np.matmul(oldTransXY,newRot)
-
-        # Compute newSensor w.r.t vehicle's next position and heading
-        newTransXY = scene_const.sensor_distance*np.transpose([np.cos(seqAngle), np.sin(seqAngle)])
-
-        # Remove out-range points, i.e. y<0
-        reducedLidarXY=np.array([])
-        for i in range(0,scene_const.sensor_count):
-            if oldTransXY[i,1]>=0:
-                reducedLidarXY = np.append(reducedLidarXY, oldTransXY[i,:])
-        length=reducedLidarXY.shape[0]
-        reducedLidarXY=np.reshape(reducedLidarXY, (-1,2))
-
-        # Find intersection between line1(newPosition,newTransXY) & line2(two among reducedLidarXY)
-        newLidarXY=np.zeros([scene_const.sensor_count,2])
-        flag=np.ones([scene_const.sensor_count])
-        length=reducedLidarXY.shape[0]
-        for i in range(0,scene_const.sensor_count):
-            for j in range(0,length-1):
-                l=j+1
-                # If intersection is found, then pass
-                if flag[i]==0:
-                    pass
-
-                A=np.array([[newTransXY[i][1],-newTransXY[i][0]],[reducedLidarXY[l][1]-reducedLidarXY[j][1],-reducedLidarXY[l][0]+reducedLidarXY[j][0]]])
-                det=A[0][0]*A[1][1]-A[0][1]*A[1][0]
-                if det==0:
-                    pass
-                b=np.array([0,np.dot(A[1,:],reducedLidarXY[j,:])])
-                try:
-                    x=np.linalg.solve(A,b)
-                except:
-                    pass
-
-                # check the point between two pair points
-                # if np.dot(A[1,:],newTransXY[i]-x)*np.dot(A[1,:],-x)<=0 \
-                #         and np.dot(A[0,:],reducedLidarXY[j]-x)*np.dot(A[0,:],reducedLidarXY[l]-x)<=0:
-                if np.dot(A[0, :], reducedLidarXY[j] - x) * np.dot(A[0, :], reducedLidarXY[l] - x) <= 0:
-                    newLidarXY[i,:]=x
-                    newSensorState[v,i]=oldSensorState[v,j]*oldSensorState[v,l] # closed if there exist at least closed point
-                    flag[i]=0
-
-        # Compute newSensorOut
-        newLidarXY=newLidarXY+1.5*scene_const.collision_distance*np.transpose([np.cos(seqAngle),np.sin(seqAngle)])*np.transpose([flag,flag])
-        newSensor[v,:]=np.linalg.norm(newLidarXY,ord=2,axis=1)/scene_const.sensor_distance
-
-        newLidarXY = np.matmul(newLidarXY, np.transpose(newRot))
-        #newLidarXY = newLidarXY + np.tile(newPosition[v, :]-oldPosition[v, :], [scene_const.sensor_count, 1])
-        newLidarXY = np.matmul(newLidarXY, np.transpose(oldRot))
-        #newLidarXY = newLidarXY - np.tile(newPosition[v, :], [scene_const.sensor_count, 1])
-        newSensorXY[v,:,:]=newLidarXY
+    # Arbitrary leading dimensions. Flatten, predict and restore
+    lead_shape      = oldSensor.shape[:-1]
+    if len(lead_shape) != 1:
+        newSensor, newSensorState, newSensorXY = predictLidar( options, scene_const, None,
+                                                               np.broadcast_to( oldHeading, lead_shape ).reshape(-1),
+                                                               oldSensor.reshape( -1, oldSensor.shape[-1] ),
+                                                               np.broadcast_to( newPosition, lead_shape + (2,) ).reshape(-1,2),
+                                                               np.broadcast_to( newHeading, lead_shape ).reshape(-1) )
+        return newSensor.reshape( lead_shape + newSensor.shape[1:] ), newSensorState.reshape( lead_shape + newSensorState.shape[1:] ), newSensorXY.reshape( lead_shape + newSensorXY.shape[1:] )
+
+    sensor_count    = scene_const.sensor_count
+    oldSensorState  = oldSensor[:,sensor_count:]
+    oldSensor       = oldSensor[:,0:sensor_count]
+    veh_count       = oldSensor.shape[0]
+
+    seqAngle        = np.array([(sensor_count-1-i)*np.pi/(sensor_count-1) for i in range(sensor_count)])
+    sensorDir       = np.stack( (np.cos(seqAngle), np.sin(seqAngle)), axis = 1 )                   # SENSOR_COUNT x 2
+
+    # Rotation matrices, VEH_COUNT x 2 x 2
+    oldC,oldS       = np.cos(-oldHeading),np.sin(-oldHeading)
+    oldRot          = np.stack( (np.stack((oldC,-oldS), axis = -1), np.stack((oldS,oldC), axis = -1)), axis = 1 )
+    newC,newS       = np.cos(-newHeading+oldHeading),np.sin(-newHeading+oldHeading)
+    newRot          = np.stack( (np.stack((newC,-newS), axis = -1), np.stack((newS,newC), axis = -1)), axis = 1 )
+
+    # Transformation oldSensor w.r.t vehicle's next position and heading. VEH_COUNT x SENSOR_COUNT x 2
+    oldLidarXY      = scene_const.sensor_distance*oldSensor[:,:,np.newaxis]*sensorDir
+    oldTransXY      = np.matmul( oldLidarXY - newPosition[:,np.newaxis,:], newRot )
+
+    # New rays w.r.t vehicle's next position and heading. SENSOR_COUNT x 2
+    newTransXY      = scene_const.sensor_distance*sensorDir
+
+    # Segments of the polyline. Out-range points, i.e. y<0, are skipped, hence each valid point is connected to the next valid point
+    # nextIdx[v,j] : index of the next valid point after j. sensor_count if none
+    valid           = oldTransXY[:,:,1] >= 0
+    validIdx        = np.where( valid, np.arange(sensor_count), sensor_count )
+    suffixMin       = np.minimum.accumulate( validIdx[:,::-1], axis = 1 )[:,::-1]
+    nextIdx         = np.concatenate( (suffixMin[:,1:], np.full((veh_count,1), sensor_count)), axis = 1 )
+    segValid        = valid & (nextIdx < sensor_count)
+    nextIdx         = np.minimum( nextIdx, sensor_count-1 )
+
+    segStart        = oldTransXY                                                                   # VEH_COUNT x SENSOR_COUNT x 2
+    segDelta        = np.take_along_axis( oldTransXY, nextIdx[:,:,np.newaxis], axis = 1 ) - segStart
+
+    # Ray (t*r) and segment (start + u*delta) intersection. VEH_COUNT x SENSOR_COUNT(ray) x SENSOR_COUNT(segment)
+    #   t = cross(start,delta)/cross(r,delta), u = cross(start,r)/cross(r,delta)
+    rayX            = newTransXY[np.newaxis,:,np.newaxis,0]
+    rayY            = newTransXY[np.newaxis,:,np.newaxis,1]
+    startX          = segStart[:,np.newaxis,:,0]
+    startY          = segStart[:,np.newaxis,:,1]
+    deltaX          = segDelta[:,np.newaxis,:,0]
+    deltaY          = segDelta[:,np.newaxis,:,1]
+
+    denom           = rayX*deltaY - rayY*deltaX
+    parallel        = np.abs(denom) < 1e-12
+    denom           = np.where( parallel, 1.0, denom )
+    t               = (startX*deltaY - startY*deltaX)/denom
+    u               = (startX*rayY - startY*rayX)/denom
+
+    # Nearest valid hit for each ray
+    hit             = segValid[:,np.newaxis,:] & ~parallel & (t >= 0) & (u >= 0) & (u <= 1)
+    t               = np.where( hit, t, np.inf )
+    nearestSeg      = np.argmin( t, axis = 2 )                                                     # VEH_COUNT x SENSOR_COUNT
+    nearestT        = np.take_along_axis( t, nearestSeg[:,:,np.newaxis], axis = 2 )[:,:,0]
+    flag            = np.isinf( nearestT )
+
+    # Closed if there exist at least closed point
+    segState        = oldSensorState*np.take_along_axis( oldSensorState, nextIdx, axis = 1 )
+    newSensorState  = np.where( flag, 0, np.take_along_axis( segState, nearestSeg, axis = 1 ) )
+
+    # Compute newSensorOut. No hit gives a point just outside the collision distance
+    newLidarXY      = np.where( flag[:,:,np.newaxis], 1.5*scene_const.collision_distance*sensorDir, np.where( flag, 0, nearestT )[:,:,np.newaxis]*newTransXY )
+    newSensor       = np.linalg.norm( newLidarXY, ord=2, axis=2 )/scene_const.sensor_distance
+
+    # Back to the frame of old heading. Row vectors, hence multiply by transpose
+    newLidarXY      = np.einsum( 'vsi,vji->vsj', newLidarXY, newRot )
+    newSensorXY     = np.einsum( 'vsi,vji->vsj', newLidarXY, oldRot )
 
     return newSensor, newSensorState, newSensorXY
 
@@ -0,0 +1,132 @@
+#####################################
+# gui_overlay.py
+#
+# This file contains the manager of the GUI debug lines (LIDAR rays and collision range) and of the camera.
+# Compared to redrawing every LIDAR ray twice per step, the overlay
+#   - only draws lines of vehicles near the camera target. Lines of other vehicles are removed
+#   - draws the collision range once per vehicle. Lines are attached to the vehicle, hence move with it
+#   - updates LIDAR rays every draw_rate steps, and only rays whose hit fraction changed
+#   - polls the keyboard for the camera every camera_rate steps
+#
+# Usage
+#   gui = gui_overlay( options, scene_const, handle_dict, cam_pos, cam_dist, options.GUI_RATE, options.CAMERA_RATE, options.GUI_SLEEP )
+#   while ...:
+#       gui.updateCamera()
+#       ...
+#       gui.updateLines( next_veh_pos, next_dDistance )
+#####################################
+import time
+
+import numpy as np
+import pybullet as p
+
+from utils.utils_pb import controlCamera
+
+# Link of the racecar where rays start
+HOKUYO_JOINT = 8
+
+# Hit fractions closer than this are not redrawn
+FRACTION_TOLERANCE = 1e-3
+
+
+class gui_overlay:
+    # Input
+    #   handle_dict       : handles of env_py.start
+    #   cam_pos, cam_dist : initial camera target & distance
+    #   draw_rate         : number of updateLines calls between line updates
+    #   camera_rate       : number of updateCamera calls between keyboard polls
+    #   sleep             : seconds of sleep at each updateCamera, to slow down the GUI
+    #   near_dist         : lines are drawn for vehicles within near_dist of the camera target. 0 means cam_dist + sensor_distance
+    def __init__(self, options, scene_const, handle_dict, cam_pos, cam_dist, draw_rate = 1, camera_rate = 1, sleep = 0.0, near_dist = 0):
+        self.options      = options
+        self.scene_const  = scene_const
+        self.handle_dict  = handle_dict
+        self.cam_pos      = list(cam_pos)
+        self.cam_dist     = cam_dist
+        self.draw_rate    = max( draw_rate, 1 )
+        self.camera_rate  = max( camera_rate, 1 )
+        self.sleep        = sleep
+        self.near_dist    = near_dist
+
+        self.ray_from     = np.asarray( scene_const.rayFrom, dtype = float )
+        self.ray_to       = np.asarray( scene_const.rayTo, dtype = float )
+
+        # Debug line ids. -1 means not drawn
+        self.ray_id       = -1*np.ones( (options.VEH_COUNT, scene_const.sensor_count), dtype = int )
+        self.collision_id = -1*np.ones( (options.VEH_COUNT, scene_const.sensor_count), dtype = int )
+
+        # Drawn hit fraction of each ray. nan means not drawn
+        self.fraction     = np.full( (options.VEH_COUNT, scene_const.sensor_count), np.nan )
+        self.near         = np.zeros( options.VEH_COUNT, dtype = bool )
+
+        self.draw_counter   = 0
+        self.camera_counter = 0
+        return
+
+    # Poll the keyboard for the camera every camera_rate calls
+    def updateCamera(self):
+        if self.camera_counter % self.camera_rate == 0:
+            self.cam_pos, self.cam_dist = controlCamera( self.cam_pos, self.cam_dist )
+        self.camera_counter += 1
+
+        if self.sleep > 0:
+            time.sleep( self.sleep )
+        return
+
+    # Update the lines every draw_rate calls
+    # Input
+    #   veh_pos     : VEH_COUNT x 2 position of vehicles
+    #   sensor_data : VEH_COUNT x (at least) sensor_count hit fractions
+    def updateLines(self, veh_pos, sensor_data):
+        self.draw_counter += 1
+        if self.draw_counter % self.draw_rate != 0:
+            return
+
+        # Vehicles near the camera target
+        veh_pos   = np.asarray( veh_pos )
+        near_dist = self.near_dist if self.near_dist > 0 else self.cam_dist + self.scene_const.sensor_distance
+        near      = np.hypot( veh_pos[:,0] - self.cam_pos[0], veh_pos[:,1] - self.cam_pos[1] ) <= near_dist
+
+        for v in np.flatnonzero( self.near & ~near ):
+            self.__removeLines( v )
+        for v in np.flatnonzero( near & ~self.near ):
+            self.__createLines( v )
+        self.near = near
+
+        # Rays of near vehicles whose hit fraction changed. Rays which are not drawn yet have nan
+        fraction = np.asarray( sensor_data, dtype = float )[:, 0:self.scene_const.sensor_count]
+        changed  = ~( np.abs( fraction - self.fraction ) <= FRACTION_TOLERANCE ) | ( (fraction == 1) != (self.fraction == 1) )
+        changed  = changed & near[:,None]
+
+        for v, i in zip( *np.nonzero( changed ) ):
+            self.ray_id[v,i] = self.__drawRay( v, i, fraction[v,i], self.ray_id[v,i] )
+        self.fraction[changed] = fraction[changed]
+        return
+
+    # Draw a single ray. Red if the ray hit something, green otherwise
+    # Output
+    #   id of the debug line
+    def __drawRay(self, v, i, hit_fraction, replace_id, ray_width = 2, rayHitColor = [1,0,0], rayMissColor = [0,1,0]):
+        if hit_fraction == 1:
+            ray_end, color = self.ray_to[i], rayMissColor
+        else:
+            ray_end, color = self.ray_from[i] + hit_fraction*(self.ray_to[i] - self.ray_from[i]), rayHitColor
+
+        return p.addUserDebugLine( self.ray_from[i], ray_end, color, parentObjectUniqueId = int(self.handle_dict['vehicle'][v]), parentLinkIndex = HOKUYO_JOINT, replaceItemUniqueId = int(replace_id), lineWidth = ray_width )
+
+    # Collision range of a vehicle. Rays are drawn by the next updateLines
+    def __createLines(self, v):
+        collision_fraction = self.scene_const.collision_distance/self.scene_const.sensor_distance
+        for i in range(0,self.scene_const.sensor_count):
+            self.collision_id[v,i] = self.__drawRay( v, i, collision_fraction, -1, ray_width = 4, rayHitColor = [0,0,0] )
+        return
+
+    def __removeLines(self, v):
+        for line_id in np.concatenate( (self.ray_id[v], self.collision_id[v]) ):
+            if line_id >= 0:
+                p.removeUserDebugItem( int(line_id) )
+
+        self.ray_id[v]       = -1
+        self.collision_id[v] = -1
+        self.fraction[v]     = np.nan
+        return
@@ -0,0 +1,146 @@
+#####################################
+# kinematics_np.py
+#
+# This file contains the kinematic vehicle model, goal estimation and the reward/speed printouts of the 2LC test case.
+# Only NumPy is imported, hence env_surrogate can be used without PyBullet or TensorFlow.
+# genTraj_script and env_py use the same functions.
+#####################################
+import math
+
+import numpy as np
+
+
+# Get estimated position and heading of vehicle
+# Input
+#   options         : given
+#   oldPosition     : ... x 2. Any leading dimensions, e.g., VEH_COUNT or VEH_COUNT x candidates x horizon
+#   oldHeading      : ... (angle)
+#   targetSteer_k   : ... (each value mean steering angle). Broadcast with oldHeading
+#   vel             : velocity in m/s. None to use the velocity of the trained predictor
+# Output
+#   newPosition     : ... x 2
+#   newHeading      : ...
+def getVehicleEstimation(options, oldPosition, oldHeading, targetSteer_k, vel = None):
+    # FIXME: velocity scaling
+    vLength = 0.8
+    if vel is None:
+        vel = options.INIT_SPD*0.05
+    delT    = (1/60)*options.FIX_INPUT_STEP
+
+    newPosition = np.stack( (oldPosition[...,0] + vel * np.sin(oldHeading)*delT, oldPosition[...,1] + vel * np.cos(oldHeading)*delT), axis = -1 )
+    newHeading  = oldHeading + vel/vLength*np.tan(targetSteer_k)*delT
+
+    return newPosition, newHeading
+
+# Get estimated goal length and heading
+# Input
+#   options
+#   scene_const
+#   veh_pos : ... x 2. Any leading dimensions, e.g., VEH_COUNT or VEH_COUNT x candidates x horizon
+#   veh_heading : ...
+#   g_pos : ... x 2 (x,y) position of goal point. Broadcast with veh_pos
+# Output
+#   gInfo : ... x 2 (angle, distance)
+def getGoalEstimation(options, scene_const, veh_pos, veh_heading, g_pos):
+    delta_distance  = np.asarray(g_pos) - np.asarray(veh_pos)          # delta x, delta y
+    delta_x         = delta_distance[...,0]
+    delta_y         = delta_distance[...,1]
+
+    # Distance
+    goal_dist       = np.hypot( delta_x, delta_y ) / scene_const.goal_distance
+
+    # Angle. atan(|delta x| / |delta y|), negative if goal is left of the vehicle
+    goal_angle      = np.arctan2( delta_x, np.abs(delta_y) )
+
+    # Scale with heading. 90deg + angle (assuming heading north) - veh_heading
+    goal_angle      = -1 * (math.pi * 0.5 - goal_angle - veh_heading) / (math.pi / 2)
+
+    return np.stack( np.broadcast_arrays( goal_angle, goal_dist ), axis = -1 )
+
+# Calculate Approximate Rewards for variaous cases
+def printRewards( scene_const, options ):
+    # Some parameters
+    veh_speed = options.INIT_SPD*0.1  # m/s. This is how current test case works
+
+    # Time Steps
+    #dt_code = scene_const.dt * options.FIX_INPUT_STEP
+
+    # Expected Total Time Steps
+    control_freq = 0.1  # 0.1 seconds per step
+    total_step = (scene_const.goal_distance/veh_speed) * (1/control_freq)
+
+    # Reward at the end
+    rew_end = 0
+    for i in range(0, int(total_step)):
+        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
+        if i != total_step-1:
+            rew_end = rew_end -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
+        else:
+            rew_end = rew_end + options.GOAL_REW*(options.GAMMA**i) 
+
+    # Reward at Obs
+    rew_obs = 0
+    for i in range(0, int(total_step*0.5)):
+        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
+        if i != int(total_step*0.5)-1:
+            rew_obs = rew_obs -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
+        else:
+            rew_obs = rew_obs + options.FAIL_REW*(options.GAMMA**i) 
+
+    # Reward at 75%
+    rew_75 = 0
+    for i in range(0, int(total_step*0.75)):
+        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
+        if i != int(total_step*0.75)-1:
+            rew_75 = rew_75 -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
+        else:
+            rew_75 = rew_75 + options.FAIL_REW*(options.GAMMA**i) 
+
+    # Reward at 25%
+    rew_25 = 0
+    for i in range(0, int(total_step*0.25)):
+        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
+        if i != int(total_step*0.25)-1:
+            rew_25 = rew_25 -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
+        else:
+            rew_25 = rew_25 + options.FAIL_REW*(options.GAMMA**i) 
+
+    # EPS Info
+    
+
+    ########
+    # Print Info
+    ########
+
+    print("======================================")
+    print("======================================")
+    print("        REWARD ESTIMATION")
+    print("======================================")
+    # print("Control Frequency (s)  : ", options.CTR_FREQ)
+    print("Control Frequency (s)  : ", control_freq)
+    print("Expected Total Step    : ", total_step)
+    print("Expected Reward (25)   : ", rew_25)
+    print("Expected Reward (Obs)  : ", rew_obs)
+    print("Expected Reward (75)   : ", rew_75)
+    print("Expected Reward (Goal) : ", rew_end)
+    print("======================================")
+    print("        EPS ESTIMATION")
+    print("Expected Step per Epi  : ", total_step*0.5)
+    print("Total Steps            : ", total_step*0.5*options.MAX_EPISODE)
+    print("EPS at Last Episode    : ", options.INIT_EPS*options.EPS_DECAY**(total_step*0.5*options.MAX_EPISODE/options.EPS_ANNEAL_STEPS)  )
+    print("======================================")
+    print("======================================")
+
+
+    return
+
+def printSpdInfo(options):
+    desiredSpd = options.INIT_SPD
+
+    wheel_radius = 0.63407*0.5      # Wheel radius in metre
+
+    desiredSpd_rps = desiredSpd*(1000/3600)*(1/wheel_radius)   # km/hr into radians per second
+
+    print("Desired Speed: " + str(desiredSpd) + " km/hr = " + str(desiredSpd_rps) + " radians per seconds = " + str(math.degrees(desiredSpd_rps)) + " degrees per seconds. = " + str(desiredSpd*(1000/3600)) + "m/s" )
+
+    return
@@ -0,0 +1,181 @@
+#####################################
+# lidar_np.py
+#
+# This file contains the analytic 2D lidar for scenes made of axis aligned boxes, e.g., the walls of createWall.
+# Every ray of the scene_const.rayFrom/rayTo fan is tested against every box with the slab method,
+# vectorized over vehicles x rays x walls. Output has the same format as utils_pb.getSensorData.
+# Walls are given as [cx, cy, hx, hy] (center and half extents in x,y), see scene_geometry_2LC.
+#
+# validateLidar compares the kernel with p.rayTestBatch on a running PyBullet scene.
+#####################################
+import numpy as np
+
+
+# Rays of the lidar in the frame of the lidar. x-axis is front, y-axis is left (same as scene_const.rayTo)
+# Output
+#   ray_from : sensor_count x 2
+#   ray_to   : sensor_count x 2
+def getRayFan( scene_const ):
+    return np.asarray( scene_const.rayFrom, dtype = float )[:,0:2], np.asarray( scene_const.rayTo, dtype = float )[:,0:2]
+
+# Transform rays into the world frame
+# Input
+#   ray_pos     : ... x 2, position of the lidar
+#   ray_heading : ...,     heading of the lidar. north = 0 rad, east = pi/2 rad
+# Output
+#   origin : ... x sensor_count x 2
+#   delta  : ... x sensor_count x 2, rayTo - rayFrom
+def getWorldRays( scene_const, ray_pos, ray_heading ):
+    ray_from, ray_to = getRayFan( scene_const )
+
+    ray_heading = np.asarray( ray_heading, dtype = float )[...,np.newaxis,np.newaxis]
+    front       = np.concatenate( (np.sin(ray_heading), np.cos(ray_heading)), axis = -1 )
+    left        = np.concatenate( (-1*np.cos(ray_heading), np.sin(ray_heading)), axis = -1 )
+
+    origin  = np.asarray( ray_pos, dtype = float )[...,np.newaxis,:] + ray_from[:,0:1]*front + ray_from[:,1:2]*left
+    delta   = (ray_to - ray_from)[:,0:1]*front + (ray_to - ray_from)[:,1:2]*left
+
+    return origin, delta
+
+# Hit fraction of rays against boxes. Slab method
+# Input
+#   origin   : ... x R x 2
+#   delta    : ... x R x 2
+#   wall_box : ... x W x 4, [cx, cy, hx, hy]
+# Output
+#   fraction : ... x R, in [0,1]. 1 if no hit. 0 if the ray starts inside a box
+#   hit      : ... x R, True if any box is hit
+def castRays( origin, delta, wall_box ):
+    origin   = origin[...,:,np.newaxis,:]                   # ... x R x 1 x 2
+    delta    = delta[...,:,np.newaxis,:]
+    box_min  = (wall_box[...,0:2] - wall_box[...,2:4])[...,np.newaxis,:,:]      # ... x 1 x W x 2
+    box_max  = (wall_box[...,0:2] + wall_box[...,2:4])[...,np.newaxis,:,:]
+
+    # Rays parallel to an axis never enter the slab if they start outside, and always if they start inside
+    with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+        inv_delta   = 1/delta
+        t1          = (box_min - origin)*inv_delta
+        t2          = (box_max - origin)*inv_delta
+    parallel = (delta == 0)
+    inside   = (origin >= box_min) & (origin <= box_max)
+    t_lo     = np.where( parallel, np.where( inside, -np.inf, np.inf ), np.minimum( t1, t2 ) )
+    t_hi     = np.where( parallel, np.where( inside, np.inf, -np.inf ), np.maximum( t1, t2 ) )
+
+    t_near   = t_lo.max( axis = -1 )                        # ... x R x W
+    t_far    = t_hi.min( axis = -1 )
+
+    hit_box  = (t_near <= t_far) & (t_far >= 0) & (t_near <= 1)
+    fraction = np.where( hit_box, np.maximum( t_near, 0 ), 1.0 ).min( axis = -1 )
+
+    return fraction, np.any( hit_box, axis = -1 )
+
+# Lidar measurement of vehicles
+# Input
+#   wall_box    : VEH_COUNT x W x 4, walls of the test case of each vehicle. Or W x 4 shared by all vehicles
+#   ray_pos     : VEH_COUNT x 2, position of the lidar (link 8 of the vehicle)
+#   ray_heading : VEH_COUNT, heading of the lidar. north = 0 rad, east = pi/2 rad
+# Output
+#   VEH_COUNT x sensor_count*2. Hit fraction (1 if no hit) and detection state (1 : open, 0 : hit). Same as getSensorData
+def getLidar( scene_const, wall_box, ray_pos, ray_heading ):
+    wall_box = np.asarray( wall_box, dtype = float )
+    if wall_box.ndim == 2:
+        wall_box = wall_box[np.newaxis]
+
+    origin, delta = getWorldRays( scene_const, ray_pos, ray_heading )
+    fraction, hit = castRays( origin, delta, wall_box )
+
+    return np.concatenate( (fraction, np.where( hit, 0.0, 1.0 )), axis = -1 )
+
+
+########################
+# Validation against PyBullet
+########################
+
+# Walls of each test case, as seen by PyBullet. Taken from the AABB of each wall, hence includes the collision margin
+# Output
+#   wall_box : VEH_COUNT x wall_cnt x 4
+def getWallBoxesFromBullet( handle_dict ):
+    import pybullet as p
+
+    wall_handle = np.asarray( handle_dict['wall'] )
+    wall_box    = np.zeros( wall_handle.shape + (4,) )
+    for index in np.ndindex( wall_handle.shape ):
+        aabb_min, aabb_max = p.getAABB( int(wall_handle[index]) )
+        wall_box[index] = [ 0.5*(aabb_min[0] + aabb_max[0]), 0.5*(aabb_min[1] + aabb_max[1]), 0.5*(aabb_max[0] - aabb_min[0]), 0.5*(aabb_max[1] - aabb_min[1]) ]
+
+    return wall_box
+
+# Pose of the lidar link (8), which is the frame of the rays of getSensorData
+# Output
+#   ray_pos     : VEH_COUNT x 2
+#   ray_heading : VEH_COUNT. north = 0 rad, east = pi/2 rad
+def getLidarPoseFromBullet( handle_dict ):
+    import pybullet as p
+
+    vehicle_handle = handle_dict['vehicle']
+    ray_pos        = np.zeros( (len(vehicle_handle), 2) )
+    ray_heading    = np.zeros( len(vehicle_handle) )
+    for k, handle in enumerate( vehicle_handle ):
+        link_state      = p.getLinkState( int(handle), 8 )
+        ray_pos[k]      = link_state[4][0:2]
+        ray_heading[k]  = np.pi*0.5 - p.getEulerFromQuaternion( link_state[5] )[2]
+
+    return ray_pos, ray_heading
+
+# Compare getLidar with p.rayTestBatch (utils_pb.getSensorData) on the current PyBullet scene
+# Input
+#   tolerance : hit fraction tolerance, e.g., for collision margin of walls
+# Output
+#   dictionary of max_error (hit fraction), mismatch (number of rays with different detection state), and both measurements
+def validateLidar( scene_const, options, handle_dict, tolerance = 0.01 ):
+    from utils.utils_pb import getSensorData
+
+    ray_pos, ray_heading = getLidarPoseFromBullet( handle_dict )
+    analytic = getLidar( scene_const, getWallBoxesFromBullet( handle_dict ), ray_pos, ray_heading )
+    bullet   = getSensorData( scene_const, options, handle_dict['vehicle'] )
+
+    sensor_count = scene_const.sensor_count
+    error        = np.abs( analytic[:,0:sensor_count] - bullet[:,0:sensor_count] )
+    mismatch     = int( np.sum( analytic[:,sensor_count:] != bullet[:,sensor_count:] ) )
+
+    if error.max() > tolerance or mismatch > 0:
+        print('WARNING: Analytic lidar differs from rayTestBatch. Max error : ' + str(error.max()) + ', mismatch : ' + str(mismatch))
+
+    return {'max_error' : float(error.max()), 'mismatch' : mismatch, 'analytic' : analytic, 'bullet' : bullet}
+
+
+# Run random actions on a headless env_py, and compare the lidar at every step
+# Usage
+#   python -m utils.lidar_np [options of dqn_bullet.py]
+if __name__ == '__main__':
+    from dqn_bullet import get_parser
+    from utils.env_py import env_py
+    from utils.scene_constants_pb import scene_constants
+
+    options = get_parser().parse_args()
+    options.enable_GUI = False
+    options.DRAW       = False
+    options.manual     = False
+
+    np.random.seed( options.SEED )
+
+    sim_env = env_py( options, scene_constants() )
+    sim_env.scene_const.clientID, handle_dict = sim_env.start()
+    sim_env.initScene( list(range(0,options.VEH_COUNT)), True )
+
+    max_error = 0
+    mismatch  = 0
+    for step in range(0,100):
+        result    = validateLidar( sim_env.scene_const, options, sim_env.handle_dict )
+        max_error = max( max_error, result['max_error'] )
+        mismatch  = mismatch + result['mismatch']
+
+        action_stack = np.random.randint( 0, options.ACTION_DIM, options.VEH_COUNT )
+        sim_env.applyAction( sim_env.scene_const.max_steer - action_stack * abs(sim_env.scene_const.max_steer - sim_env.scene_const.min_steer)/(options.ACTION_DIM-1) )
+        sim_env.step()
+
+    print('======================================================')
+    print('Max hit fraction error : ' + str(max_error))
+    print('Detection mismatch     : ' + str(mismatch))
+    print('======================================================')
+    sim_env.end()
@@ -0,0 +1,160 @@
+#####################################
+# metrics_log.py
+#
+# This file contains append-only streams of training metrics, e.g., loss of every update and reward of every episode.
+# Values are buffered in a fixed size chunk, and every full chunk is written once as <prefix>_<index>.npy.
+# The partial chunk is written as <prefix>_tail.npy on flush, hence the cost of a flush does not grow with the run length.
+# Each file is first written to a temporary file and renamed, so that a partially written chunk is never visible.
+#
+# Readers memory map the chunks, hence long runs (tens of millions of entries) can be plotted without loading them.
+#####################################
+import glob
+import os
+
+import numpy as np
+
+# Number of entries of a chunk
+CHUNK_SIZE = 1 << 16
+
+
+# Paths of full chunks of a stream, in order
+def getChunkPaths( file_prefix ):
+    return sorted( glob.glob( glob.escape( file_prefix ) + '_[0-9][0-9][0-9][0-9][0-9][0-9].npy' ) )
+
+def getTailPath( file_prefix ):
+    return file_prefix + '_tail.npy'
+
+# Write array to file_path through a temporary file
+def writeArray( file_path, data ):
+    temp_path = file_path + '.tmp'
+    with open( temp_path, 'wb' ) as out_file:
+        np.save( out_file, data, allow_pickle = False )
+    os.replace( temp_path, file_path )
+    return
+
+
+class metric_stream:
+    # Input
+    #   file_prefix : path of the stream without extension, e.g., ./result_data/loss_data/avg_loss_value_data_<time>
+    #   dtype       : dtype of the entries
+    #   chunk_size  : number of entries of a chunk
+    # Note:
+    #   If chunks of file_prefix already exist, new entries are appended after them
+    def __init__(self, file_prefix, dtype = np.float64, chunk_size = CHUNK_SIZE):
+        self.file_prefix = file_prefix
+        self.chunk_size  = chunk_size
+
+        file_dir = os.path.dirname( file_prefix )
+        if file_dir != '' and not os.path.exists( file_dir ):
+            os.makedirs( file_dir )
+
+        # Buffer of the partial chunk
+        self.buffer      = np.empty( chunk_size, dtype = dtype )
+        self.fill        = 0
+
+        # Resume existing stream
+        self.chunk_index = len( getChunkPaths( file_prefix ) )
+        self.count       = self.chunk_index * chunk_size
+        if os.path.isfile( getTailPath( file_prefix ) ):
+            tail = np.load( getTailPath( file_prefix ) )
+            self.buffer[0:len(tail)] = tail
+            self.fill   = len(tail)
+            self.count += len(tail)
+
+        return
+
+    def __len__(self):
+        return self.count
+
+    # Append single entry. Full chunk is written to the disk
+    def append(self, value):
+        self.buffer[self.fill] = value
+        self.fill  += 1
+        self.count += 1
+
+        if self.fill == self.chunk_size:
+            writeArray( self.file_prefix + '_%06d.npy' % self.chunk_index, self.buffer )
+            self.chunk_index += 1
+            self.fill         = 0
+
+            # Tail is now part of the chunk
+            if os.path.isfile( getTailPath( self.file_prefix ) ):
+                os.remove( getTailPath( self.file_prefix ) )
+
+        return
+
+    # Append several entries
+    def extend(self, values):
+        values = np.asarray( values, dtype = self.buffer.dtype )
+        start  = 0
+        while start < len(values):
+            count = min( len(values) - start, self.chunk_size - self.fill )
+            self.buffer[self.fill:self.fill + count] = values[start:start + count]
+            self.fill  += count - 1
+            self.count += count - 1
+            start      += count
+
+            # Last entry through append, so that a full chunk is written
+            self.append( values[start - 1] )
+
+        return
+
+    # Write the partial chunk
+    def flush(self):
+        if self.fill > 0:
+            writeArray( getTailPath( self.file_prefix ), self.buffer[0:self.fill] )
+        return
+
+
+########################
+# Reader
+########################
+
+# Chunks of a stream. Full chunks are memory mapped
+# Output
+#   list of 1D arrays, in order
+def loadMetricChunks( file_prefix ):
+    chunks = [ np.load( path, mmap_mode = 'r' ) for path in getChunkPaths( file_prefix ) ]
+    if os.path.isfile( getTailPath( file_prefix ) ):
+        chunks.append( np.load( getTailPath( file_prefix ) ) )
+
+    return chunks
+
+# Number of entries of a stream
+def getMetricCount( file_prefix ):
+    return sum( len(chunk) for chunk in loadMetricChunks( file_prefix ) )
+
+# Entries of a stream
+# Input
+#   stride : take every stride-th entry. Only the taken entries are read from the disk
+# Output
+#   1D array
+def loadMetric( file_prefix, stride = 1 ):
+    chunks = loadMetricChunks( file_prefix )
+    if len(chunks) == 0:
+        return np.empty(0)
+
+    taken  = []
+    offset = 0
+    for chunk in chunks:
+        # First index of the chunk on the global stride
+        start = (-offset) % stride
+        taken.append( np.array( chunk[start::stride] ) )
+        offset += len(chunk)
+
+    return np.concatenate( taken )
+
+# Entries start ... stop-1 of a stream. Only the chunks of the range are read
+# Output
+#   1D array
+def loadMetricRange( file_prefix, start, stop ):
+    taken  = []
+    offset = 0
+    for chunk in loadMetricChunks( file_prefix ):
+        if offset < stop and start < offset + len(chunk):
+            taken.append( np.array( chunk[ max(start - offset, 0) : min(stop - offset, len(chunk)) ] ) )
+        offset += len(chunk)
+
+    if len(taken) == 0:
+        return np.empty(0)
+    return np.concatenate( taken )
@@ -0,0 +1,197 @@
+#####################################
+# pb_trace.py
+#
+# This file contains an opt-in tracer of PyBullet API calls.
+# Once installed, every function of the pybullet module is replaced by a wrapper which counts calls and accumulates time.
+# Since utils_pb, utils_pb_scene_2LC, route_2LC and env_py call `p.xxx` through the module, no call site is modified.
+# Calls are attributed to the phases of the global step loop : calls since the previous lap() are added to the phase,
+# same as phase_timer of profiler.py (phase_timer forwards its laps to the tracer). A table is printed every `rate` steps.
+#
+# Usage
+#   tracer = pb_tracer( rate = options.PROFILE_RATE )
+#   tracer.install()
+#   timer  = phase_timer( PHASES_DQN, rate = options.PROFILE_RATE, enable = options.PROFILE, tracer = tracer )
+#   sim_env.start() ...
+#   tracer.lap( PHASE_SETUP )
+#   while ...:
+#       ...
+#   tracer.uninstall()
+#   tracer.saveSummary( './result_data/profile_data/pb_trace_' + START_TIME_STR + '.json' )
+#####################################
+import json
+import os
+import time
+import types
+
+import numpy as np
+
+# Phases outside of the global step loop. Calls before the loop are added to PHASE_SETUP with lap(PHASE_SETUP),
+# and calls after the last lap, e.g., sim_env.end(), to PHASE_TEARDOWN
+PHASE_SETUP    = 'setup'
+PHASE_TEARDOWN = 'teardown'
+
+# Number of API functions printed per phase
+PRINT_TOP = 8
+
+
+class pb_tracer:
+    # Input
+    #   rate : number of steps between prints. 0 disables prints
+    # All methods return immediately until install() is called
+    def __init__(self, rate = 1000):
+        self.rate       = rate
+        self.module     = None
+        self.originals  = {}
+
+        # API functions, filled by install()
+        self.api_names  = []
+
+        # Calls since the last lap. Python lists, since numpy scalar updates are slower than the calls being traced
+        self.pending_count = []
+        self.pending_time  = []
+
+        # { phase : [count, time] } of the latest `rate` steps, and of the whole run
+        self.window     = {}
+        self.total      = {}
+
+        self.step_count   = 0
+        self.window_steps = 0
+        return
+
+    # Replace the functions of the pybullet module by traced wrappers
+    def install(self):
+        if self.module is not None:
+            return
+
+        import pybullet
+        self.module = pybullet
+
+        for name in sorted( dir(pybullet) ):
+            func = getattr( pybullet, name )
+            if name.startswith('_') or not isinstance( func, (types.BuiltinFunctionType, types.FunctionType) ):
+                continue
+
+            self.originals[name] = func
+            self.api_names.append( name )
+            setattr( pybullet, name, self.__wrap( len(self.api_names) - 1, func ) )
+
+        self.pending_count = [0]*len(self.api_names)
+        self.pending_time  = [0.0]*len(self.api_names)
+        return
+
+    # Restore the original functions. Pending calls are added to PHASE_TEARDOWN
+    def uninstall(self):
+        if self.module is None:
+            return
+
+        self.lap( PHASE_TEARDOWN )
+        for name, func in self.originals.items():
+            setattr( self.module, name, func )
+
+        self.module    = None
+        self.originals = {}
+        return
+
+    def __wrap(self, k, func):
+        tracer       = self
+        perf_counter = time.perf_counter
+
+        def traced(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.pending_time[k]  += perf_counter() - start
+                tracer.pending_count[k] += 1
+
+        traced.__name__ = func.__name__
+        traced.__doc__  = func.__doc__
+        return traced
+
+    # End of a phase. Calls since the last lap are added to the phase
+    def lap(self, phase):
+        if self.module is None:
+            return
+
+        if not any( self.pending_count ):
+            return
+
+        count = np.array( self.pending_count, dtype = np.int64 )
+        spent = np.array( self.pending_time )
+        # Setup is not part of a step, hence only in the whole run
+        for stats in ( [ self.total ] if phase == PHASE_SETUP else [ self.window, self.total ] ):
+            if phase not in stats:
+                stats[phase] = [ np.zeros( len(self.api_names), dtype = np.int64 ), np.zeros( len(self.api_names) ) ]
+            stats[phase][0] += count
+            stats[phase][1] += spent
+
+        self.pending_count = [0]*len(self.api_names)
+        self.pending_time  = [0.0]*len(self.api_names)
+        return
+
+    # End a step. Table is printed every rate steps
+    def endStep(self):
+        if self.module is None:
+            return
+
+        self.step_count   += 1
+        self.window_steps += 1
+        if self.rate > 0 and self.window_steps == self.rate:
+            self.printStats()
+            self.window       = {}
+            self.window_steps = 0
+        return
+
+    # Print the most expensive API functions of each phase
+    # Input
+    #   stats : { phase : [count, time] }. Default is the latest steps
+    #   steps : number of steps of stats
+    def printStats(self, stats = None, steps = None):
+        if stats is None:
+            stats, steps = self.window, self.window_steps
+        if len(stats) == 0:
+            return
+
+        steps     = max( steps, 1 )
+        all_time  = max( sum( spent.sum() for _, spent in stats.values() ), 1e-12 )
+        all_count = sum( int(count.sum()) for count, _ in stats.values() )
+
+        print('======================================================')
+        print('PyBullet calls of the last ' + str(steps) + ' steps. Calls/step : ' + '%.1f' % (all_count/steps) + ', ms/step : ' + '%.3f' % (1000*all_time/steps))
+        print('\t' + 'phase / function'.ljust(36) + 'calls/step'.rjust(12) + 'us/call'.rjust(10) + 'ms/step'.rjust(10) + 'share'.rjust(8))
+        for phase, (count, spent) in stats.items():
+            print('\t' + phase.ljust(36) + ('%.1f' % (count.sum()/steps)).rjust(12) + ''.rjust(10) + ('%.3f' % (1000*spent.sum()/steps)).rjust(10) + ('%.1f%%' % (100*spent.sum()/all_time)).rjust(8))
+            for k in np.argsort( -spent )[0:PRINT_TOP]:
+                if count[k] == 0:
+                    break
+                print('\t  ' + self.api_names[k].ljust(34) + ('%.1f' % (count[k]/steps)).rjust(12) + ('%.1f' % (1e6*spent[k]/count[k])).rjust(10) + ('%.3f' % (1000*spent[k]/steps)).rjust(10) + ('%.1f%%' % (100*spent[k]/all_time)).rjust(8))
+        print('======================================================')
+        return
+
+    # Summary of the whole run
+    # Output
+    #   dictionary of { phase : { function : { calls, time } } } in seconds, and step_count
+    def getSummary(self):
+        self.lap( PHASE_TEARDOWN )
+
+        summary = { 'step_count' : self.step_count, 'phases' : {} }
+        for phase, (count, spent) in self.total.items():
+            summary['phases'][phase] = { self.api_names[k] : { 'calls' : int(count[k]), 'time' : float(spent[k]) } for k in np.flatnonzero( count ) }
+
+        return summary
+
+    # Save summary of the whole run as json
+    def saveSummary(self, file_path):
+        if len(self.total) == 0 and not any( self.pending_count ):
+            return
+
+        file_dir = os.path.dirname( file_path )
+        if file_dir != '' and not os.path.exists( file_dir ):
+            os.makedirs( file_dir )
+
+        summary = self.getSummary()
+        with open( file_path, 'w' ) as out_file:
+            json.dump( summary, out_file, indent = 2 )
+
+        print('PyBullet trace    : ' + file_path)
+        return
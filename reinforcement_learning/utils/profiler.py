@@ -0,0 +1,163 @@
+#####################################
+# profiler.py
+#
+# This file contains a lightweight profiler of the global step loop.
+# A step is split into named phases with lap(). Time since the previous lap is added to the phase, hence laps are placed
+# at the end of each phase. Timings of the latest `rate` steps are kept in a preallocated array, and percentiles are printed
+# every `rate` steps. Whole run is kept in log spaced histograms (O(1) memory) for the summary file.
+# Laps and step ends are forwarded to an optional pb_tracer (pb_trace.py), even if the timer itself is disabled.
+#
+# Usage
+#   timer = phase_timer( PHASES_DQN, rate = options.PROFILE_RATE, enable = options.PROFILE )
+#   while ...:
+#       timer.startStep()
+#       ...
+#       timer.lap('observation')
+#       ...
+#       timer.endStep()
+#   timer.saveSummary( './result_data/profile_data/profile_' + START_TIME_STR + '.json' )
+#####################################
+import json
+import os
+import time
+
+import numpy as np
+
+# Phases of the global step loop of dqn_bullet.py & a2c_bullet.py
+PHASES_DQN = [ 'observation', 'action', 'applyAction', 'step', 'updateObservation', 'rewards', 'other', 'replay', 'train', 'initScene', 'logging' ]
+
+# Histogram bins of the summary. 1e-7 ... 1e2 seconds, 20 bins per decade
+HIST_EDGES = np.logspace( -7, 2, 9*20 + 1 )
+
+# Printed percentiles
+PERCENTILES = [ 50, 90, 99 ]
+
+
+class phase_timer:
+    # Input
+    #   phases : list of phase names
+    #   rate   : number of steps between prints
+    #   enable : T/F. If False, all methods return immediately
+    #   tracer : pb_tracer or None
+    def __init__(self, phases, rate = 1000, enable = True, tracer = None):
+        self.phases      = list(phases)
+        self.phase_index = { name : k for k, name in enumerate(self.phases) }
+        self.rate        = rate
+        self.enable      = enable
+        self.tracer      = tracer
+
+        # Timings of the latest steps (seconds). Row is a step
+        self.timing      = np.zeros( (rate, len(self.phases)) )
+        self.row         = 0
+        self.last_time   = 0.0
+
+        # Whole run
+        self.step_count  = 0
+        self.total       = np.zeros( len(self.phases) )
+        self.hist        = np.zeros( (len(self.phases), len(HIST_EDGES) + 1), dtype = np.int64 )
+        return
+
+    # Start a step
+    def startStep(self):
+        if self.enable == False:
+            return
+
+        self.timing[self.row] = 0
+        self.last_time        = time.perf_counter()
+        return
+
+    # End of a phase. Time since the last lap (or startStep) is added to the phase
+    def lap(self, phase):
+        if self.tracer is not None:
+            self.tracer.lap( phase )
+        if self.enable == False:
+            return
+
+        now = time.perf_counter()
+        self.timing[self.row, self.phase_index[phase]] += now - self.last_time
+        self.last_time = now
+        return
+
+    # End a step. Percentiles are printed every rate steps
+    def endStep(self):
+        if self.tracer is not None:
+            self.tracer.endStep()
+        if self.enable == False:
+            return
+
+        self.row        += 1
+        self.step_count += 1
+        if self.row == self.rate:
+            self.__accumulate()
+            self.printStats()
+            self.row = 0
+        return
+
+    # Add the timings of the latest steps to the whole run
+    def __accumulate(self):
+        timing      = self.timing[0:self.row]
+        self.total += timing.sum( axis = 0 )
+        for k in range(0, len(self.phases)):
+            self.hist[k] += np.bincount( np.searchsorted( HIST_EDGES, timing[:,k] ), minlength = self.hist.shape[1] )
+        return
+
+    # Print percentiles of the latest steps, which are not printed yet. Nothing is printed if endStep just printed the window
+    def printStats(self):
+        if self.enable == False:
+            return
+
+        timing = self.timing[0:self.row]
+        if len(timing) == 0:
+            return
+
+        step_time = timing.sum( axis = 1 )
+        print('======================================================')
+        print('Profile of the last ' + str(len(timing)) + ' steps (ms). Step mean : ' + '%.3f' % (1000*step_time.mean()) + ', p99 : ' + '%.3f' % (1000*np.percentile( step_time, 99 )))
+        print('\t' + 'phase'.ljust(20) + ''.join( ('p' + str(q)).rjust(10) for q in PERCENTILES ) + 'mean'.rjust(10) + 'share'.rjust(10))
+        for k, name in enumerate(self.phases):
+            pct = np.percentile( timing[:,k], PERCENTILES )
+            print('\t' + name.ljust(20) + ''.join( ('%.3f' % (1000*v)).rjust(10) for v in pct ) + ('%.3f' % (1000*timing[:,k].mean())).rjust(10) + ('%.1f%%' % (100*timing[:,k].sum()/max( step_time.sum(), 1e-12 ))).rjust(10))
+        print('======================================================')
+        return
+
+    # Summary of the whole run. Percentiles are taken from the histograms, hence accurate up to a bin (12%)
+    # Output
+    #   dictionary of { phase : { total, mean, p50, p90, p99 } } in seconds, and step_count
+    def getSummary(self):
+        # Steps not accumulated yet
+        if self.enable == True and self.row > 0:
+            self.__accumulate()
+            self.row = 0
+
+        summary = { 'step_count' : self.step_count, 'phases' : {} }
+        for k, name in enumerate(self.phases):
+            entry = { 'total' : float(self.total[k]), 'mean' : float(self.total[k]/max( self.step_count, 1 )) }
+
+            cum = np.cumsum( self.hist[k] )
+            for q in PERCENTILES:
+                if cum[-1] == 0:
+                    entry['p' + str(q)] = 0.0
+                    continue
+                # Upper edge of the bin of the percentile
+                b = int( np.searchsorted( cum, q*0.01*cum[-1] ) )
+                entry['p' + str(q)] = float( HIST_EDGES[ min( b, len(HIST_EDGES) - 1 ) ] )
+
+            summary['phases'][name] = entry
+
+        return summary
+
+    # Save summary of the whole run as json
+    def saveSummary(self, file_path):
+        if self.enable == False:
+            return
+
+        file_dir = os.path.dirname( file_path )
+        if file_dir != '' and not os.path.exists( file_dir ):
+            os.makedirs( file_dir )
+
+        summary = self.getSummary()
+        with open( file_path, 'w' ) as out_file:
+            json.dump( summary, out_file, indent = 2 )
+
+        print('Profile summary   : ' + file_path)
+        return
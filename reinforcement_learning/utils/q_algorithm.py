@@ -5,13 +5,18 @@
 # This uses QAgent class and replay memory among other things to implement the overall algorith,
 #####################################
 import os
+import random
 import time
 import warnings
 from icecream import ic
 
 import numpy as np
+import tensorflow as tf
 
+from utils.checkpoint_catalog import findCheckpoint
+from utils.checkpoint_writer import snapshotModel
 from utils.experience_replay import Memory
+from utils.genTraj_script import genTrajectorySearch
 from utils.rl_dqn import QAgent
 
 
@@ -21,6 +26,9 @@ class dqn:
         self.agent_train     = QAgent(sim_env.options,sim_env.scene_const, 'Training')
         self.agent_target    = QAgent(sim_env.options,sim_env.scene_const, 'Target')
 
+        # Model evaluating training and target network on the same input in a single call
+        self.model_q_pair    = self.__buildPairModel(sim_env.options, sim_env.scene_const)
+
         # Decay Step
         self.eps = sim_env.options.INIT_EPS
 
@@ -53,6 +61,21 @@ class dqn:
 
         return
 
+    # Build the model which shares the input between training and target network
+    # Weights are shared with agent_train.model_q_all and agent_target.model_q_all, hence target update is reflected automatically
+    # Output
+    #   [q_val_train, q_val_target] : each BATCH_SIZE x ACTION_DIM
+    def __buildPairModel(self, options, scene_const):
+        obs_sensor_k   = tf.keras.layers.Input( shape = ( scene_const.sensor_count, options.FRAME_COUNT), name='observation_sensor_k')
+        obs_state      = tf.keras.layers.Input( shape = ( scene_const.sensor_count, options.FRAME_COUNT), name='observation_state')
+        obs_goal_k     = tf.keras.layers.Input( shape = ( 2, options.FRAME_COUNT), name='observation_goal_k')
+
+        # model_q_all takes [goal, sensor, state]
+        q_val_train    = self.agent_train.model_q_all( [obs_goal_k, obs_sensor_k, obs_state] )
+        q_val_target   = self.agent_target.model_q_all( [obs_goal_k, obs_sensor_k, obs_state] )
+
+        return tf.keras.models.Model( inputs = [obs_goal_k, obs_sensor_k, obs_state], outputs = [q_val_train, q_val_target] )
+
     # update miscellaneous
     # For now
     #   1. decay eps
@@ -112,7 +135,24 @@ class dqn:
 
         return targetSteer_k, action_stack_k
 
-    def trainOneStep( self ):
+    # Same as getOptimalAction, but greedy action is chosen by searching action sequences of length PLAN_DEPTH
+    # with the prediction model (see genTrajectorySearch)
+    def getPlannedAction( self, action_feed ):
+        if random.random() <= self.eps and self.options.TESTING == False:
+            action_stack_k = np.random.randint( self.options.ACTION_DIM, size = self.options.VEH_COUNT )
+        else:
+            state_sensor   = np.concatenate( (action_feed['observation_sensor_k'], action_feed['observation_state']), axis = 1 )
+            action_stack_k, _, _ = genTrajectorySearch( self.options, self.scene_const, state_sensor, action_feed['observation_goal_k'], self.agent_train.model_q_all, self.options.PLAN_DEPTH, self.options.PLAN_BEAM )
+
+        targetSteer_k = self.scene_const.max_steer - action_stack_k * abs(self.scene_const.max_steer - self.scene_const.min_steer)/(self.options.ACTION_DIM-1)
+
+        return targetSteer_k, action_stack_k
+
+    # Train the network with a mini batch from the replay memory
+    # Input
+    #   update_priority : T/F. If True and PER is enabled, priorities of the sampled experiences are updated with the new TD error,
+    #                     and the loss is weighted by the importance sampling weights. Used by the Ape-X learner (apex.py)
+    def trainOneStep( self, update_priority = False ):
         # Obtain the mini batch. (Batch Memory is '2D array' with BATCH_SIZE X size(experience)
         tree_idx, batch_memory, ISWeights_mb = self.replay_memory.sample(self.options.BATCH_SIZE)
 
@@ -129,48 +169,25 @@ class dqn:
         actions_mb_hot = np.zeros((self.options.BATCH_SIZE,self.options.ACTION_DIM))
         actions_mb_hot[np.arange(self.options.BATCH_SIZE),np.asarray(actions_mb, dtype=int)] = 1
 
-        # Calculate Target Q-value. Uses double network. First, get action from training network
-        # Get Q estimate from training model. q_val_train : BATCH_SIZE x ACTION_DIM
-        q_val_train = self.agent_train.model_q_all.predict(
+        # Calculate Target Q-value. Uses double network.
+        # Training and target network are evaluated on the whole next state mini batch in a single call of the pair model.
+        # q_val_train, q_val_target : BATCH_SIZE x ACTION_DIM
+        q_val_train, q_val_target = self.model_q_pair.predict_on_batch(
                                             {
                                                 'observation_sensor_k' : next_states_sensor_mb[:,0:self.scene_const.sensor_count,:],
                                                 'observation_state'    : next_states_sensor_mb[:,self.scene_const.sensor_count:,:],
                                                 'observation_goal_k'   : next_states_goal_mb
-                                            },
-                                            batch_size = self.options.VEH_COUNT
+                                            }
         )
-        # ic(q_val_train)
-        # ic(actions_mb_hot)
-        # q_temp = self.agent_train.model_qa.predict(
-        #                                     {
-        #                                         'observation_sensor_k' : next_states_sensor_mb[:,0:self.scene_const.sensor_count,:],
-        #                                         'observation_state'    : next_states_sensor_mb[:,self.scene_const.sensor_count:,:],
-        #                                         'observation_goal_k'   : next_states_goal_mb,
-        #                                         'action_k'             : actions_mb_hot 
-        #                                     },
-        #                                     batch_size = self.options.VEH_COUNT
-        # )
-        # ic(q_temp)
+
         # Get action from training model
         action_train_k = np.argmax( q_val_train, axis=1)
 
-        keras_feed = {}
-        keras_feed.clear()
-        keras_feed.update(
-            {
-                'observation_sensor_k' : next_states_sensor_mb[:,0:self.scene_const.sensor_count,:],
-                'observation_state'    : next_states_sensor_mb[:,self.scene_const.sensor_count:,:],
-                'observation_goal_k'   : next_states_goal_mb
-            }
-
-        )
         # Using Target + Double network
-        q_target_val_vec = rewards_mb + self.options.GAMMA * self.agent_target.model_q_all.predict(keras_feed)[np.arange(0,self.options.BATCH_SIZE),action_train_k]
+        q_target_val_vec = rewards_mb + self.options.GAMMA * q_val_target[np.arange(0,self.options.BATCH_SIZE),action_train_k]
 
         # set q_target to reward if episode is done
-        for v_mb in range(0,self.options.BATCH_SIZE):
-            if done_mb[v_mb] == 1:
-                q_target_val_vec[v_mb] = rewards_mb[v_mb]
+        q_target_val_vec[done_mb == 1] = rewards_mb[done_mb == 1]
 
 
         # Target is BATCH_SIZE x ACTION_DIM, with Q(s_t,a_t) replaced with \hat{Q}
@@ -195,7 +212,14 @@ class dqn:
             # ic( np.reshape(q_target_val_mtx,(self.options.BATCH_SIZE,self.options.ACTION_DIM)) )
 
         # Loss
-        loss_k = self.agent_train.model_qa.train_on_batch( keras_feed, np.reshape(q_target_val_vec,(self.options.BATCH_SIZE,1)) )
+        if self.replay_memory.PER_disabled == True or update_priority == False:
+            loss_k = self.agent_train.model_qa.train_on_batch( keras_feed, np.reshape(q_target_val_vec,(self.options.BATCH_SIZE,1)) )
+        else:
+            # Update priority of sampled experience with new TD error, and correct the bias with importance sampling weights
+            q_val_curr = self.agent_train.model_qa.predict_on_batch( keras_feed )
+            self.replay_memory.batch_update( tree_idx, np.abs( q_target_val_vec - q_val_curr[:,0] ) )
+
+            loss_k = self.agent_train.model_qa.train_on_batch( keras_feed, np.reshape(q_target_val_vec,(self.options.BATCH_SIZE,1)), sample_weight = ISWeights_mb[:,0] )
 
         return loss_k, states_sensor_mb, next_states_sensor_mb, states_goal_mb, next_states_goal_mb, actions_mb
 
@@ -206,6 +230,8 @@ class dqn:
         # If file is provided. From checkpoint.txt, read the last line, i.e., the latest weight file.
         if self.options.WEIGHT_FILE != None:
             weight_path = self.options.WEIGHT_FILE
+        elif self.options.WEIGHT_QUERY != None:
+            weight_path = findCheckpoint( self.options.WEIGHT_DIR, self.options.WEIGHT_QUERY )
         elif os.path.isfile('./checkpoints-vehicle/checkpoint.txt'):
             with open('./checkpoints-vehicle/checkpoint.txt') as check_file:
                 # Get file content
@@ -225,8 +251,9 @@ class dqn:
             print("=================================================")
             print("=================================================\n\n")
         else:
+            # Read the file once, and copy to the target network
             self.agent_train.model_qa.load_weights( weight_path )
-            self.agent_target.model_qa.load_weights( weight_path )
+            self.agent_target.model_qa.set_weights( self.agent_train.model_qa.get_weights() )
             print("\n\n=================================================")
             print("=================================================")
             print("Successfully loaded:", weight_path)
@@ -241,10 +268,20 @@ class dqn:
     #   START_TIME_STR : string of starting time
     #   epi_counter    : current episode number
     #   global_step    : current global step
-    def saveNetworkKeras(self, START_TIME_STR, epi_counter, global_step):
+    #   writer         : checkpoint_writer. If provided, weights are copied and written in background
+    #   metric         : metric of the checkpoint used by the writer for keeping best checkpoints, e.g., recent success rate
+    def saveNetworkKeras(self, START_TIME_STR, epi_counter, global_step, writer = None, metric = None):
         print('-----------------------------------------')
         print("Saving network...")
         print('-----------------------------------------')
+        if writer is not None:
+            file_name = START_TIME_STR + "_e" + str(epi_counter) + "_gs" + str(global_step) + '.h5'
+            writer.saveCheckpoint(
+                [ (file_name, snapshotModel(self.agent_train.model_qa), 'checkpoint.txt') ],
+                { 'run' : START_TIME_STR, 'episode' : epi_counter, 'global_step' : global_step, 'eps' : self.eps, 'course_eps' : self.course_eps, 'metric' : metric }
+            )
+            return
+
         if not os.path.exists('./checkpoints-vehicle'):
             os.makedirs('./checkpoints-vehicle')
         # self.agent_train.model.save_weights('./checkpoints-vehicle/' + START_TIME_STR + "_e" + str(epi_counter) + "_gs" + str(global_step) + '.h5', overwrite=True)
@@ -0,0 +1,192 @@
+#####################################
+# renderer.py
+#
+# This file contains the off-thread renderer of env_py.plotVehicle.
+# The simulation only builds a compact snapshot (numpy arrays of positions and lidar points) and puts it into a queue.
+# A separate process owns the matplotlib figure, updates persistent artists (set_data, set_offsets, set_segments)
+# instead of clearing and re-plotting, and writes the frames to disk.
+# The queue is short. If the renderer falls behind, new frames are dropped on the simulation side before the
+# prediction is computed, and the renderer only draws the newest snapshot in the queue.
+#
+# Snapshot : dictionary of
+#   frame         : frame number. Gaps are dropped frames
+#   save          : T/F, save the frame as ./image_dir/plot_<frame>.png
+#   goal          : (2,) goal position
+#   traj          : (N,2) trajectory of the vehicle
+#   veh           : (2,) vehicle position
+#   lidar         : (sensor_count,2) lidar points relative to the vehicle
+#   detect        : (sensor_count,) 1 if the ray is open
+#   predict_pos   : (predict,2) predicted vehicle positions, or None
+#   predict_lidar : (K,sensor_count,2) predicted lidar points of every other prediction step, or None
+#####################################
+import multiprocessing as mp
+import os
+import queue
+
+import numpy as np
+
+# Colors. Same as the original plotVehicle
+COLOR_OPEN       = (0,1,0,1)
+COLOR_CLOSE      = (1,0,0,1)
+COLOR_RAY_OPEN   = (0,1,0,0.2)
+COLOR_RAY_CLOSE  = (1,0,0,0.2)
+COLOR_PRED_LIDAR = (1,0,0,0.2)
+COLOR_PRED_FILL  = (0,0,0,0.05)
+
+
+# Renderer process
+# Input
+#   snapshot_queue : queue of snapshots. None stops the renderer
+#   view           : (xlim, ylim) of both axes
+#   image_dir      : directory of saved frames
+#   show           : T/F. If False, frames are only written to disk (Agg backend)
+def renderProcess( snapshot_queue, view, image_dir, show ):
+    import matplotlib
+    if show == False:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection, PolyCollection
+    from matplotlib.lines import Line2D
+
+    if not os.path.exists( image_dir ):
+        os.makedirs( image_dir )
+
+    if show == True:
+        plt.ion()
+        plt.show()
+    fig, ax_array = plt.subplots(1,2, figsize=(8,12))
+    for axis in ax_array:
+        axis.set_xlim( view[0] )
+        axis.set_ylim( view[1] )
+
+    # Persistent artists
+    traj_lines  = [ axis.plot( [], [], color=(0,0,0), markersize = 2, marker='o' )[0] for axis in ax_array ]
+    goal_points = [ axis.plot( [], [], color='orange', marker='*', lw=0 )[0] for axis in ax_array ]
+
+    lidar_points = ax_array[0].scatter( np.zeros(0), np.zeros(0), marker='o' )
+    lidar_rays   = LineCollection( [] )
+    ax_array[0].add_collection( lidar_rays )
+
+    predict_points = ax_array[1].scatter( np.zeros(0), np.zeros(0) )
+    predict_fill   = PolyCollection( [], facecolors = [COLOR_PRED_FILL], edgecolors = 'none' )
+    predict_lidar  = LineCollection( [], colors = [COLOR_PRED_LIDAR] )
+    ax_array[1].add_collection( predict_fill )
+    ax_array[1].add_collection( predict_lidar )
+
+    # Legends
+    ax_array[0].legend(handles = [
+        Line2D([0],[0], color='black', marker='o', markerfacecolor='black', markersize=5, lw=2, label='Vehicle Trajectory'),
+        Line2D([0],[0], color='orange', marker='*', markerfacecolor='orange', markersize=5, lw=0, label='Goal Point'),
+    ], loc='lower right')
+    ax_array[1].legend(handles = [
+        Line2D([0],[0], color='red', lw=2, label='LIDAR Estimation'),
+        Line2D([0],[0], color='blue', marker='o', markerfacecolor='blue', markersize=5, lw=0, label='Prediction'),
+    ], loc='lower left')
+
+    running = True
+    while running:
+        snapshot = snapshot_queue.get()
+        if snapshot is None:
+            break
+
+        # Only the newest snapshot is drawn
+        while True:
+            try:
+                newer = snapshot_queue.get_nowait()
+            except queue.Empty:
+                break
+            if newer is None:
+                running = False
+                break
+            snapshot = newer
+
+        #------------------------
+        # Vehicle, goal and LIDAR
+        #------------------------
+        for k in range(0,2):
+            traj_lines[k].set_data( snapshot['traj'][:,0], snapshot['traj'][:,1] )
+            goal_points[k].set_data( [snapshot['goal'][0]], [snapshot['goal'][1]] )
+
+        lidar_xy = snapshot['veh'] + snapshot['lidar']
+        detect   = snapshot['detect'] == 1
+        lidar_points.set_offsets( lidar_xy )
+        lidar_points.set_facecolors( np.where( detect[:,None], COLOR_OPEN, COLOR_CLOSE ) )
+        lidar_rays.set_segments( np.stack( (np.broadcast_to( snapshot['veh'], lidar_xy.shape ), lidar_xy), axis = 1 ) )
+        lidar_rays.set_colors( np.where( detect[:,None], COLOR_RAY_OPEN, COLOR_RAY_CLOSE ) )
+
+        #------------------------
+        # Prediction
+        #------------------------
+        if snapshot['predict_pos'] is not None:
+            predict_count = len(snapshot['predict_pos'])
+            alpha = 1.0 - np.arange(predict_count)*0.8/predict_count
+            predict_points.set_offsets( snapshot['predict_pos'] )
+            predict_points.set_facecolors( np.column_stack( (np.zeros((predict_count,2)), np.ones(predict_count), alpha) ) )
+
+            # Outline of the predicted LIDAR, closed at the predicted vehicle position
+            outline = [ np.vstack( (snapshot['predict_pos'][2*k], points, snapshot['predict_pos'][2*k]) ) for k, points in enumerate(snapshot['predict_lidar']) ]
+            predict_lidar.set_segments( outline )
+            predict_fill.set_verts( [ points for points in snapshot['predict_lidar'] ] )
+        else:
+            predict_points.set_offsets( np.zeros((0,2)) )
+            predict_lidar.set_segments( [] )
+            predict_fill.set_verts( [] )
+
+        if show == True:
+            fig.canvas.draw()
+            fig.canvas.flush_events()
+
+        if snapshot['save'] == True:
+            fig.savefig( os.path.join( image_dir, 'plot_' + str(snapshot['frame']).zfill(4) + '.png' ), bbox_inches='tight' )
+
+    plt.close( fig )
+    return
+
+
+class plot_renderer:
+    # Input
+    #   view       : (xlim, ylim) of both axes
+    #   image_dir  : directory of saved frames
+    #   show       : T/F, show the figure on screen
+    #   queue_size : number of snapshots waiting for the renderer before frames are dropped
+    def __init__(self, view, image_dir = './image_dir', show = True, queue_size = 2):
+        # matplotlib must not be forked with the simulation, hence use spawn
+        ctx = mp.get_context('spawn')
+        self.queue   = ctx.Queue( maxsize = queue_size )
+        self.process = ctx.Process( target = renderProcess, args = (self.queue, view, image_dir, show), daemon = True )
+        self.process.start()
+
+        self.frame   = 0
+        self.dropped = 0
+        return
+
+    # T/F. False if the renderer is behind, then the frame should be dropped with drop()
+    def ready(self):
+        return self.process.is_alive() and not self.queue.full()
+
+    def drop(self):
+        self.frame   += 1
+        self.dropped += 1
+        return
+
+    # Send snapshot to the renderer. frame is set here
+    def submit(self, snapshot):
+        snapshot['frame'] = self.frame
+        try:
+            self.queue.put_nowait( snapshot )
+        except queue.Full:
+            self.dropped += 1
+        self.frame += 1
+        return
+
+    # Wait for the queued frames and stop the renderer
+    def close(self, timeout = 30):
+        if self.process.is_alive():
+            try:
+                self.queue.put( None, timeout = timeout )
+            except queue.Full:
+                pass
+            self.process.join( timeout )
+
+        print('Renderer frames   : ' + str(self.frame) + ', dropped by the simulation : ' + str(self.dropped))
+        return
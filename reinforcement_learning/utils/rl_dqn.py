@@ -97,14 +97,14 @@ class QAgent:
         self.model_qa.compile( optimizer= keras_opt,
                             loss = 'mean_squared_error' 
         )
-        self.model_qa.summary()
-
         # effectively computing twice to get value and maximum
         self.model_q_all = tf.keras.Model(inputs = [self.obs_goal_k, self.obs_sensor_k, self.obs_state], outputs = self.model_qa.get_layer('out_large').output)
 
-        # Figures
-        tf.keras.utils.plot_model( self.model_qa, to_file='model_qa.png')
-        tf.keras.utils.plot_model( self.model_q_all, to_file='model_q_all.png')
+        # Summary & Figures. Skipped in headless mode (plot_model needs graphviz)
+        if getattr( options, 'HEADLESS', False ) == False:
+            self.model_qa.summary()
+            tf.keras.utils.plot_model( self.model_qa, to_file='model_qa.png')
+            tf.keras.utils.plot_model( self.model_q_all, to_file='model_q_all.png')
 
         return
 
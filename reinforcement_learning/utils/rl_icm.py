@@ -12,7 +12,6 @@ import math
 import random
 import sys
 
-import matplotlib.pyplot as plt
 import numpy as np
 import tensorflow as tf
 from icecream import ic
@@ -21,9 +20,9 @@ from icecream import ic
 # Class for Neural Network
 class ICM:
     def __init__(self, options, scene_const, name):
-        # General Variables for plotting
-        self.fig = plt.figure( figsize=(0.1*scene_const.sensor_distance*2,0.1*scene_const.goal_distance) )
-        self.ax = self.fig.add_subplot(111)
+        # General Variables for plotting. Figure is created by the first plotEstimate
+        self.fig = None
+        self.ax = None
         self.data_x = []
         self.data_y = []
         self.data_arrow_x = []
@@ -74,11 +73,12 @@ class ICM:
         self.model.compile( optimizer= keras_opt,
                             loss = 'mean_squared_error' 
         )
-        print('ICM MODEL')
-        self.model.summary()
+        if getattr( options, 'HEADLESS', False ) == False:
+            print('ICM MODEL')
+            self.model.summary()
 
-        # effectively computing twice to get value and maximum
-        tf.keras.utils.plot_model( self.model, to_file='model_icm.png')
+            # effectively computing twice to get value and maximum
+            tf.keras.utils.plot_model( self.model, to_file='model_icm.png')
 
         return
 
@@ -209,6 +209,11 @@ class ICM:
             veh_x = 0
             veh_y = 0
 
+        if self.fig is None:
+            import matplotlib.pyplot as plt
+            self.fig = plt.figure( figsize=(0.1*scene_const.sensor_distance*2,0.1*scene_const.goal_distance) )
+            self.ax = self.fig.add_subplot(111)
+
         # Clear data if close to start line and data is short. FIXME: Currently, does not reset if collision occurs immediately
         self.ax.clear()
         if len(self.data_y) > 0 and abs(self.data_y[-1] - veh_y) > 5:
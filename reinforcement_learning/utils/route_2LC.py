@@ -0,0 +1,175 @@
+#####################################
+# route_2LC.py
+#
+# This file contains the route mode of the 2LC scene. Each vehicle drives a chain of ROUTE_LEN segments
+# (straight lanes with obstacles, and crossings), instead of a single tee.
+# Segments are generated lazily, and only segments near the vehicle exist in PyBullet.
+# Walls of segments behind the vehicle are returned to a pool, and moved into place when a segment ahead is loaded,
+# hence the number of bodies and the broadphase cost do not grow with the route length.
+# Geometry of the segments is in scene_geometry_2LC.
+#####################################
+import numpy as np
+import pybullet as p
+
+from utils.scene_geometry_2LC import (SEG_CROSS, SEG_STRAIGHT,
+                                      getRouteGoalPos, getRouteSegmentBoxes)
+from utils.utils_pb_scene_2LC import createGoal, createWall
+
+# Walls in the pool are parked below the plane
+PARK_Z = -10.0
+
+
+class route_manager:
+    # Input
+    #   route_len  : number of segments of each route
+    #   lookahead  : number of segments loaded ahead of the vehicle
+    #   lookbehind : number of segments kept behind the vehicle
+    #   cross_prob : probability of a crossing segment
+    def __init__(self, scene_const, options, route_len, lookahead = 2, lookbehind = 1, cross_prob = 0.3):
+        if options.VEH_COUNT != options.X_COUNT:
+            raise ValueError('Route mode places routes along +y, hence VEH_COUNT=' + str(options.VEH_COUNT) + ' must be equal to X_COUNT=' + str(options.X_COUNT))
+
+        self.scene_const = scene_const
+        self.options     = options
+        self.route_len   = route_len
+        self.lookahead   = lookahead
+        self.lookbehind  = lookbehind
+        self.cross_prob  = cross_prob
+
+        # Route of each vehicle. List of (kind, obs_slot), generated when needed
+        self.route       = [ [] for _ in range(options.VEH_COUNT) ]
+        self.lane_width  = np.full( options.VEH_COUNT, float(scene_const.lane_width) )
+        self.curr_seg    = np.zeros( options.VEH_COUNT, dtype = int )
+
+        # Loaded segments of each vehicle. { seg_index : [ (body, key) ] }
+        self.loaded      = [ {} for _ in range(options.VEH_COUNT) ]
+
+        # Free walls. { (hx, hy) in mm : [ body ] }
+        self.pool        = {}
+        self.body_count  = 0
+        return
+
+    # Origin of the route of vehicle v. Same as the test case of genScene
+    def getOrigin(self, v):
+        return (v % self.options.X_COUNT) * self.scene_const.case_x, int(v / self.options.X_COUNT) * self.scene_const.case_y
+
+    # Wall of the given size from the pool, or a new one
+    def __takeWall(self, box):
+        key = ( int(round(box[2]*1000)), int(round(box[3]*1000)) )
+        if len( self.pool.get(key, []) ) > 0:
+            body = self.pool[key].pop()
+            p.resetBasePositionAndOrientation( body, [ box[0], box[1], 0 ], [ 0, 0, 0, 1 ] )
+        else:
+            # Remove a free wall of another size, so that the number of bodies stays the same when lane width changes
+            for other in self.pool.values():
+                if len(other) > 0:
+                    p.removeBody( other.pop() )
+                    self.body_count -= 1
+                    break
+
+            body = createWall( [ box[2], box[3], self.scene_const.wall_h ], [ box[0], box[1], 0 ] )
+            self.body_count += 1
+
+        return body, key
+
+    def __returnWall(self, body, key):
+        p.resetBasePositionAndOrientation( body, [ 0, 0, PARK_Z ], [ 0, 0, 0, 1 ] )
+        self.pool.setdefault( key, [] ).append( body )
+        return
+
+    # Segment of the route. Generated on the first access
+    def __getSegment(self, v, seg_index):
+        while len(self.route[v]) <= seg_index:
+            idx = len(self.route[v])
+            if idx == 0:
+                # Vehicle starts in the first segment
+                self.route[v].append( (SEG_STRAIGHT, -1) )
+            elif np.random.random() < self.cross_prob:
+                self.route[v].append( (SEG_CROSS, -1) )
+            else:
+                valid_opt = np.arange(3)[np.nonzero(self.scene_const.OBS_ENABLE)]
+                self.route[v].append( (SEG_STRAIGHT, int(np.random.choice( valid_opt ))) )
+
+        return self.route[v][seg_index]
+
+    def __loadSegment(self, v, seg_index):
+        x_pos, y_pos   = self.getOrigin(v)
+        kind, obs_slot = self.__getSegment( v, seg_index )
+        boxes = getRouteSegmentBoxes( self.scene_const, x_pos, y_pos, self.lane_width[v], kind, seg_index, obs_slot, first = (seg_index == 0), last = (seg_index == self.route_len - 1) )
+
+        self.loaded[v][seg_index] = [ self.__takeWall( box ) for box in boxes ]
+        return
+
+    def __unloadSegment(self, v, seg_index):
+        for body, key in self.loaded[v].pop( seg_index ):
+            self.__returnWall( body, key )
+        return
+
+    # Load segments around seg_index, and unload others
+    def __setWindow(self, v, seg_index):
+        window = range( max(0, seg_index - self.lookbehind), min(self.route_len, seg_index + self.lookahead + 1) )
+        for s in [ s for s in self.loaded[v] if s not in window ]:
+            self.__unloadSegment( v, s )
+        for s in window:
+            if s not in self.loaded[v]:
+                self.__loadSegment( v, s )
+
+        self.curr_seg[v] = seg_index
+        return
+
+    # Start a new route. Walls of the old route are returned to the pool
+    # Input
+    #   handle_dict : goal point (dummy) of the vehicle is created if needed and moved to the first goal
+    #   lane_width  : lane width of the new route
+    def resetRoute(self, v, handle_dict, lane_width):
+        for s in list( self.loaded[v].keys() ):
+            self.__unloadSegment( v, s )
+
+        self.route[v]       = []
+        self.lane_width[v]  = lane_width
+        self.__setWindow( v, 0 )
+
+        goal_pos = self.getGoalPos( v )
+        if handle_dict['dummy'][v] < 0:
+            handle_dict['dummy'][v] = createGoal( 0.1, [ goal_pos[0], goal_pos[1], 1.0 ] )
+        else:
+            p.resetBasePositionAndOrientation( handle_dict['dummy'][v], [ goal_pos[0], goal_pos[1], 1.0 ], [ 0, 0, 0, 1 ] )
+
+        return
+
+    # Goal point of the current segment
+    def getGoalPos(self, v):
+        x_pos, y_pos = self.getOrigin(v)
+        return getRouteGoalPos( self.scene_const, x_pos, y_pos, self.lane_width[v], self.curr_seg[v], last = (self.curr_seg[v] == self.route_len - 1) )
+
+    # Stream segments with the position of the vehicles, and move the goal points to the current segment
+    # Call before the state of the vehicles is read
+    def update(self, handle_dict):
+        for v in range(0, self.options.VEH_COUNT):
+            veh_pos, _  = p.getBasePositionAndOrientation( handle_dict['vehicle'][v] )
+            _, y_pos    = self.getOrigin(v)
+
+            seg_index = int( np.floor( (veh_pos[1] - y_pos)/self.scene_const.lane_len + 0.5 ) )
+            seg_index = min( max( seg_index, 0 ), self.route_len - 1 )
+            if seg_index == self.curr_seg[v]:
+                continue
+
+            self.__setWindow( v, seg_index )
+
+            goal_pos = self.getGoalPos( v )
+            p.resetBasePositionAndOrientation( handle_dict['dummy'][v], [ goal_pos[0], goal_pos[1], 1.0 ], [ 0, 0, 0, 1 ] )
+
+        return
+
+    # Remove all bodies
+    def removeAll(self):
+        for v in range(0, self.options.VEH_COUNT):
+            for s in list( self.loaded[v].keys() ):
+                self.__unloadSegment( v, s )
+
+        for bodies in self.pool.values():
+            for body in bodies:
+                p.removeBody( body )
+        self.pool       = {}
+        self.body_count = 0
+        return
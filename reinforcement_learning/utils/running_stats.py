@@ -0,0 +1,123 @@
+#####################################
+# running_stats.py
+#
+# This file contains running statistics which are updated in O(1) per entry.
+#   window_stats : mean & variance over the latest `window` entries. Welford update for the added and the removed entry
+#   ema_stats    : exponential moving average & variance
+# rollingStats computes the same as window_stats over a whole array in O(N), e.g., for plots with another window.
+#####################################
+import numpy as np
+
+
+class window_stats:
+    # Input
+    #   window : number of latest entries
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError('Invalid window : ' + str(window))
+
+        self.window = window
+        self.buffer = np.zeros( window )
+        self.index  = 0             # Position of the next entry in the buffer
+        self.count  = 0             # Number of entries in the window
+        self.mean   = 0.0
+        self.m2     = 0.0           # Sum of squared difference from the mean
+        return
+
+    # Add entry. Oldest entry is removed if the window is full
+    # Output
+    #   mean, std of the window
+    def update(self, value):
+        value = float(value)
+
+        if self.count == self.window:
+            # Replace the oldest entry
+            old        = self.buffer[self.index]
+            old_mean   = self.mean
+            self.mean  = old_mean + (value - old)/self.window
+            self.m2    = self.m2 + (value - old)*(value - self.mean + old - old_mean)
+        else:
+            self.count = self.count + 1
+            delta      = value - self.mean
+            self.mean  = self.mean + delta/self.count
+            self.m2    = self.m2 + delta*(value - self.mean)
+
+        # Rounding error can make m2 slightly negative
+        self.m2 = max( self.m2, 0.0 )
+
+        self.buffer[self.index] = value
+        self.index = (self.index + 1) % self.window
+
+        return self.mean, self.std
+
+    # True if the window is full
+    @property
+    def full(self):
+        return self.count == self.window
+
+    # Population variance, same as np.var
+    @property
+    def var(self):
+        return self.m2/self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt( self.var )
+
+
+class ema_stats:
+    # Input
+    #   span : same as pandas ewm span. alpha = 2/(span + 1)
+    def __init__(self, span):
+        if span < 1:
+            raise ValueError('Invalid span : ' + str(span))
+
+        self.alpha = 2.0/(span + 1)
+        self.count = 0
+        self.mean  = 0.0
+        self.var   = 0.0
+        return
+
+    # Add entry
+    # Output
+    #   mean, std
+    def update(self, value):
+        value = float(value)
+
+        if self.count == 0:
+            self.mean = value
+            self.var  = 0.0
+        else:
+            delta     = value - self.mean
+            self.mean = self.mean + self.alpha*delta
+            self.var  = (1 - self.alpha)*(self.var + self.alpha*delta*delta)
+
+        self.count = self.count + 1
+        return self.mean, self.std
+
+    @property
+    def std(self):
+        return np.sqrt( self.var )
+
+
+# Mean & std of every window of an array. Same as np.mean/np.std over rolling windows, without building the windows
+# Input
+#   x      : 1D array
+#   window : window size
+# Output
+#   mean, std : len(x) - window + 1 each. Entry i is over x[i:i+window]
+def rollingStats( x, window ):
+    x = np.asarray( x, dtype = float )
+    if len(x) < window:
+        return np.empty(0), np.empty(0)
+
+    # Centered, to reduce cancellation of sum of squares
+    offset  = np.mean( x )
+    x       = x - offset
+    cum     = np.concatenate( ([0.0], np.cumsum( x )) )
+    cum_sq  = np.concatenate( ([0.0], np.cumsum( x*x )) )
+
+    mean    = (cum[window:] - cum[:-window])/window
+    var     = (cum_sq[window:] - cum_sq[:-window])/window - mean*mean
+
+    return mean + offset, np.sqrt( np.maximum( var, 0 ) )
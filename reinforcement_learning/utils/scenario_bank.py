@@ -0,0 +1,134 @@
+#####################################
+# scenario_bank.py
+#
+# This file contains the scenario bank of the 2LC scene. A scenario is everything initScene draws at random :
+# lane width, valid direction of the tee, obstacle slot, start position and goal offset.
+# Environments keep one scenario row for each test case (fillScenario), hence scene_const is never modified by resets.
+# Scenarios are generated once with their own RandomState, and saved as a structured array (.npy), one row per scenario.
+# Resets then pick scenarios by index, hence the same index gives the same scenario in every process,
+# and a fixed evaluation set can be split into shards.
+#
+# Usage
+#   python -m utils.scenario_bank eval_bank.npy --COUNT 1000 --SEED 1 --COURSE_EPS 0
+#####################################
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+from utils.scene_geometry_2LC import (OBS_RIGHT, sampleGoalX, sampleObsSlot,
+                                      sampleStartPos, sampleValidDir)
+
+# One row per scenario. start_x, start_y and goal_x are offsets from the origin of the test case
+SCENARIO_DTYPE = np.dtype([
+    ('lane_width',  np.float64),
+    ('valid_dir',   np.int8),       # 0/1/2 : left/straight/right
+    ('obs_slot',    np.int8),       # 0/1/2 : left/middle/right
+    ('start_x',     np.float64),
+    ('start_y',     np.float64),
+    ('goal_x',      np.float64),
+    ('course_eps',  np.float32),
+])
+
+
+# Random scenario of a single test case. Same distributions as env_py.initScene with randomize_input = True
+# Input
+#   course_eps : course hardness. 0 - hard, 1 - easy
+#   rng        : np.random or RandomState
+# Output
+#   row of SCENARIO_DTYPE (tuple)
+def sampleScenario( scene_const, course_eps = 0, rng = np.random ):
+    lane_width   = rng.random_sample()*(scene_const.MAX_LANE_WIDTH - scene_const.MIN_LANE_WIDTH) + scene_const.MIN_LANE_WIDTH
+    valid_dir    = sampleValidDir( rng )
+    x_pos, y_pos = sampleStartPos( scene_const, rng )
+    obs_slot     = sampleObsSlot( scene_const, rng )
+    goal_x       = sampleGoalX( scene_const, valid_dir, course_eps, rng )
+
+    return ( lane_width, valid_dir, obs_slot, x_pos.item(), y_pos.item(), goal_x, course_eps )
+
+# Scenario without randomization. Default lane width, vehicle at the start and obstacle on the right. Valid direction is still random
+# Output
+#   row of SCENARIO_DTYPE (tuple)
+def getDefaultScenario( scene_const, rng = np.random ):
+    return ( scene_const.lane_width, sampleValidDir( rng ), OBS_RIGHT, 0, 0, 0, 0 )
+
+# Set scenarios of the test cases to reset. Each test case is randomized independently
+# Input
+#   veh_scenario : VEH_COUNT rows of SCENARIO_DTYPE, owned by the environment. Updated in place
+#   randomize    : T/F. If False, default scenario
+#   scenario     : rows of SCENARIO_DTYPE, one for each entry of veh_reset_list. Used instead of random scenarios. None to skip
+def fillScenario( veh_scenario, scene_const, veh_reset_list, randomize, course_eps = 0, scenario = None ):
+    if scenario is not None and len(scenario) != len(veh_reset_list):
+        raise ValueError('Number of scenarios ' + str(len(scenario)) + ' does not match veh_reset_list ' + str(len(veh_reset_list)))
+
+    for k, v in enumerate( veh_reset_list ):
+        if scenario is not None:
+            veh_scenario[v] = scenario[k]
+        elif randomize == True:
+            veh_scenario[v] = sampleScenario( scene_const, course_eps )
+        else:
+            veh_scenario[v] = getDefaultScenario( scene_const )
+
+    return veh_scenario
+
+# Generate scenarios
+# Input
+#   count      : number of scenarios
+#   course_eps : course hardness. 0 - hard, 1 - easy
+#   seed       : seed of the RandomState. Global random state is not used
+# Output
+#   bank : count rows of SCENARIO_DTYPE
+def genScenarioBank( scene_const, count, course_eps = 0, seed = 0 ):
+    rng  = np.random.RandomState( seed )
+    bank = np.zeros( count, dtype = SCENARIO_DTYPE )
+
+    for i in range(0, count):
+        bank[i] = sampleScenario( scene_const, course_eps, rng )
+
+    return bank
+
+def saveScenarioBank( file_path, bank ):
+    np.save( file_path, bank, allow_pickle = False )
+    return
+
+# Input
+#   mmap : T/F. If True, rows are read from the file when accessed
+def loadScenarioBank( file_path, mmap = False ):
+    bank = np.load( file_path, mmap_mode = 'r' if mmap == True else None, allow_pickle = False )
+    if bank.dtype != SCENARIO_DTYPE:
+        raise ValueError('Not a scenario bank : ' + file_path + ' ' + str(bank.dtype))
+
+    return bank
+
+# Indices of the scenarios of a shard. Shards are contiguous and differ in size by at most 1
+# Input
+#   count       : number of scenarios in the bank
+#   shard_index : 0 ... shard_count-1
+# Output
+#   range of scenario indices
+def getShard( count, shard_index, shard_count ):
+    if shard_index < 0 or shard_index >= shard_count:
+        raise ValueError('Invalid shard ' + str(shard_index) + ' of ' + str(shard_count))
+
+    return range( (count*shard_index)//shard_count, (count*(shard_index+1))//shard_count )
+
+
+if __name__ == '__main__':
+    from utils.scene_constants_pb import scene_constants
+
+    parser = ArgumentParser( description = 'Generate a scenario bank' )
+    parser.add_argument('OUTPUT', type=str,
+                        help='Output file (.npy)')
+    parser.add_argument('--COUNT', type=int, default=1000,
+                        help='Number of scenarios')
+    parser.add_argument('--SEED', type=int, default=1,
+                        help='Seed of the scenarios')
+    parser.add_argument('--COURSE_EPS', type=float, default=0.0,
+                        help='Course hardness. 0 - hard, 1 - easy')
+    bank_options = parser.parse_args()
+
+    bank = genScenarioBank( scene_constants(), bank_options.COUNT, bank_options.COURSE_EPS, bank_options.SEED )
+    saveScenarioBank( bank_options.OUTPUT, bank )
+
+    print('Saved ' + str(len(bank)) + ' scenarios to ' + bank_options.OUTPUT)
+    sys.exit()
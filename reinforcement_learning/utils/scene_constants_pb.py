@@ -59,7 +59,7 @@ class scene_constants:
 
     # Test Case related
     obs_w           = (3/8)         # obstacle width ratio
-    lane_width      = 2             # lane width
+    lane_width      = 2             # lane width when not randomized. Randomized lane width of each test case is in env.scenario
     lane_len        = 50            # total len
     turn_len        = 30            # total len after tun
     case_x          = 50            # distance between each case
@@ -0,0 +1,216 @@
+#####################################
+# scene_geometry_2LC.py
+#
+# This file contains the geometry of the 2LC (tee-intersection) test case, without PyBullet.
+# Every wall is an axis aligned box [cx, cy, hx, hy] : center and half extents in x,y. Height is scene_const.wall_h.
+# utils_pb_scene_2LC creates the PyBullet bodies from these boxes, and env_surrogate uses them directly.
+#####################################
+import numpy as np
+
+# Number of walls of the tee without obstacle. Obstacle is wall index 8
+TEE_WALL_COUNT  = 8
+
+# Obstacle slots. Same as direction of initScene_2LC
+OBS_LEFT        = 0
+OBS_MIDDLE      = 1
+OBS_RIGHT       = 2
+
+# Valid directions of the tee. Same as valid_dir of genScene
+DIR_LEFT        = 0
+DIR_STRAIGHT    = 1
+DIR_RIGHT       = 2
+
+
+# Sample valid direction of the tee. Same probabilities as createTee
+# Input
+#   rng : np.random or np.random.RandomState
+# Output
+#   valid_dir : 0/1/2 : left/middle/right
+def sampleValidDir( rng = np.random ):
+    sample = rng.random_sample(1)
+    if 0 <= sample and sample <= (1/3):
+        return DIR_LEFT
+    elif (1/3) <= sample and sample <= (2/3):
+        return DIR_RIGHT
+    elif (2/3) <= sample and sample <= 1:
+        return DIR_STRAIGHT
+
+    raise ValueError('Invalid direction')
+
+# Sample start position of the vehicle w.r.t. the test case. Same as initScene_2LC
+# Output
+#   x_pos, y_pos : 1 element arrays
+def sampleStartPos( scene_const, rng = np.random ):
+    x_pos = scene_const.MIN_X_POS + rng.random_sample(1)*(scene_const.MAX_X_POS - scene_const.MIN_X_POS)
+    y_pos = scene_const.MIN_Y_INIT + rng.random_sample(1) * (scene_const.MAX_Y_INIT - scene_const.MIN_Y_INIT)
+
+    # If y_pos lies between obstacle, just start closer to the goal point
+    if y_pos >= scene_const.MIN_OBS_Y_POS and y_pos <= scene_const.MAX_OBS_Y_POS:
+        y_pos = np.array([ scene_const.MAX_OBS_Y_POS ])
+
+    return x_pos, y_pos
+
+# Sample obstacle slot among scene_const.OBS_ENABLE. Same as initScene_2LC
+def sampleObsSlot( scene_const, rng = np.random ):
+    valid_opt = np.arange(3)[np.nonzero(scene_const.OBS_ENABLE)]
+    return rng.choice( valid_opt, 1).item()
+
+# Boxes of the tee walls
+# Input
+#   x_pos, y_pos : position of the test case
+#   lane_width   : lane width of the test case
+#   valid_dir    : 0/1/2 : left/straight/right. Other paths are closed by extending the side walls. None to keep all paths open
+# Output
+#   boxes : TEE_WALL_COUNT x 4, [cx, cy, hx, hy]
+def getTeeBoxes( scene_const, x_pos, y_pos, lane_width, valid_dir = None ):
+    left_len  = 0
+    right_len = 0
+    if valid_dir == DIR_LEFT:
+        right_len = lane_width*2
+    elif valid_dir == DIR_RIGHT:
+        left_len  = lane_width*2
+    elif valid_dir == DIR_STRAIGHT:
+        left_len  = lane_width*2
+        right_len = lane_width*2
+
+    lane_len = scene_const.lane_len
+    turn_len = scene_const.turn_len
+    wall_len = 0.5*(turn_len - lane_width)
+
+    return np.array([
+        # Walls left & right
+        [ x_pos - lane_width*0.5,                   y_pos,                                  0.02,           0.5*lane_len + left_len  ],
+        [ x_pos + lane_width*0.5,                   y_pos,                                  0.02,           0.5*lane_len + right_len ],
+
+        # Walls front & back
+        [ x_pos,                                    y_pos + lane_len*0.5 + lane_width,      0.5*turn_len,   0.02 ],
+        [ x_pos,                                    y_pos - lane_len*0.5,                   0.5*lane_width, 0.02 ],
+
+        # Walls at intersection
+        [ x_pos + 0.5*lane_width + 0.5*wall_len,    y_pos + lane_len*0.5,                   0.5*wall_len,   0.02 ],
+        [ x_pos - 0.5*lane_width - 0.5*wall_len,    y_pos + lane_len*0.5,                   0.5*wall_len,   0.02 ],
+
+        # Walls at the end
+        [ x_pos - 0.5*turn_len,                     y_pos + lane_len*0.5 + lane_width*0.5,  0.02,           0.5*lane_width ],
+        [ x_pos + 0.5*turn_len,                     y_pos + lane_len*0.5 + lane_width*0.5,  0.02,           0.5*lane_width ],
+    ])
+
+# Box of the obstacle. Obstacle lies at 0.3*lane_len
+# Input
+#   slot : 0/1/2 : left/middle/right
+# Output
+#   box : [cx, cy, hx, hy]
+def getObstacleBox( scene_const, x_pos, y_pos, lane_width, slot ):
+    obs_width = scene_const.obs_w * lane_width
+    offset    = 0.5*(1 - scene_const.obs_w)*lane_width
+
+    if slot == OBS_LEFT:
+        obs_x = x_pos - offset
+    elif slot == OBS_MIDDLE:
+        obs_x = x_pos
+    elif slot == OBS_RIGHT:
+        obs_x = x_pos + offset
+    else:
+        raise ValueError('Invalid obstacle slot')
+
+    return np.array([ obs_x, y_pos + scene_const.lane_len*0.3, 0.5*obs_width, 0.5*obs_width ])
+
+# Position of the goal point
+# Input
+#   goal_x : x offset of the goal from the center of the lane
+# Output
+#   [x, y]
+def getGoalPos( scene_const, x_pos, y_pos, lane_width, goal_x = 0 ):
+    return np.array([ x_pos + goal_x, y_pos + 0.5*scene_const.lane_len + 0.5*lane_width ])
+
+# Sample x offset of the goal point. Same as initScene_2LC
+# Input
+#   valid_dir  : 0/1/2 : left/straight/right
+#   course_eps : course hardness. 0 - hard, 1 - easy
+def sampleGoalX( scene_const, valid_dir, course_eps, rand ):
+    if valid_dir == DIR_LEFT:
+        return rand.uniform(-1*scene_const.turn_len*0.5 + 1.0, 0) * (1 - course_eps)
+    elif valid_dir == DIR_STRAIGHT:
+        return rand.uniform(-1.0, 1.0) * (1 - course_eps)
+    elif valid_dir == DIR_RIGHT:
+        return rand.uniform(0, scene_const.turn_len*0.5 - 1.0) * (1 - course_eps)
+
+    raise ValueError('Invalid direction at valid_dir')
+
+# Bounds of all test cases, for any lane width up to MAX_LANE_WIDTH
+# Output
+#   [x_min, y_min, x_max, y_max]
+def getWorldBounds( scene_const, options ):
+    lane_width = max( scene_const.lane_width, scene_const.MAX_LANE_WIDTH )
+    margin     = 1.0
+    row_count  = int( options.VEH_COUNT/options.X_COUNT )
+
+    return [
+        -0.5*scene_const.turn_len - margin,
+        -0.5*scene_const.lane_len - 2*lane_width - margin,
+        (options.X_COUNT - 1)*scene_const.case_x + 0.5*scene_const.turn_len + margin,
+        (row_count - 1)*scene_const.case_y + 0.5*scene_const.lane_len + 2*lane_width + margin
+    ]
+
+
+#####################################
+# Route segments. A route is a chain of segments of length lane_len along +y, starting at the test case.
+# Segment i spans y_pos - 0.5*lane_len + i*lane_len ... y_pos + 0.5*lane_len + i*lane_len, same as the lane of the tee.
+#####################################
+SEG_STRAIGHT    = 0             # Straight lane. May have an obstacle
+SEG_CROSS       = 1             # Lane crossing a side road on both sides. Side roads are closed at 0.5*turn_len
+
+# Boxes of a route segment
+# Input
+#   kind       : SEG_STRAIGHT / SEG_CROSS
+#   seg_index  : index of the segment in the route
+#   obs_slot   : OBS_LEFT/MIDDLE/RIGHT, or -1 for no obstacle. Only for SEG_STRAIGHT
+#   first/last : T/F. Close the back of the first segment and the front of the last segment
+# Output
+#   boxes : N x 4, [cx, cy, hx, hy]
+def getRouteSegmentBoxes( scene_const, x_pos, y_pos, lane_width, kind, seg_index, obs_slot = -1, first = False, last = False ):
+    lane_len = scene_const.lane_len
+    turn_len = scene_const.turn_len
+    seg_y    = y_pos + seg_index*lane_len            # Center of the segment
+    boxes    = []
+
+    if kind == SEG_STRAIGHT:
+        # Walls left & right
+        boxes.append([ x_pos - lane_width*0.5, seg_y, 0.02, 0.5*lane_len ])
+        boxes.append([ x_pos + lane_width*0.5, seg_y, 0.02, 0.5*lane_len ])
+
+        if obs_slot >= 0:
+            boxes.append( getObstacleBox( scene_const, x_pos, seg_y, lane_width, obs_slot ) )
+    elif kind == SEG_CROSS:
+        # Walls left & right, split by the side roads
+        side_len = 0.5*(lane_len - lane_width)
+        for side in (-1, 1):
+            boxes.append([ x_pos + side*lane_width*0.5, seg_y - 0.5*lane_len + 0.5*side_len, 0.02, 0.5*side_len ])
+            boxes.append([ x_pos + side*lane_width*0.5, seg_y + 0.5*lane_len - 0.5*side_len, 0.02, 0.5*side_len ])
+
+        # Walls of the side roads, and walls at the end
+        wall_len = 0.5*(turn_len - lane_width)
+        for side in (-1, 1):
+            boxes.append([ x_pos + side*(0.5*lane_width + 0.5*wall_len), seg_y - 0.5*lane_width, 0.5*wall_len, 0.02 ])
+            boxes.append([ x_pos + side*(0.5*lane_width + 0.5*wall_len), seg_y + 0.5*lane_width, 0.5*wall_len, 0.02 ])
+            boxes.append([ x_pos + side*0.5*turn_len,                    seg_y,                    0.02,         0.5*lane_width ])
+    else:
+        raise ValueError('Invalid route segment kind')
+
+    if first == True:
+        boxes.append([ x_pos, seg_y - 0.5*lane_len, 0.5*lane_width, 0.02 ])
+    if last == True:
+        boxes.append([ x_pos, seg_y + 0.5*lane_len, 0.5*lane_width, 0.02 ])
+
+    return np.array( boxes )
+
+# Goal point of a route segment, just past the end of the segment, so that the goal moves to the next segment
+# before it can be reached. Goal of the last segment lies inside the closed end
+def getRouteGoalPos( scene_const, x_pos, y_pos, lane_width, seg_index, last = False ):
+    seg_end = y_pos + (seg_index + 0.5)*scene_const.lane_len
+    if last == True:
+        seg_end = seg_end - 0.5*lane_width
+    else:
+        seg_end = seg_end + 2*scene_const.detect_range
+
+    return np.array([ x_pos, seg_end ])
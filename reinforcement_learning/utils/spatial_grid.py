@@ -0,0 +1,177 @@
+#####################################
+# spatial_grid.py
+#
+# This file contains a uniform grid over the wall boxes of the scene, for geometry queries on the python side
+# (analytic lidar, collision pre-checks) whose cost does not grow with the number of test cases.
+# Each cell keeps the ids of the walls overlapping it. Rays walk through the cells (DDA), vectorized over all rays,
+# and are only tested against the walls of the cells they pass.
+# Walls are [cx, cy, hx, hy] (center and half extents in x,y), same as scene_geometry_2LC and lidar_np.
+#
+# Wall ids are chosen by the caller, e.g., veh_index*wall_cnt + wall index as in genScene / initScene_2LC.
+#####################################
+import math
+
+import numpy as np
+
+from utils.lidar_np import castRays, getWorldRays
+
+# Box of unused wall ids. Never hit by any ray
+EMPTY_BOX = np.array([ 1e12, 1e12, 0, 0 ])
+
+
+class wall_grid:
+    # Input
+    #   bounds    : [x_min, y_min, x_max, y_max] of the world. See scene_geometry_2LC.getWorldBounds
+    #   max_walls : maximum number of walls (ids are 0 ... max_walls-1)
+    #   cell_size : size of a cell in metres. About the length of the lidar rays works well
+    def __init__(self, bounds, max_walls, cell_size = 10.0):
+        self.origin     = np.array( bounds[0:2], dtype = float )
+        self.cell_size  = float(cell_size)
+        self.cell_dim   = np.maximum( np.ceil( (np.array( bounds[2:4], dtype = float ) - self.origin)/self.cell_size ).astype(int), 1 )
+        self.cell_cnt   = int( self.cell_dim[0]*self.cell_dim[1] )
+
+        # Walls
+        self.wall_box   = np.tile( EMPTY_BOX, (max_walls, 1) )
+        self.wall_cells = [ [] for _ in range(max_walls) ]
+
+        # Walls of each cell, padded with -1. Last row is an empty cell used for cells outside of the grid
+        self.cell_walls = -1*np.ones( (self.cell_cnt + 1, 4), dtype = int )
+        self.cell_fill  = np.zeros( self.cell_cnt + 1, dtype = int )
+        return
+
+    # Index of cells overlapping a box
+    def __getBoxCells(self, box):
+        lo = np.floor( (box[0:2] - box[2:4] - self.origin)/self.cell_size ).astype(int)
+        hi = np.floor( (box[0:2] + box[2:4] - self.origin)/self.cell_size ).astype(int)
+        if np.any( lo < 0 ) or np.any( hi >= self.cell_dim ):
+            raise ValueError('Wall ' + str(box) + ' is outside of the grid')
+
+        ix, iy = np.meshgrid( np.arange(lo[0], hi[0]+1), np.arange(lo[1], hi[1]+1), indexing = 'ij' )
+        return (iy*self.cell_dim[0] + ix).ravel()
+
+    # Add, move or remove a wall
+    # Input
+    #   wall_id : id of the wall
+    #   box     : [cx, cy, hx, hy]. None to remove the wall
+    def updateBox(self, wall_id, box):
+        # Remove from old cells
+        for cell in self.wall_cells[wall_id]:
+            row = self.cell_walls[cell]
+            keep = row[ (row != wall_id) & (row >= 0) ]
+            row[:] = -1
+            row[0:len(keep)] = keep
+            self.cell_fill[cell] = len(keep)
+        self.wall_cells[wall_id] = []
+        self.wall_box[wall_id]   = EMPTY_BOX
+
+        if box is None:
+            return
+
+        box   = np.asarray( box, dtype = float )
+        cells = self.__getBoxCells( box )
+
+        # Grow the cell table if needed
+        max_fill = int( self.cell_fill[cells].max() ) + 1
+        if max_fill > self.cell_walls.shape[1]:
+            grown = -1*np.ones( (self.cell_walls.shape[0], 2*self.cell_walls.shape[1]), dtype = int )
+            grown[:, 0:self.cell_walls.shape[1]] = self.cell_walls
+            self.cell_walls = grown
+
+        self.cell_walls[cells, self.cell_fill[cells]] = wall_id
+        self.cell_fill[cells] += 1
+
+        self.wall_cells[wall_id] = cells.tolist()
+        self.wall_box[wall_id]   = box
+        return
+
+    # Add or move many walls
+    # Input
+    #   wall_ids : N
+    #   boxes    : N x 4
+    def updateBoxes(self, wall_ids, boxes):
+        for wall_id, box in zip( wall_ids, boxes ):
+            self.updateBox( wall_id, box )
+        return
+
+    # Cells passed by each ray. DDA, vectorized over rays
+    # Input
+    #   origin : N x 2
+    #   delta  : N x 2
+    # Output
+    #   cells : N x K, index of cells. Cells outside of the grid are the empty cell
+    def getRayCells(self, origin, delta):
+        pos     = (origin - self.origin)/self.cell_size
+        cell    = np.floor( pos ).astype(int)
+        step    = np.where( delta >= 0, 1, -1 )
+
+        with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+            t_delta = np.where( delta != 0, self.cell_size/np.abs(delta), np.inf )
+            t_max   = np.where( delta != 0, ((cell + (step > 0)) - pos)*self.cell_size/delta, np.inf )
+
+        # A ray of length L passes at most L/cell_size cells in each axis, plus the first cell
+        max_len     = np.abs( delta ).max( axis = 0 ) if delta.shape[0] > 0 else np.zeros(2)
+        step_cnt    = int( math.ceil( max_len[0]/self.cell_size ) + math.ceil( max_len[1]/self.cell_size ) ) + 1
+
+        cells = np.empty( (origin.shape[0], step_cnt), dtype = int )
+        for k in range(0, step_cnt):
+            inside      = np.all( (cell >= 0) & (cell < self.cell_dim), axis = 1 )
+            cells[:,k]  = np.where( inside, cell[:,1]*self.cell_dim[0] + cell[:,0], self.cell_cnt )
+
+            # Advance along the axis whose boundary is closer
+            axis            = (t_max[:,1] < t_max[:,0]).astype(int)
+            rows            = np.arange( origin.shape[0] )
+            cell[rows,axis]  += step[rows,axis]
+            t_max[rows,axis] += t_delta[rows,axis]
+
+        return cells
+
+    # Cast rays against the walls of the grid
+    # Input
+    #   origin : ... x 2
+    #   delta  : ... x 2
+    # Output
+    #   fraction : ..., in [0,1]. 1 if no hit
+    #   hit      : ..., True if any wall is hit
+    def castRays(self, origin, delta):
+        shape   = origin.shape[:-1]
+        origin  = origin.reshape(-1, 2)
+        delta   = delta.reshape(-1, 2)
+
+        # Candidate walls of each ray. Padding (-1) is the empty box
+        candidate = self.cell_walls[ self.getRayCells( origin, delta ) ].reshape( origin.shape[0], -1 )
+        boxes     = np.where( (candidate >= 0)[...,np.newaxis], self.wall_box[candidate], EMPTY_BOX )
+
+        fraction, hit = castRays( origin[:,np.newaxis,:], delta[:,np.newaxis,:], boxes )
+
+        return fraction.reshape(shape), hit.reshape(shape)
+
+    # Lidar measurement of vehicles. Same as lidar_np.getLidar, but against all walls of the grid
+    # Input
+    #   ray_pos     : VEH_COUNT x 2, position of the lidar
+    #   ray_heading : VEH_COUNT. north = 0 rad, east = pi/2 rad
+    # Output
+    #   VEH_COUNT x sensor_count*2. Hit fraction (1 if no hit) and detection state (1 : open, 0 : hit)
+    def getLidar(self, scene_const, ray_pos, ray_heading):
+        origin, delta = getWorldRays( scene_const, ray_pos, ray_heading )
+        fraction, hit = self.castRays( origin, delta )
+
+        return np.concatenate( (fraction, np.where( hit, 0.0, 1.0 )), axis = -1 )
+
+    # Walls overlapping a box, e.g., footprint of a vehicle for collision pre-check
+    # Input
+    #   box : [cx, cy, hx, hy]
+    # Output
+    #   wall ids
+    def queryBox(self, box):
+        box = np.asarray( box, dtype = float )
+        lo  = np.clip( np.floor( (box[0:2] - box[2:4] - self.origin)/self.cell_size ).astype(int), 0, self.cell_dim - 1 )
+        hi  = np.clip( np.floor( (box[0:2] + box[2:4] - self.origin)/self.cell_size ).astype(int), 0, self.cell_dim - 1 )
+
+        ix, iy    = np.meshgrid( np.arange(lo[0], hi[0]+1), np.arange(lo[1], hi[1]+1), indexing = 'ij' )
+        candidate = np.unique( self.cell_walls[ (iy*self.cell_dim[0] + ix).ravel() ] )
+        candidate = candidate[ candidate >= 0 ]
+
+        wall_box = self.wall_box[candidate]
+        overlap  = np.all( np.abs( wall_box[:,0:2] - box[0:2] ) <= wall_box[:,2:4] + box[2:4], axis = 1 )
+
+        return candidate[overlap]
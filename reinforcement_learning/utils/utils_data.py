@@ -1,97 +1,146 @@
 import math
-import pickle
-import sys
+from collections import deque
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-# This is class for storing all the data
-
-# This will also includes various functionalities such as saving into pikcle for making a graph
+from utils.metrics_log import loadMetric, metric_stream
+from utils.running_stats import ema_stats, rollingStats, window_stats
 
-# Helpers
-# Calculate the running average
-# x: input 1D numpy array
-# N: Window
-def rolling_window(a, window):
-    shape = np.asarray(a).shape[:-1] + (np.asarray(a).shape[-1] - window + 1, window)
-    strides = np.asarray(a).strides + (np.asarray(a).strides[-1],)
-    return np.lib.stride_tricks.as_strided(np.asarray(a), shape=shape, strides=strides)
+# This is class for storing all the data
 
+# This will also includes various functionalities such as streaming into files (metrics_log) for making a graph
 
+# Running averages are computed online with running_stats, e.g., rollingStats for plot_reward
 
 # Class for storing and plotting data
 #   epi_reward : reward of each episode
 #   avg_loss   : loss of every update. Average across the batch 
 #   eps        : eps used for each episode 
+# Every entry is streamed to the disk (metrics_log), and only the latest `window` entries are kept in memory
+# Running average of the latest running_avg episodes is updated with each entry (running_stats), and streamed for plot_reward
 class data_pack:
-    def __init__(self, start_time_str, epi_reward_data = None, avg_loss_data = None, eps_data = None, success_rate_data = None):
-        # Data
+    def __init__(self, start_time_str, epi_reward_data = None, avg_loss_data = None, eps_data = None, success_rate_data = None, window = 10000,
+                 reward_path = './result_data/reward_data/', loss_path = './result_data/loss_data/', running_avg = 100):
+        # Data. Latest entries only
         if epi_reward_data == None:
-            self.epi_reward         = []       # List of rewards of single episode
+            self.epi_reward         = deque( maxlen = window )      # List of rewards of single episode
         else:
-            self.epi_reward         = epi_reward_data
+            self.epi_reward         = deque( epi_reward_data, maxlen = window )
         
         if avg_loss_data == None:
-            self.avg_loss           = [ 0 ]       # list of loss. per step(?)
+            self.avg_loss           = deque( [ 0 ], maxlen = window )       # list of loss. per step(?)
         else:
-            self.avg_loss           = avg_loss_data
+            self.avg_loss           = deque( avg_loss_data, maxlen = window )
 
-        if avg_loss_data == None:
-            self.eps                = []       # list of loss. per step(?)
+        if eps_data == None:
+            self.eps                = deque( maxlen = window )       # list of eps. per episode
         else:
-            self.eps                = avg_loss_data
+            self.eps                = deque( eps_data, maxlen = window )
 
         if success_rate_data == None:
-            self.success_rate       = []
+            self.success_rate       = deque( maxlen = window )
         else:
-            self.success_rate       = success_rate_data
+            self.success_rate       = deque( success_rate_data, maxlen = window )
 
         # File Names
         self.start_time_str     = start_time_str
 
+        # Streams of all entries
+        self.reward_stream       = metric_stream( reward_path + 'reward_data_' + start_time_str )
+        self.eps_stream          = metric_stream( reward_path + 'eps_data_' + start_time_str )
+        self.success_rate_stream = metric_stream( reward_path + 'success_rate_data_' + start_time_str, dtype = np.float32 )
+        self.loss_stream         = metric_stream( loss_path + 'avg_loss_value_data_' + start_time_str, dtype = np.float32 )
+
+        # Running statistics
+        self.running_avg         = running_avg
+        self.reward_stats        = window_stats( running_avg )
+        self.eps_stats           = window_stats( running_avg )
+        self.success_rate_stats  = window_stats( running_avg )
+        self.reward_ema          = ema_stats( running_avg )
+        self.success_rate_ema    = ema_stats( running_avg )
+
+        # Running average of every full window. Entry i is over episode i ... i+running_avg-1
+        self.reward_mean_stream       = metric_stream( reward_path + 'reward_mean_data_' + start_time_str )
+        self.reward_std_stream        = metric_stream( reward_path + 'reward_std_data_' + start_time_str )
+        self.eps_mean_stream          = metric_stream( reward_path + 'eps_mean_data_' + start_time_str )
+        self.success_rate_mean_stream = metric_stream( reward_path + 'success_rate_mean_data_' + start_time_str )
+
     # Update reward array
     def add_reward(self, new_reward ):
         self.epi_reward.append( new_reward ) 
+        self.reward_stream.append( new_reward )
+
+        mean, std = self.reward_stats.update( new_reward )
+        self.reward_ema.update( new_reward )
+        if self.reward_stats.full:
+            self.reward_mean_stream.append( mean )
+            self.reward_std_stream.append( std )
         return
 
     # Update loss
     def add_loss(self, new_loss):
         self.avg_loss.append( new_loss )
+        self.loss_stream.append( new_loss )
         return
 
     # Update loss
     def add_eps(self, new_eps):
         self.eps.append( new_eps )
+        self.eps_stream.append( new_eps )
+
+        mean, _ = self.eps_stats.update( new_eps )
+        if self.eps_stats.full:
+            self.eps_mean_stream.append( mean )
         return
 
     # Update success rate
     def add_success_rate(self, new_rate):
         self.success_rate.append( new_rate )
+        self.success_rate_stream.append( new_rate )
+
+        mean, _ = self.success_rate_stats.update( new_rate )
+        self.success_rate_ema.update( new_rate )
+        if self.success_rate_stats.full:
+            self.success_rate_mean_stream.append( mean )
         return
 
-    # Save reward data into a pickle
-    def save_reward(self, save_path = './result_data/reward_data/'):
-        # Save Reward Data
-        outfile = open( save_path + 'reward_data_' + self.start_time_str, 'wb')  
-        pickle.dump( self.epi_reward, outfile )
-        outfile.close()
+    # Average success rate of the latest episodes
+    # Input
+    #   count : number of episodes. Up to window
+    def get_success_rate(self, count):
+        if len(self.success_rate) == 0:
+            return np.nan
 
-        return
+        # O(1) for the running average window
+        if count == self.running_avg:
+            return self.success_rate_stats.mean
 
-    # Save loss data
-    def save_loss(self, save_path = './result_data/loss_data/' ): 
-        outfile = open( save_path + 'avg_loss_value_data_' + self.start_time_str, 'wb')  
-        pickle.dump( self.avg_loss , outfile )
-        outfile.close()
+        return np.mean( list(self.success_rate)[-count:] )
 
+    # Save reward, eps and success rate. Only the entries after the last full chunk are written
+    def save_reward(self):
+        for stream in [ self.reward_stream, self.eps_stream, self.success_rate_stream, self.reward_mean_stream, self.reward_std_stream, self.eps_mean_stream, self.success_rate_mean_stream ]:
+            stream.flush()
         return
 
-    def plot_loss(self, save_path = './result_data/avg_loss_value_data/' ):
+    # Save loss data. Only the entries after the last full chunk are written
+    def save_loss(self): 
+        self.loss_stream.flush()
+        return
+
+    # Input
+    #   max_points : loss is decimated to at most max_points entries
+    def plot_loss(self, save_path = './result_data/avg_loss_value_data/', max_points = 100000 ):
+        import matplotlib.pyplot as plt
+
+        self.save_loss()
+        stride   = max( 1, int( math.ceil( len(self.loss_stream)/max_points ) ) )
+        avg_loss = loadMetric( self.loss_stream.file_prefix, stride )
+
         # Plot Average Step Loss
         plt.figure(1)
         fig, ax2 = plt.subplots()
-        ax2.plot(self.avg_loss)
+        ax2.plot(np.arange(len(avg_loss))*stride, avg_loss)
         
         ax2.set_title("Average Loss per Batch Step")
         ax2.set_xlabel("Global Step")
@@ -102,23 +151,33 @@ class data_pack:
 
     # Save a graph of reward, epsilon and success rate
     def plot_reward(self, running_avg, save_path = './result_data/reward_data/'):
+        import matplotlib.pyplot as plt
+
+        self.save_reward()
+
+        # Running averages are already computed for running_avg of data_pack
+        if running_avg == self.running_avg:
+            reward_mean  = loadMetric( self.reward_mean_stream.file_prefix )
+            reward_std   = loadMetric( self.reward_std_stream.file_prefix )
+            eps_mean     = loadMetric( self.eps_mean_stream.file_prefix )
+            rate_mean    = loadMetric( self.success_rate_mean_stream.file_prefix )
+        else:
+            reward_mean, reward_std = rollingStats( loadMetric( self.reward_stream.file_prefix ), running_avg )
+            eps_mean, _             = rollingStats( loadMetric( self.eps_stream.file_prefix ), running_avg )
+            rate_mean, _            = rollingStats( loadMetric( self.success_rate_stream.file_prefix ), running_avg )
+
         plt.figure(0)
         fig, ax1 = plt.subplots()
 
-        # x coord & rolling window
-        x_coord  = range(0,len(self.epi_reward) - running_avg + 1)
-        roll     = rolling_window(self.epi_reward,running_avg)
-        roll_eps = rolling_window(self.eps,running_avg)
-        roll_rate= rolling_window(self.success_rate,running_avg)
-
-        # print('roll:', roll)
-        # print('mean:', np.mean(roll,-1))
-        # print('std:', np.std(roll,-1))
+        # x coord
+        x_count  = min( len(reward_mean), len(eps_mean), len(rate_mean) )
+        x_coord  = range(0,x_count)
+        reward_mean, reward_std, eps_mean, rate_mean = reward_mean[0:x_count], reward_std[0:x_count], eps_mean[0:x_count], rate_mean[0:x_count]
 
         # Mean
-        ax1.plot(x_coord, np.mean(roll,-1))
+        ax1.plot(x_coord, reward_mean)
         # Std Dev
-        ax1.fill_between(x_coord, np.mean(roll,-1) + np.std(roll,-1), np.mean(roll,-1) - np.std(roll,-1), alpha = 0.5)
+        ax1.fill_between(x_coord, reward_mean + reward_std, reward_mean - reward_std, alpha = 0.5)
 
         ax1.set_title("Running Average of Episode Reward (Window:" + str(running_avg) + ')')
         ax1.set_xlabel("Episode")
@@ -127,9 +186,9 @@ class data_pack:
         # Second y-axis for reward
         ax2 = ax1.twinx()
         # EPS
-        ax2.plot(x_coord, np.mean(roll_eps,-1), color='red', label='eps')
+        ax2.plot(x_coord, eps_mean, color='red', label='eps')
         # Rate
-        ax2.plot(x_coord, np.mean(roll_rate,-1), color='green')
+        ax2.plot(x_coord, rate_mean, color='green')
 
         ax2.set_ylabel('epsilon & success rate')
         ax2.set_ylim(0,1)
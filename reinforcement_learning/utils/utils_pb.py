@@ -204,47 +204,9 @@ def controlCamera(cam_pos, cam_dist):
       cam_dist = cam_dist + 1
     if keys.get(55):  #7
       cam_dist = cam_dist - 1
-    p.resetDebugVisualizerCamera( cameraDistance = cam_dist, cameraYaw = 0, cameraPitch = -89, cameraTargetPosition = cam_pos )
 
-    return cam_pos, cam_dist
-
-# Draw Debug Lines
-# Input
-#   ray_batch_result: result from raytest batch 
-#   sensor_data
-#   createInit : create initial debug lines
-# Output
-#   rayIds : 2d array for ray id. each row is ray ids for a single vehicle
-def drawDebugLines( options, scene_const, handle_dict, sensor_data = -1, ray_id = -1, createInit = False, ray_width = 2, rayHitColor = [1,0,0], rayMissColor = [0,1,0]):
-    # Paremters?
-    rayIds=[]                   # 2d array for ray id
-    # rayHitColor = [1,0,0]
-    # rayMissColor = [0,1,0]
-    hokuyo_joint = 8
-
-    # for each vehicle
-    for k in range (options.VEH_COUNT):
-        rayIds.append([])
-        # for each sensor
-        for i in range (scene_const.sensor_count):
-            # Reference is : y-axis for horizontal, +ve is left.   x-axis for vertical, +ve is up
-            # curr_angle = scene_const.sensor_max_angle - i*scene_const.sensor_delta
-
-            # No result just draw
-            if createInit == True:
-                rayIds[k].append(p.addUserDebugLine(scene_const.rayFrom[i], scene_const.rayTo[i], rayMissColor,parentObjectUniqueId=handle_dict['vehicle'][k], parentLinkIndex=hokuyo_joint ))
-            else:
-                # Draw
-                hit_fraction = sensor_data[k][i]
-                if hit_fraction == 1:      # If hit nothing
-                    ray_id[k][i] = p.addUserDebugLine(scene_const.rayFrom[i], scene_const.rayTo[i], rayMissColor,parentObjectUniqueId=handle_dict['vehicle'][k], parentLinkIndex=hokuyo_joint, replaceItemUniqueId = ray_id[k][i], lineWidth = ray_width  )
-                else:
-                    local_hit = np.asarray(scene_const.rayFrom[i]) + hit_fraction*(np.asarray(scene_const.rayTo[i]) - np.asarray(scene_const.rayFrom[i]) )
-                    ray_id[k][i] = p.addUserDebugLine(scene_const.rayFrom[i], local_hit, rayHitColor,parentObjectUniqueId=handle_dict['vehicle'][k], parentLinkIndex=hokuyo_joint, replaceItemUniqueId = ray_id[k][i], lineWidth = ray_width )
+    # Only move the camera if one of the keys was pressed
+    if any( keys.get(key) for key in range(49,56) ):
+      p.resetDebugVisualizerCamera( cameraDistance = cam_dist, cameraYaw = 0, cameraPitch = -89, cameraTargetPosition = cam_pos )
 
-    
-    if ray_id == -1: 
-        # If initial creation, return newly created handles
-        return rayIds
-    else:
-        return ray_id
+    return cam_pos, cam_dist
@@ -1,11 +1,13 @@
-import math
 import os
 import random
 
 import numpy as np
 import pybullet as p
 import pybullet_data
-from icecream import ic
+
+from utils.scene_geometry_2LC import (OBS_RIGHT, getGoalPos, getObstacleBox,
+                                      getTeeBoxes, sampleGoalX, sampleObsSlot,
+                                      sampleStartPos, sampleValidDir)
 
 #########################################
 # Files for generating the scene
@@ -44,6 +46,8 @@ def createGoal(size, pos):
 #   x_pos : x position of the test case
 #   scene_const
 #   openWall : T/F
+#   valid_dir: 0/1/2. If given, used instead of a random valid direction
+#   lane_width : lane width of the test case. If None, scene_const.lane_width
 # Note:
 # randomization is doen in initScene
 # Output
@@ -51,70 +55,31 @@ def createGoal(size, pos):
 #   wall_handle_list : array of wall's handle
 #   valid_dir : 0/1/2 : left,middle,right
 
-def createTee(x_pos, y_pos, scene_const, openWall=True):
+def createTee(x_pos, y_pos, scene_const, openWall=True, valid_dir=None, lane_width=None):
     wall_handle_list = []
 
-    # FIXME: These initial values are not valid if openWall is True
-    left_len = 0
-    right_len = 0
-    valid_dir = 0
+    if lane_width is None:
+        lane_width = scene_const.lane_width
 
     # If openWall = True, then randomly choose a valid direction and close walls for other paths
-    if openWall == False:
-        valid_dir = np.random.random(1)
-        if 0 <= valid_dir and valid_dir <= (1/3):
-            # Goal on left
-            left_len  = 0
-            right_len = scene_const.lane_width*2
-            valid_dir = 0
-        elif (1/3) <= valid_dir and valid_dir <= (2/3):
-            # Goal on right
-            left_len  = scene_const.lane_width*2
-            right_len = 0
-            valid_dir = 2
-        elif (2/3) <= valid_dir and valid_dir <= 1:
-            # Goal on straight
-            left_len  = scene_const.lane_width*2
-            right_len = scene_const.lane_width*2
-            valid_dir = 1
-        else:
-            ic(valid_dir)
-            raise ValueError('Invalid direction')
-
-    # Walls left & right
-    wall_handle_list.append(createWall([0.02, 0.5*scene_const.lane_len + left_len, scene_const.wall_h], [
-                            x_pos - scene_const.lane_width*0.5, y_pos, 0]))      # left
-    wall_handle_list.append(createWall([0.02, 0.5*scene_const.lane_len + right_len, scene_const.wall_h], [
-                            x_pos + scene_const.lane_width*0.5, y_pos, 0]))      # right
-
-    # Walls front & back
-    wall_handle_list.append(createWall([0.5*scene_const.turn_len, 0.02, scene_const.wall_h], [
-                            x_pos, y_pos + scene_const.lane_len*0.5 + scene_const.lane_width, 0]))               # front
-    wall_handle_list.append(createWall([0.5*scene_const.lane_width, 0.02, scene_const.wall_h], [
-                            x_pos, y_pos - 1*scene_const.lane_len*0.5, 0]))              # back
-
-    # Walls at intersection
-    wall_len = 0.5*(scene_const.turn_len - scene_const.lane_width)
-    wall_handle_list.append(createWall([0.5*wall_len, 0.02, scene_const.wall_h], [
-                            x_pos + 0.5*scene_const.lane_width + 0.5*wall_len, y_pos + scene_const.lane_len*0.5, 0]))
-    wall_handle_list.append(createWall([0.5*wall_len, 0.02, scene_const.wall_h], [
-                            x_pos - 0.5*scene_const.lane_width - 0.5*wall_len, y_pos + scene_const.lane_len*0.5, 0]))
-
-    # Walls at the end
-    wall_handle_list.append(createWall([0.02, 0.5*scene_const.lane_width, scene_const.wall_h], [
-                            x_pos - 0.5*scene_const.turn_len, y_pos + scene_const.lane_len*0.5 + scene_const.lane_width*0.5, 0]))
-    wall_handle_list.append(createWall([0.02, 0.5*scene_const.lane_width, scene_const.wall_h], [
-                            x_pos + 0.5*scene_const.turn_len, y_pos + scene_const.lane_len*0.5 + scene_const.lane_width*0.5, 0]))
+    if openWall == False and valid_dir is None:
+        valid_dir = sampleValidDir()
+
+    # FIXME: These initial values are not valid if openWall is True
+    if valid_dir is None:
+        valid_dir = 0
+
+    # Walls of the tee. Geometry is defined in scene_geometry_2LC
+    for box in getTeeBoxes( scene_const, x_pos, y_pos, lane_width, valid_dir if openWall == False else None ):
+        wall_handle_list.append(createWall([box[2], box[3], scene_const.wall_h], [box[0], box[1], 0]))
 
     # Create Obstacle
-    obs_width = scene_const.obs_w * scene_const.lane_width
-    wall_handle_list.append(createWall([0.5*obs_width, 0.5*obs_width, scene_const.wall_h], [x_pos + 0.5*(
-        1-scene_const.obs_w)*scene_const.lane_width, scene_const.lane_len*0.3, 0]))      # right
+    box = getObstacleBox( scene_const, x_pos, y_pos, lane_width, OBS_RIGHT )
+    wall_handle_list.append(createWall([box[2], box[3], scene_const.wall_h], [box[0], box[1], 0]))      # right
 
     # Create Goal point
     goal_z = 1.0
-    goal_y = y_pos + scene_const.lane_len*0.5 + scene_const.lane_width*0.5
-    goal_x      = x_pos
+    goal_x, goal_y = getGoalPos( scene_const, x_pos, y_pos, lane_width )
     goal_id = createGoal( 0.1, [ goal_x, goal_y, goal_z])
 
 
@@ -135,11 +100,13 @@ def createTee(x_pos, y_pos, scene_const, openWall=True):
 # Input
 #   genVehicle     : T/F. If true, generate vehicle, if not don't generate vehicle
 #   reset_case_list: list of testcase numbers which we generate the scene
+#   wall_grid      : spatial_grid.wall_grid to keep updated with the walls. Wall id is u_index*wall_cnt + wall index. None to skip
+#   scenario       : VEH_COUNT rows of scenario_bank.SCENARIO_DTYPE. Lane width and valid_dir are taken from it. None to use scene_const.lane_width and random valid_dir
 # Output
 #   handle_dict
 #   valid_dir : 1 x VEH_COUNT, each index 0/1/2 = left/middle/right
 
-def genScene(scene_const, options, handle_dict, reset_case_list, genVehicle=True):
+def genScene(scene_const, options, handle_dict, reset_case_list, genVehicle=True, wall_grid=None, scenario=None):
     if len(reset_case_list) == 0:
         return handle_dict, None
 
@@ -156,22 +123,47 @@ def genScene(scene_const, options, handle_dict, reset_case_list, genVehicle=True
             u_index = options.X_COUNT*j + i
 
             if u_index in reset_case_list:
+                lane_width = scene_const.lane_width if scenario is None else scenario['lane_width'][u_index]
+
                 # Generate T-intersection for now
-                handle_dict['dummy'][u_index], handle_dict['wall'][u_index], valid_dir[u_index] = createTee( i*scene_const.case_x, j*scene_const.case_y, scene_const, openWall = False)
+                handle_dict['dummy'][u_index], handle_dict['wall'][u_index], valid_dir[u_index] = createTee( i*scene_const.case_x, j*scene_const.case_y, scene_const, openWall = False, valid_dir = None if scenario is None else int(scenario['valid_dir'][u_index]), lane_width = lane_width )
+
+                if wall_grid is not None:
+                    updateCaseBoxes( scene_const, options, wall_grid, u_index, lane_width, valid_dir[u_index] )
 
-                # Save vehicle handle
+                # Save vehicle handle. Graphics shapes of the racecar are shared between vehicles
                 if genVehicle == True:
-                    temp = p.loadURDF(os.path.join(pybullet_data.getDataPath(), "racecar/racecar.urdf"), basePosition=[ i*scene_const.case_x, j*scene_const.case_y + scene_const.veh_init_y, 0], globalScaling=scene_const.veh_scale, useFixedBase=False, baseOrientation=[0, 0, 0.707, 0.707])
+                    temp = p.loadURDF(os.path.join(pybullet_data.getDataPath(), "racecar/racecar.urdf"), basePosition=[ i*scene_const.case_x, j*scene_const.case_y + scene_const.veh_init_y, 0], globalScaling=scene_const.veh_scale, useFixedBase=False, baseOrientation=[0, 0, 0.707, 0.707], flags=p.URDF_ENABLE_CACHED_GRAPHICS_SHAPES)
                     handle_dict['vehicle'][u_index] = temp
 
                 # Resets all wheels
-                for wheel in range(p.getNumJoints(handle_dict['vehicle'][u_index])):
-                    # print("joint[",wheel,"]=", p.getJointInfo(vehicle_handle[u_index],wheel))
-                    p.setJointMotorControl2(handle_dict['vehicle'][u_index], wheel, p.VELOCITY_CONTROL, targetVelocity=0, force=0)
-                    p.getJointInfo(handle_dict['vehicle'][u_index], wheel)
+                resetWheels( handle_dict, [u_index] )
 
     return handle_dict, valid_dir
 
+# Update walls of a test case in the wall grid
+# Input
+#   u_index    : unrolled index of the test case
+#   lane_width : lane width of the test case
+#   valid_dir  : 0/1/2 = left/middle/right
+def updateCaseBoxes(scene_const, options, wall_grid, u_index, lane_width, valid_dir):
+    x_pos = (u_index % options.X_COUNT)*scene_const.case_x
+    y_pos = (u_index // options.X_COUNT)*scene_const.case_y
+
+    boxes = np.vstack( (
+        getTeeBoxes( scene_const, x_pos, y_pos, lane_width, valid_dir ),
+        getObstacleBox( scene_const, x_pos, y_pos, lane_width, OBS_RIGHT )
+    ) )
+    wall_grid.updateBoxes( range(u_index*scene_const.wall_cnt, (u_index+1)*scene_const.wall_cnt), boxes )
+    return
+
+# Release the wheel motors of vehicles, so that wheels are only driven by applyAction
+def resetWheels(handle_dict, veh_list):
+    for v in veh_list:
+        for wheel in range(p.getNumJoints(handle_dict['vehicle'][v])):
+            p.setJointMotorControl2(handle_dict['vehicle'][v], wheel, p.VELOCITY_CONTROL, targetVelocity=0, force=0)
+    return
+
 # Remove the scene
 
 
@@ -193,16 +185,17 @@ def removeScene(scene_const, options, veh_reset_list, handle_dict):
 # veh_index_list : vehicle reset list
 # course_eps       : parameter for curriculum learning. [0,1]. 1 means easy, 0 means hard
 # valid_dir      : 1 x VEH_COUNT, each index 0/1/2 = left/middle/right
+# wall_grid      : spatial_grid.wall_grid to keep updated with the obstacle. None to skip
+# scenario       : VEH_COUNT rows of scenario_bank.SCENARIO_DTYPE. Lane width, start position, obstacle and goal are taken from it. None to use scene_const.lane_width and random values
 # Output
 #   direction : info about randomized testcase. 0/1/2 - left/straight/right
 #   goal_pos  : VEH_COUNT x 2 array of goal position
-def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir, course_eps = 0, randomize=False):
+def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir, course_eps = 0, randomize=False, wall_grid=None, scenario=None):
     # If reset list is empty, just return
     if len(veh_index_list) == 0:
         return None, None 
 
     vehicle_handle      = handle_dict['vehicle']
-    steer_handle        = handle_dict['steer']
     motor_handle        = handle_dict['motor']
     case_wall_handle    = handle_dict['wall']
 
@@ -216,20 +209,21 @@ def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir,
         # Reset position of vehicle. Randomize x-position if enabled
         x_index = veh_index % options.X_COUNT
         y_index = int(veh_index / options.X_COUNT)
+        lane_width = scene_const.lane_width if scenario is None else scenario['lane_width'][veh_index]
 
         if randomize == False:
             p.resetBasePositionAndOrientation(vehicle_handle[veh_index], [ scene_const.case_x * x_index, scene_const.case_y * y_index + scene_const.veh_init_y, 0], [0, 0, 0.707, 0.707])
+
+            # Same velocity as a newly loaded vehicle
+            p.resetBaseVelocity(vehicle_handle[veh_index], [0,0,0], [0,0,0])
         else:
             # randomize x_position between -0.5*lane_width + 0.6 ~ 0.5*lane_width - 0.6
             # x_pos = (random.uniform()-0.5)-1*scene_const.lane_width * 0.5 + 0.6, scene_const.lane_width*0.5 - 0.6)
-            x_pos = scene_const.MIN_X_POS + np.random.random(1)*(scene_const.MAX_X_POS - scene_const.MIN_X_POS)
-
-            # randomize y_position
-            y_pos = scene_const.MIN_Y_INIT + np.random.random(1) * (scene_const.MAX_Y_INIT - scene_const.MIN_Y_INIT)
-
-            # If y_pos lies between obstacle, just start closer to the goal point 
-            if y_pos >= scene_const.MIN_OBS_Y_POS and y_pos <= scene_const.MAX_OBS_Y_POS:
-                y_pos = scene_const.MAX_OBS_Y_POS
+            # randomize y_position. If y_pos lies between obstacle, just start closer to the goal point
+            if scenario is None:
+                x_pos, y_pos = sampleStartPos( scene_const )
+            else:
+                x_pos, y_pos = scenario['start_x'][veh_index], scenario['start_y'][veh_index]
 
             # Reset position and heading
             p.resetBasePositionAndOrientation(
@@ -249,11 +243,12 @@ def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir,
 
             # Reset speed
             # FIXME: Need to find conversion between INIT_SPD to y-axis velocity. Currently if INIT_SPD is used, it's way too fast
-            p.resetBaseVelocity(vehicle_handle[veh_index],[0,2,0])
+            # Angular velocity is also reset, so that the episode does not depend on the previous one
+            p.resetBaseVelocity(vehicle_handle[veh_index],[0,2,0],[0,0,0])
 
-        # Reset steering & motor speed. TODO: Perhaps do this with setMotorArray to do it in a single line?
-        for s in steer_handle:
-            p.resetJointState(vehicle_handle[veh_index], s, targetValue=0)
+        # Reset every joint, including the free front wheels, then steering & motor speed
+        for j in range(p.getNumJoints(vehicle_handle[veh_index])):
+            p.resetJointState(vehicle_handle[veh_index], j, targetValue=0, targetVelocity=0)
 
         for m in motor_handle:
             p.resetJointState(
@@ -262,33 +257,20 @@ def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir,
         # Randomize the obstacle
         #   y position of obstable at 0.3*lane_len
         if randomize == True:
-            obs_width = scene_const.obs_w * scene_const.lane_width
-
             # Remove old obstacle
             p.removeBody(case_wall_handle[veh_index][8])
 
-            # Create an available option
-            valid_opt = np.arange(3)[np.nonzero(scene_const.OBS_ENABLE)] 
-
-            # Choose one of the valid option and make it into a scalar
-            temp = np.asscalar( np.random.choice( valid_opt, 1) )
+            # Choose one of the valid option
+            temp = sampleObsSlot( scene_const ) if scenario is None else int(scenario['obs_slot'][veh_index])
 
             # Create new obstacle 
-            if temp == 2:
-                # right
-                direction[veh_index] = 2
-                case_wall_handle[veh_index][8] = createWall([0.5*obs_width, 0.5*obs_width, scene_const.wall_h], [x_index*scene_const.case_x + 0.5*( 1-scene_const.obs_w)*scene_const.lane_width, scene_const.case_y * y_index + scene_const.lane_len*0.3, 0])       # right
+            direction[veh_index] = temp
+            box = getObstacleBox( scene_const, x_index*scene_const.case_x, scene_const.case_y * y_index, lane_width, temp )
+            case_wall_handle[veh_index][8] = createWall([box[2], box[3], scene_const.wall_h], [box[0], box[1], 0])
 
-            if temp == 1:
-                # middle
-                direction[veh_index] = 1
-                case_wall_handle[veh_index][8] = createWall([0.5*obs_width, 0.5*obs_width, scene_const.wall_h], [x_index*scene_const.case_x, scene_const.case_y * y_index + scene_const.lane_len*0.3, 0])       # right
+            if wall_grid is not None:
+                wall_grid.updateBox( veh_index*scene_const.wall_cnt + 8, box )
 
-            if temp == 0:
-                # left
-                direction[veh_index] = 0
-                case_wall_handle[veh_index][8] = createWall([0.5*obs_width, 0.5*obs_width, scene_const.wall_h], [x_index*scene_const.case_x - 0.5*( 1-scene_const.obs_w)*scene_const.lane_width, scene_const.case_y * y_index + scene_const.lane_len*0.3, 0])      # right
-                
 
 
         # Randomize the goal point                
@@ -298,118 +280,17 @@ def initScene_2LC(scene_const, options, veh_index_list, handle_dict, valid_dir,
             goal_z          = 1.0       
 
             # Randomize x_position of goal. Based on curriculum 
-            if valid_dir[veh_index] == 0:
-                x_pos           = random.uniform(-1*scene_const.turn_len*0.5 + 1.0, 0) * (1 - course_eps)
-            elif valid_dir[veh_index] == 1:
-                x_pos           = random.uniform(-1.0, 1.0) * (1 - course_eps)
-            elif valid_dir[veh_index] == 2:
-                x_pos           = random.uniform(0, scene_const.turn_len*0.5 - 1.0) * (1 - course_eps)
+            if scenario is None:
+                x_pos       = sampleGoalX( scene_const, valid_dir[veh_index], course_eps, random )
             else:
-                ic(valid_dir, veh_index)
-                raise ValueError('Invalid direction at valid_dir[veh_index]')
+                x_pos       = scenario['goal_x'][veh_index]
 
 
             # Remove existing goal point
             p.removeBody( dummy_handle[veh_index] )
 
             # Create new goal point
-            dummy_handle[veh_index] = createGoal(0.1, 
-                [
-                    x_pos + x_index * scene_const.case_x, 
-                    y_index * scene_const.case_y + 0.5*scene_const.lane_len + 0.5*scene_const.lane_width, 
-                    goal_z
-                ]
-            )
-
-            goal_pos[veh_index,0] = x_pos + x_index * scene_const.case_x
-            goal_pos[veh_index,1] = y_index * scene_const.case_y + 0.5*scene_const.lane_len + 0.5*scene_const.lane_width
+            goal_pos[veh_index] = getGoalPos( scene_const, x_index * scene_const.case_x, y_index * scene_const.case_y, lane_width, x_pos )
+            dummy_handle[veh_index] = createGoal(0.1, [ goal_pos[veh_index,0], goal_pos[veh_index,1], goal_z ] )
 
     return direction, goal_pos
-
-# Calculate Approximate Rewards for variaous cases
-def printRewards( scene_const, options ):
-    # Some parameters
-    veh_speed = options.INIT_SPD*0.1  # m/s. This is how current test case works
-
-    # Time Steps
-    #dt_code = scene_const.dt * options.FIX_INPUT_STEP
-
-    # Expected Total Time Steps
-    control_freq = 0.1  # 0.1 seconds per step
-    total_step = (scene_const.goal_distance/veh_speed) * (1/control_freq)
-
-    # Reward at the end
-    rew_end = 0
-    for i in range(0, int(total_step)):
-        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
-        if i != total_step-1:
-            rew_end = rew_end -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
-        else:
-            rew_end = rew_end + options.GOAL_REW*(options.GAMMA**i) 
-
-    # Reward at Obs
-    rew_obs = 0
-    for i in range(0, int(total_step*0.5)):
-        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
-        if i != int(total_step*0.5)-1:
-            rew_obs = rew_obs -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
-        else:
-            rew_obs = rew_obs + options.FAIL_REW*(options.GAMMA**i) 
-
-    # Reward at 75%
-    rew_75 = 0
-    for i in range(0, int(total_step*0.75)):
-        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
-        if i != int(total_step*0.75)-1:
-            rew_75 = rew_75 -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
-        else:
-            rew_75 = rew_75 + options.FAIL_REW*(options.GAMMA**i) 
-
-    # Reward at 25%
-    rew_25 = 0
-    for i in range(0, int(total_step*0.25)):
-        goal_distance = scene_const.goal_distance - i*control_freq*veh_speed 
-        if i != int(total_step*0.25)-1:
-            rew_25 = rew_25 -options.DIST_MUL*(goal_distance/scene_const.goal_distance)**2*(options.GAMMA**i) 
-        else:
-            rew_25 = rew_25 + options.FAIL_REW*(options.GAMMA**i) 
-
-    # EPS Info
-    
-
-    ########
-    # Print Info
-    ########
-
-    print("======================================")
-    print("======================================")
-    print("        REWARD ESTIMATION")
-    print("======================================")
-    # print("Control Frequency (s)  : ", options.CTR_FREQ)
-    print("Control Frequency (s)  : ", control_freq)
-    print("Expected Total Step    : ", total_step)
-    print("Expected Reward (25)   : ", rew_25)
-    print("Expected Reward (Obs)  : ", rew_obs)
-    print("Expected Reward (75)   : ", rew_75)
-    print("Expected Reward (Goal) : ", rew_end)
-    print("======================================")
-    print("        EPS ESTIMATION")
-    print("Expected Step per Epi  : ", total_step*0.5)
-    print("Total Steps            : ", total_step*0.5*options.MAX_EPISODE)
-    print("EPS at Last Episode    : ", options.INIT_EPS*options.EPS_DECAY**(total_step*0.5*options.MAX_EPISODE/options.EPS_ANNEAL_STEPS)  )
-    print("======================================")
-    print("======================================")
-
-
-    return
-
-def printSpdInfo(options):
-    desiredSpd = options.INIT_SPD
-
-    wheel_radius = 0.63407*0.5      # Wheel radius in metre
-
-    desiredSpd_rps = desiredSpd*(1000/3600)*(1/wheel_radius)   # km/hr into radians per second
-
-    print("Desired Speed: " + str(desiredSpd) + " km/hr = " + str(desiredSpd_rps) + " radians per seconds = " + str(math.degrees(desiredSpd_rps)) + " degrees per seconds. = " + str(desiredSpd*(1000/3600)) + "m/s" )
-
-    return